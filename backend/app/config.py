@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,9 +9,66 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int
     mongo_uri: str
     mongo_db_name: str
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 60000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 20000
+    mongo_wait_queue_timeout_ms: int = 5000
     allowed_origins: str
-    gemini_api_key: str
-    gemini_model: str
+    gemini_api_key: str = ""
+    gemini_model: str = "gemini-2.5-flash"
+    llm_provider: str = "gemini"
+    llm_local_latency_ms: Optional[float] = None
+    llm_local_jitter: float = 0.3
+    llm_local_error_rate: float = 0.0
+    llm_local_quota_error_rate: float = 0.0
+    llm_local_seed: int = 42
+    llm_recordings_path: str = "recordings/llm.jsonl"
+    llm_replay_speed: float = 1.0
+    llm_replay_fallback_local: bool = False
+    gemini_hedge_after_ms: int = 4000
+    gemini_deadline_seconds: float = 45.0
+    gemini_backoff_base_seconds: float = 1.0
+    metrics_enabled: bool = True
+    model_stats_window: int = 50
+    model_breaker_failure_threshold: int = 3
+    model_breaker_cooldown_seconds: float = 30.0
+    model_breaker_error_rate: float = 0.5
+    assistant_context_token_budget: int = 1500
+    assistant_context_recent_rows: int = 20
+    assistant_context_max_periods: int = 12
+    assistant_context_max_categories: int = 10
+    ai_cache_ttl_seconds: int = 7 * 24 * 3600
+    ai_cache_memory_maxsize: int = 10000
+    ai_cache_memory_ttl_seconds: int = 300
+    prompt_cache_enabled: bool = True
+    prompt_cache_ttl_seconds: int = 7 * 24 * 3600
+    prompt_cache_max_bytes: int = 256 * 1024 * 1024
+    auth_cache_enabled: bool = True
+    auth_token_cache_maxsize: int = 10000
+    auth_user_cache_maxsize: int = 10000
+    auth_user_cache_ttl_seconds: int = 30
+    ai_jobs_enabled: bool = True
+    ai_jobs_workers: int = 2
+    ai_jobs_debounce_seconds: float = 5.0
+    ai_jobs_poll_interval_seconds: float = 1.0
+    ai_jobs_max_attempts: int = 5
+    ai_jobs_backoff_base_seconds: float = 2.0
+    ai_jobs_lease_seconds: int = 300
+    ai_jobs_retention_seconds: int = 24 * 3600
+    ingest_batch_size: int = 1000
+    columnar_batch_size: int = 10000
+    rollup_auto_max_points: int = 120
+    scenario_batch_max: int = 20000
+    montecarlo_paths: int = 5000
+    montecarlo_max_paths: int = 20000
+    montecarlo_max_horizon: int = 120
+    montecarlo_seed: int = 42
+    ingest_max_reported_rows: int = 100
+    warmup_enabled: bool = True
+    warmup_retry_seconds: float = 5.0
 
     class Config:
         env_file = ".env"
@@ -1,13 +1,50 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.routes import auth, profile, financial_data
 from app.routes import ai_assistant
+from app.services.ai_jobs import AIJobWorker
+from app.services.ai_service import refresh_ai_artifact
+from app.services.warmup_service import WarmupState, run_warmup
+from app.utils.db import close_mongo
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El calentamiento (pool de Mongo, índices, modelos, pronóstico sintético)
+    # corre en segundo plano: el proceso atiende /health de inmediato y /ready
+    # responde 503 hasta que termina.
+    warmup = app.state.warmup = WarmupState()
+    warmup_task = None
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(run_warmup(warmup, settings.warmup_retry_seconds))
+    else:
+        warmup.mark_ready()
+
+    worker = None
+    if settings.ai_jobs_enabled:
+        worker = AIJobWorker(refresh_ai_artifact, settings.ai_jobs_workers, settings.ai_jobs_poll_interval_seconds)
+        worker.start()
+    app.state.ai_job_worker = worker
+
+    yield
+
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    if worker is not None:
+        await worker.stop()
+    await close_mongo()
 
 
 app = FastAPI(
     title=settings.app_name,
-    version=settings.app_version
+    version=settings.app_version,
+    lifespan=lifespan,
 )
 
 origins = [o.strip() for o in settings.allowed_origins.split(",") if o]
@@ -18,8 +55,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.metrics_enabled:
+    # Se añade al final para quedar más afuera y medir también CORS.
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(profile.router, tags=["Profile"])
 app.include_router(financial_data.router,prefix="/financial", tags=["Financial"])
 app.include_router(ai_assistant.router)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
@@ -1,13 +1,23 @@
 # app/routes/ai_assistant.py
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional,Union
-from app.services.ai_service import ask_financial_assistant, build_user_context_summary, predict_savings_trend, generate_forecast_explanation, get_or_generate_ai_summary
+from typing import List, Dict, Any, Literal, Optional, Union
+from app.services.ai_service import NarrativeUnavailable, ask_financial_assistant, compute_savings_forecast, get_or_generate_ai_summary, savings_projection, savings_trend, stream_financial_assistant, stream_savings_forecast
+from app.services.context_builder import build_assistant_context
+from app.services.ai_jobs import active_job, get_job, serialize_job
+from app.services.aggregates_service import get_user_aggregates, scenario_baseline, risk_statistics
 from app.services.auth_service import get_current_user
-from app.utils.db import financial_collection, ai_cache_collection
-from datetime import datetime
-from app.services.ai_service import genai
-import numpy as np
+from app.services.trend_engine import prefix_savings_trends
+from app.services.ai_cache import FRESH, ai_cache
+from app.services.prompt_cache import prompt_cache
+from app.services.model_registry import model_registry
+from app.services.columnar import load_financial_columns
+from app.services.scenario_engine import METRIC_FIELDS, scenario_grid, scenario_table, simulate_scenarios
+from app.config import settings
+from app.utils.sse import sse_response
+from datetime import datetime, date
 
 router = APIRouter(prefix="/ai", tags=["AI Assistant"])
 class AIRequest(BaseModel):
@@ -15,50 +25,23 @@ class AIRequest(BaseModel):
     context: Optional[Union[str, Dict[str, Any]]] = None
 
 
-@router.post("/assistant")
-def ai_assistant(req: AIRequest, user=Depends(get_current_user)):
+def _frontend_context(req: AIRequest) -> Dict[str, Any]:
     import json
 
-    user_email = user["email"]
-
-    rows: List[Dict[str, Any]] = list(
-        financial_collection.find({"user_email": user_email}, {"_id": 0})
-    )
-    base_context = build_user_context_summary(rows)
-
-    frontend_context = {}
-    if req.context:
-        try:
-            if isinstance(req.context, str):
-                frontend_context = json.loads(req.context)
-            elif isinstance(req.context, dict):
-                frontend_context = req.context
-        except Exception as e:
-            print(f"[WARN] Error parsing frontend context: {e}")
-            frontend_context = {}
-
-    merged_context = {}
     frontend_context = req.context
     if isinstance(frontend_context, str):
         try:
             frontend_context = json.loads(frontend_context)
-        except json.JSONDecodeError:
+        except json.JSONDecodeError as e:
+            print(f"[WARN] Error parsing frontend context: {e}")
             frontend_context = {}
 
     if not isinstance(frontend_context, dict):
         frontend_context = {}
+    return frontend_context
 
-    try:
-        merged_context = {**base_context, **frontend_context}
-    except Exception as e:
-        print(f"[WARN] Error merging contexts: {e}")
-        merged_context = base_context
-
-    result = ask_financial_assistant(req.message, user_context=merged_context)
 
-    if not result.get("ok"):
-        raise HTTPException(status_code=502, detail=result.get("error", "IA no disponible"))
-    
+def _assistant_payload(result: Dict[str, Any]) -> Dict[str, Any]:
     if result.get("data"):
         return {
             "model": result["model"],
@@ -77,97 +60,181 @@ def ai_assistant(req: AIRequest, user=Depends(get_current_user)):
         }
 
 
+@router.post("/assistant")
+async def ai_assistant(req: AIRequest, user=Depends(get_current_user)):
+    user_email = user["email"]
+
+    context, report = await build_assistant_context(user_email, _frontend_context(req))
+    result = await ask_financial_assistant(req.message, user_context=context, context_report=report)
+
+    if not result.get("ok"):
+        raise HTTPException(status_code=502, detail=result.get("error", "IA no disponible"))
+
+    return _assistant_payload(result)
+
+
+@router.post("/assistant/stream")
+async def ai_assistant_stream(req: AIRequest, user=Depends(get_current_user)):
+    """
+    Igual que /assistant pero como Server-Sent Events: eventos `delta` con el
+    texto según lo genera Gemini y un evento final `result` (mismo cuerpo que
+    /assistant más `ttft_ms` y `total_ms`) o `error`.
+    """
+    context, report = await build_assistant_context(user["email"], _frontend_context(req))
+
+    async def events():
+        async for event, data in stream_financial_assistant(req.message, context, report):
+            if event != "result":
+                yield event, data
+            elif data.get("ok"):
+                yield "result", {**_assistant_payload(data), "ttft_ms": data["ttft_ms"], "total_ms": data["total_ms"]}
+            else:
+                yield "error", {"detail": data.get("error", "IA no disponible")}
+
+    return sse_response(events())
+
+
+def _job_placeholder(user_email: str, cache_type: str):
+    """
+    Para `get_or_compute(pending=...)`: si no hay nada en caché pero un job de
+    `ai_jobs` ya lo está recalculando, responde 202 con el id del job en lugar
+    de llamar a Gemini en línea.
+    """
+    async def pending():
+        job = await active_job(user_email, cache_type)
+        if job is None:
+            return None
+        job_id = str(job["_id"])
+        return JSONResponse(
+            status_code=202,
+            content={"status": job["status"], "job_id": job_id},
+            headers={"Location": f"/ai/jobs/{job_id}"},
+        )
+    return pending
+
+
+async def _forecast_stream(user_email: str, explain: bool):
+    """
+    Con entrada vigente en caché se envía directamente como `result`; si no,
+    la tendencia se calcula aquí (para que un 404 llegue antes de abrir el
+    stream) y la narrativa se transmite según la genera Gemini.
+    """
+    cached, state = await ai_cache.lookup(user_email, "forecast", max_age_hours=None)
+    if state == FRESH:
+        async def from_cache():
+            yield "result", cached
+        return sse_response(from_cache())
+
+    data_version = await ai_cache.data_version(user_email)
+    forecast = await savings_trend(user_email)
+    if forecast is None or not explain:
+        async def without_narrative():
+            yield "result", forecast or {"message": "No hay suficientes datos para el análisis."}
+        return sse_response(without_narrative())
+
+    return sse_response(stream_savings_forecast(user_email, forecast, data_version))
+
+
+async def _forecast_montecarlo(user_email: str, horizon: int, paths: int, seed: int):
+    """
+    La proyección es determinista para (datos, parámetros), así que se guarda
+    en la caché IA por horizonte; la `data_version` y la invalidación por
+    escritura la atan al estado de los datos. Recalcular es barato, así que
+    una entrada invalidada se recalcula en línea en lugar de servirse
+    desactualizada.
+
+    Solo se guardan la semilla y las trayectorias por defecto: con valores
+    libres cada cliente podría crear entradas sin límite y desplazar las
+    reales de la caché. Las demás combinaciones se calculan en línea.
+    """
+    async def compute():
+        return await savings_projection(user_email, horizon, paths, seed)
+
+    if seed != settings.montecarlo_seed or paths != settings.montecarlo_paths:
+        projection, origin = await compute(), "computed"
+    else:
+        projection, origin = await ai_cache.get_or_compute(
+            user_email, f"forecast_montecarlo:{horizon}", compute,
+            max_age_hours=None, allow_stale=False,
+        )
+    if projection is None:
+        return {"message": "No hay suficientes datos para el análisis."}
+    return {**projection, "source": "cache" if origin == "cache" else "computed"}
+
 
 @router.get("/forecast")
-def ai_forecast(
+async def ai_forecast(
     user=Depends(get_current_user),
     explain: bool = Query(True, description="Incluir explicación generativa"),
+    stream: bool = Query(False, description="Transmitir la explicación como Server-Sent Events"),
+    mode: Literal["linear", "montecarlo"] = Query("linear", description="`montecarlo`: proyección con bandas de percentiles"),
+    horizon: int = Query(12, ge=1, le=settings.montecarlo_max_horizon, description="Periodos a proyectar (montecarlo)"),
+    paths: int = Query(settings.montecarlo_paths, ge=100, le=settings.montecarlo_max_paths, description="Trayectorias simuladas (montecarlo)"),
+    seed: int = Query(settings.montecarlo_seed, description="Semilla del generador (montecarlo)"),
 ):
     user_email = user["email"]
+    if mode == "montecarlo":
+        return await _forecast_montecarlo(user_email, horizon, paths, seed)
+    if stream:
+        return await _forecast_stream(user_email, explain)
 
-    cached = ai_cache_collection.find_one(
-        {"user_email": user_email, "type": "forecast"})
-    if cached and "response" in cached:
-        return cached["response"]
-
-    rows = list(financial_collection.find(
-        {"user_email": user_email}, {"_id": 0}).sort("record_date", 1))
-    if not rows:
-        raise HTTPException(
-            status_code=404, detail="No se encontraron registros financieros.")
-
-    forecast = predict_savings_trend(rows)
-    if "message" in forecast:
-        return forecast
-
-    if explain:
-        narrative = generate_forecast_explanation(forecast, rows)
-        forecast.update({
-            "insight": narrative.get("answer"),
-            "highlights": narrative.get("highlights", []),
-            "actions": narrative.get("actions", []),
-            "risk_level": narrative.get("risk_level", "unknown"),
-        })
-
-    ai_cache_collection.update_one(
-        {"user_email": user_email, "type": "forecast"},
-        {
-            "$set": {
-                "response": forecast,
-                "updated_at": datetime.utcnow()
-            }
-        },
-        upsert=True
-    )
+    async def compute():
+        return await compute_savings_forecast(user_email, explain)
 
+    try:
+        forecast, origin = await ai_cache.get_or_compute(
+            user_email, "forecast", compute, max_age_hours=None,
+            pending=_job_placeholder(user_email, "forecast"),
+        )
+    except NarrativeUnavailable as e:
+        # Se responde con el texto base, sin guardarlo en caché.
+        return e.fallback
+    if forecast is None:
+        return {"message": "No hay suficientes datos para el análisis."}
+    if origin == "stale":
+        return {**forecast, "stale": True}
     return forecast
 
 
-@router.post("/scenario")
-def ai_scenario(payload: dict = Body(...), user=Depends(get_current_user)):
-    user_email = user["email"]
-    rows = list(
-        financial_collection.find({"user_email": user_email}, {
-                                  "_id": 0}).sort("record_date", 1)
-    )
+async def _scenario_baseline(user_email: str) -> Dict[str, Any]:
+    baseline = scenario_baseline(await get_user_aggregates(user_email))
 
-    if not rows:
+    if not baseline["total_records"]:
         raise HTTPException(status_code=404, detail="No hay registros")
 
-    valid_rows = [
-        r for r in rows
-        if "income" in r and "expenses" in r and "savings" in r
-    ]
-    if not valid_rows:
+    if not baseline["valid_records"]:
         raise HTTPException(
             status_code=400,
             detail="No hay registros con income, expenses y savings válidos."
         )
+    return baseline
 
-    delta_income = float(payload.get("delta_income", 0))
-    delta_expenses = float(payload.get("delta_expenses", 0))
-    delta_savings = float(payload.get("delta_savings", 0))
 
-    avg_income = sum(r.get("income", 0) for r in valid_rows) / len(valid_rows)
-    avg_expenses = sum(r.get("expenses", 0)
-                       for r in valid_rows) / len(valid_rows)
-    avg_savings = sum(r.get("savings", 0)
-                      for r in valid_rows) / len(valid_rows)
+@router.post("/scenario")
+async def ai_scenario(payload: dict = Body(...), user=Depends(get_current_user)):
+    baseline = await _scenario_baseline(user["email"])
+
+    result = simulate_scenarios(
+        baseline,
+        float(payload.get("delta_income", 0)),
+        float(payload.get("delta_expenses", 0)),
+        float(payload.get("delta_savings", 0)),
+    )
+    metrics = {name: float(result[name]) for name in METRIC_FIELDS}
+
+    avg_income = baseline["avg_income"]
+    avg_expenses = baseline["avg_expenses"]
+    avg_savings = baseline["avg_savings"]
 
-    simulated_income = max(avg_income + delta_income, 0)
-    simulated_expenses = max(avg_expenses + delta_expenses, 0)
-    simulated_savings = max(
-        simulated_income - simulated_expenses + delta_savings, 0)
+    simulated_income = metrics["income"]
+    simulated_expenses = metrics["expenses"]
+    simulated_savings = metrics["savings"]
 
-    change_income = ((simulated_income - avg_income) /
-                     avg_income * 100) if avg_income else 0
-    change_expenses = ((simulated_expenses - avg_expenses) /
-                       avg_expenses * 100) if avg_expenses else 0
-    change_savings = ((simulated_savings - avg_savings) /
-                      avg_savings * 100) if avg_savings else 0
+    change_income = metrics["change_income"]
+    change_expenses = metrics["change_expenses"]
+    change_savings = metrics["change_savings"]
 
-    slope = (simulated_savings - avg_savings) / max(avg_savings, 1)
-    trend = "positiva" if slope >= 0 else "negativa"
+    trend = str(result["trend"])
 
     insight = (
         f"Tu ahorro proyectado cambia a ${simulated_savings:.2f}. "
@@ -177,10 +244,7 @@ def ai_scenario(payload: dict = Body(...), user=Depends(get_current_user)):
         f"y gastos ({change_expenses:+.1f}%)."
     )
 
-    impact_level = (
-        "alto" if abs(slope) > 0.3 else "moderado" if abs(
-            slope) > 0.1 else "bajo"
-    )
+    impact_level = str(result["impact_level"])
 
     actions = (
         [
@@ -215,32 +279,78 @@ def ai_scenario(payload: dict = Body(...), user=Depends(get_current_user)):
             "change_expenses": round(change_expenses, 2),
             "change_savings": round(change_savings, 2),
         },
-        "valid_records": len(valid_rows),
-        "ignored_records": len(rows) - len(valid_rows),
+        "valid_records": baseline["valid_records"],
+        "ignored_records": baseline["total_records"] - baseline["valid_records"],
     }
 
 
+class ScenarioDelta(BaseModel):
+    delta_income: float = 0
+    delta_expenses: float = 0
+    delta_savings: float = 0
+
+
+class ScenarioGrid(BaseModel):
+    delta_income: List[float] = []
+    delta_expenses: List[float] = []
+    delta_savings: List[float] = []
+
+
+class ScenarioBatchRequest(BaseModel):
+    scenarios: List[ScenarioDelta] = []
+    grid: Optional[ScenarioGrid] = None
+
+
+@router.post("/scenario/batch")
+async def ai_scenario_batch(req: ScenarioBatchRequest, user=Depends(get_current_user)):
+    """
+    Evalúa muchos escenarios en una sola llamada: una lista explícita de
+    deltas, una rejilla cartesiana o ambas (la lista va primero). El
+    agregado se lee una vez y todas las métricas se calculan vectorizadas;
+    la respuesta es una tabla `columns` + `rows`.
+    """
+    axes = [req.grid.delta_income, req.grid.delta_expenses, req.grid.delta_savings] if req.grid else None
+    # Se valida el tamaño antes de construir la rejilla.
+    total = len(req.scenarios) + (int(np.prod([max(len(a), 1) for a in axes])) if axes else 0)
+    if not total:
+        raise HTTPException(status_code=400, detail="Indica `scenarios` o `grid`.")
+    if total > settings.scenario_batch_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.scenario_batch_max} escenarios por petición (recibidos {total})."
+        )
+
+    deltas = [[s.delta_income, s.delta_expenses, s.delta_savings] for s in req.scenarios]
+    listed = np.asarray(deltas, dtype=np.float64).reshape(-1, 3)
+    if axes:
+        listed = np.concatenate([listed, np.column_stack(scenario_grid(*axes))])
+
+    baseline = await _scenario_baseline(user["email"])
+    results = simulate_scenarios(baseline, listed[:, 0], listed[:, 1], listed[:, 2])
+    # JSONResponse directo: evita pasar miles de filas por jsonable_encoder.
+    return JSONResponse({
+        "count": len(listed),
+        "baseline": {name: round(baseline[f"avg_{name}"], 2) for name in ("income", "expenses", "savings")},
+        **scenario_table(results),
+    })
+
+
 @router.get("/risk-summary")
-def ai_risk_summary(user=Depends(get_current_user)):
+async def ai_risk_summary(user=Depends(get_current_user)):
     user_email = user["email"]
-    rows = list(financial_collection.find(
-        {"user_email": user_email}, {"_id": 0}).sort("record_date", 1))
+    stats = risk_statistics(await get_user_aggregates(user_email))
 
-    if not rows:
+    if not stats["total_records"]:
         raise HTTPException(status_code=404, detail="No hay registros")
 
-    valid_rows = [
-        r for r in rows if "income" in r and "savings" in r and r["income"] > 0]
-
-    if not valid_rows:
+    if not stats["valid_records"]:
         raise HTTPException(
             status_code=400,
             detail="No hay registros válidos con ingresos y ahorros para calcular el riesgo."
         )
-    
-    avg_save_ratio = sum(r["savings"] / r["income"]
-                         for r in valid_rows) / len(valid_rows)
-    volatility = np.std([r["savings"] for r in valid_rows])
+
+    avg_save_ratio = stats["avg_save_ratio"]
+    volatility = stats["volatility"]
 
     risk_level = (
         "low" if volatility < 100 and avg_save_ratio > 0.2
@@ -252,31 +362,66 @@ def ai_risk_summary(user=Depends(get_current_user)):
         "avg_saving_ratio": round(avg_save_ratio * 100, 2),
         "volatility": round(volatility, 2),
         "risk_level": risk_level,
-        "total_records": len(valid_rows),
-        "ignored_records": len(rows) - len(valid_rows)
+        "total_records": stats["valid_records"],
+        "ignored_records": stats["total_records"] - stats["valid_records"]
     }
 
 
 @router.get("/forecast/history")
-def forecast_history(user=Depends(get_current_user)):
+async def forecast_history(
+    user=Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, description="Devolver solo los últimos N pronósticos"),
+    since: Optional[date] = Query(None, description="Solo pronósticos cuyo último registro es desde esta fecha"),
+):
     user_email = user["email"]
-    docs = list(financial_collection.find(
-        {"user_email": user_email}, {"_id": 0}).sort("record_date", 1))
-    preds = []
-    for i in range(2, len(docs) + 1):
-        subset = docs[:i]
-        preds.append(predict_savings_trend(subset))
+    columns = await load_financial_columns(user_email, ("savings", "record_date"))
+
+    preds = prefix_savings_trends(np.nan_to_num(columns.savings))
+
+    if since:
+        cutoff = np.datetime64(datetime.combine(since, datetime.min.time()), "ms")
+        # NaT >= cutoff es False: los registros sin fecha nunca abren el rango.
+        matches = np.flatnonzero(columns.dates[1:] >= cutoff)
+        start = int(matches[0]) if len(matches) else len(preds)
+        preds = preds[start:]
+    if limit:
+        preds = preds[-limit:]
     return preds
 
 
 @router.get("/summary")
-def ai_summary(user=Depends(get_current_user)):
+async def ai_summary(user=Depends(get_current_user)):
     user_email = user["email"]
-    rows = list(financial_collection.find(
-        {"user_email": user_email}, {"_id": 0}))
     try:
-        result = get_or_generate_ai_summary(user_email, rows)
+        result = await get_or_generate_ai_summary(
+            user_email, pending=_job_placeholder(user_email, "summary"))
         return result
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error al obtener resumen IA: {str(e)}")
+
+
+@router.get("/cache/stats")
+async def ai_cache_stats(request: Request, user=Depends(get_current_user)):
+    worker = getattr(request.app.state, "ai_job_worker", None)
+    return {
+        "ai_cache": ai_cache.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "ai_jobs": worker.stats() if worker else None,
+    }
+
+
+@router.get("/models")
+async def ai_models(user=Depends(get_current_user)):
+    """
+    Latencia móvil, tasa de error y estado del cortocircuito de cada modelo.
+    """
+    return {"models": model_registry.stats(), "routes": {tier: model_registry.route(tier) for tier in ("flash", "pro")}}
+
+
+@router.get("/jobs/{job_id}")
+async def ai_job_status(job_id: str, user=Depends(get_current_user)):
+    job = await get_job(job_id, user["email"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return serialize_job(job)
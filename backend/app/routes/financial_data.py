@@ -1,52 +1,160 @@
 # app/routes/financial_data.py
 
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional
 from app.models.financial import FinancialRecord, FinancialQuery, FinancialRecordOut, FinancialHistoryRequest
 
 from app.services.financial_service import (
     insert_financial_record,
-    get_user_financial_records,
     get_financial_history,
-    delete_financial_record
+    delete_financial_record,
+    iter_financial_documents,
+    history_query,
+    clean_financial_record,
+    clean_history_record,
+    fetch_page,
+    stream_ndjson,
+    projection_for,
+)
+from app.services.ingestion_service import detect_format, ingest_stream
+from app.services.rollups_service import get_rollup_history
+from app.utils.db import get_financial_collection, financial_collection
+
+HISTORY_MAX_PAGE = 1000
+Granularity = Literal["raw", "auto", "day", "week", "month"]
+GRANULARITY_QUERY = Query(
+    "raw", description="raw = registro a registro; day | week | month = totales por periodo; auto = según el rango",
 )
-from app.utils.db import get_financial_collection
 
 router = APIRouter()
 
 @router.post("/upload", response_model=str, status_code=201)
-def upload_financial_record(record: FinancialRecord):
+async def upload_financial_record(record: FinancialRecord):
     try:
-        return insert_financial_record(record)
+        return await insert_financial_record(record)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@router.post("/upload/batch", status_code=200)
+async def upload_financial_records_batch(
+    request: Request,
+    format: Optional[str] = Query(None, description="json | ndjson | csv (por defecto según Content-Type)"),
+    batch_size: Optional[int] = Query(None, ge=1, le=10000, description="Registros por insert_many"),
+):
+    """
+    Carga masiva en streaming: arreglo JSON, NDJSON o CSV con cabecera.
+    Devuelve el conteo de insertados, duplicados y errores por fila.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    try:
+        return await ingest_stream(request.stream(), fmt, batch_size)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en carga masiva: {str(e)}")
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+
+async def _history_response(docs, clean, response: Response, limit, stream, fields):
+    """
+    Tres modos: NDJSON en streaming, página con cursor en `X-Next-Cursor`
+    (cuando se indica `limit`) o la lista completa como antes.
+    """
+    if stream:
+        return StreamingResponse(stream_ndjson(docs, clean, fields), media_type="application/x-ndjson")
+    if limit:
+        items, next_cursor = await fetch_page(docs, limit, clean)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return items
+    return [clean(doc) async for doc in docs]
+
+
+async def _rollup_response(user_email, start_date, end_date, granularity, limit, cursor, stream):
+    """
+    Historial por periodos desde la colección de rollups. Devuelve una lista
+    de periodos (no de registros), por eso no pasa por el `response_model`.
+    """
+    if limit or cursor or stream:
+        raise HTTPException(status_code=400, detail="`granularity` no admite paginación ni streaming")
+    try:
+        points = await get_rollup_history(user_email, start_date, end_date, granularity)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al consultar rollups: {str(e)}")
+    return JSONResponse(jsonable_encoder(points))
+
+
 @router.post("/history", response_model=List[FinancialRecordOut])
-def user_financial_records(query: FinancialQuery):
+async def user_financial_records(
+    query: FinancialQuery,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    stream: bool = Query(False, description="Devolver NDJSON en streaming"),
+    fields: Optional[str] = Query(None, description="Campos separados por coma (solo NDJSON)"),
+    granularity: Granularity = GRANULARITY_QUERY,
+):
+    if granularity != "raw":
+        return await _rollup_response(query.user_email, None, None, granularity, limit, cursor, stream)
+
+    field_list = _parse_fields(fields) if stream else None
     try:
-        return get_user_financial_records(query)
+        docs = iter_financial_documents(
+            financial_collection, {"user_email": query.user_email},
+            cursor=cursor, limit=limit, projection=projection_for(field_list),
+        )
+        return await _history_response(docs, clean_financial_record, response, limit, stream, field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al consultar: {str(e)}")
 
 @router.post("/financial/history", response_model=List[FinancialRecord])
-def financial_history(
+async def financial_history(
     request: FinancialHistoryRequest,
-    collection=Depends(get_financial_collection)
+    response: Response,
+    collection=Depends(get_financial_collection),
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    stream: bool = Query(False, description="Devolver NDJSON en streaming"),
+    fields: Optional[str] = Query(None, description="Campos separados por coma (solo NDJSON)"),
+    granularity: Granularity = GRANULARITY_QUERY,
 ):
-    return get_financial_history(
-        collection=collection,
-        user_email=request.user_email,
-        start_date=request.start_date,
-        end_date=request.end_date
-    )
+    if granularity != "raw":
+        return await _rollup_response(
+            request.user_email, request.start_date, request.end_date, granularity, limit, cursor, stream,
+        )
+
+    if not (limit or cursor or stream):
+        return await get_financial_history(
+            collection=collection,
+            user_email=request.user_email,
+            start_date=request.start_date,
+            end_date=request.end_date
+        )
+
+    field_list = _parse_fields(fields) if stream else None
+    try:
+        docs = iter_financial_documents(
+            collection, history_query(request.user_email, request.start_date, request.end_date),
+            cursor=cursor, limit=limit, projection=projection_for(field_list),
+        )
+        return await _history_response(docs, clean_history_record, response, limit, stream, field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/delete/{record_id}", status_code=200)
 async def delete_financial_record_route(record_id: str):
     """
     Elimina un registro financiero por su ID.
     """
-    deleted = delete_financial_record(record_id)
+    deleted = await delete_financial_record(record_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
     return {"message": "Registro eliminado correctamente"}
\ No newline at end of file
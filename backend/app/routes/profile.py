@@ -6,5 +6,5 @@ from app.models.user import UserOut
 router = APIRouter()
 
 @router.get("/profile", response_model=UserOut, dependencies=[Depends(bearer_scheme)])
-def get_profile(current_user=Depends(get_current_user)):
+async def get_profile(current_user=Depends(get_current_user)):
     return current_user
@@ -0,0 +1,335 @@
+# app/services/aggregates_service.py
+import math
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from app.services.columnar import AMOUNT_FIELDS, FinancialColumns, to_number
+from app.services.stats_pipelines import pipeline_aggregates, risk_stats, scenario_stats, summary_totals
+from app.utils.db import financial_collection, user_aggregates_collection
+
+AGGREGATE_FIELDS = AMOUNT_FIELDS + ("record_date",)
+DRIFT_TOLERANCE = 1e-6
+AGGREGATE_SECTIONS = ("sums", "sumsq", "scenario", "risk")
+# Versión del documento. 2: la dispersión del ahorro se guarda como M2
+# (suma de cuadrados de desviaciones, Welford) en lugar de Σx². Un documento
+# de otra versión se reconstruye en vez de actualizarse.
+AGGREGATES_SCHEMA = 2
+M2_FIELD = "risk.savings_m2"
+
+
+def record_increments(record: Dict[str, Any], sign: int = 1) -> Dict[str, float]:
+    """
+    Contribución de un registro al documento de agregados, en notación de
+    puntos lista para `$inc`. `sign=-1` produce la resta al eliminarlo.
+
+    Replica los filtros de validez de las rutas:
+    - `scenario.*`: registros con income, expenses y savings presentes.
+    - `risk.*`: registros con savings presente e income > 0.
+
+    Un solo registro no aporta M2 propio (`risk.savings_m2` = 0): lo que suma
+    a la dispersión lo calcula `apply_increments` al fusionarlo.
+    """
+    values = {f: to_number(record.get(f)) for f in AMOUNT_FIELDS}
+    inc: Dict[str, float] = {"count": sign}
+
+    for field, value in values.items():
+        v = value or 0.0
+        inc[f"sums.{field}"] = sign * v
+        inc[f"sumsq.{field}"] = sign * v * v
+
+    if all(v is not None for v in values.values()):
+        inc["scenario.count"] = sign
+        for field, value in values.items():
+            inc[f"scenario.{field}"] = sign * value
+
+    income, savings = values["income"], values["savings"]
+    if income is not None and savings is not None and income > 0:
+        inc["risk.count"] = sign
+        inc["risk.ratio_sum"] = sign * savings / income
+        inc["risk.savings"] = sign * savings
+
+    return inc
+
+
+def column_increments(columns: FinancialColumns, sign: int = 1) -> Dict[str, float]:
+    """
+    Versión vectorizada de sumar `record_increments` sobre todos los
+    registros: los filtros de validez son máscaras de campos presentes.
+    `risk.savings_m2` es el M2 del lote (no aditivo: se fusiona con la
+    fórmula de Chan en `apply_increments`).
+    """
+    if not len(columns):
+        return {}
+    values = {field: columns.amount(field) for field in AMOUNT_FIELDS}
+    inc: Dict[str, float] = {"count": sign * len(columns)}
+
+    for field, value in values.items():
+        filled = np.nan_to_num(value)
+        inc[f"sums.{field}"] = sign * float(filled.sum())
+        inc[f"sumsq.{field}"] = sign * float(np.dot(filled, filled))
+
+    scenario = columns.present("income") & columns.present("expenses") & columns.present("savings")
+    if scenario.any():
+        inc["scenario.count"] = sign * int(scenario.sum())
+        for field, value in values.items():
+            inc[f"scenario.{field}"] = sign * float(value[scenario].sum())
+
+    income, savings = values["income"], values["savings"]
+    risk = columns.present("savings") & (np.nan_to_num(income) > 0)
+    if risk.any():
+        inc["risk.count"] = sign * int(risk.sum())
+        inc["risk.ratio_sum"] = sign * float((savings[risk] / income[risk]).sum())
+        inc["risk.savings"] = sign * float(savings[risk].sum())
+        deviations = savings[risk] - savings[risk].mean()
+        inc[M2_FIELD] = sign * float(np.dot(deviations, deviations))
+
+    return inc
+
+
+def merge_increments(records: Iterable[Dict[str, Any]], sign: int = 1) -> Dict[str, float]:
+    """
+    Suma las contribuciones de varios registros en un solo `$inc`.
+    """
+    return column_increments(FinancialColumns.from_records(list(records), AMOUNT_FIELDS), sign)
+
+
+def _merged_m2(inc: Dict[str, float]) -> Optional[Dict[str, Any]]:
+    """
+    Expresión que fusiona (o, con incrementos negativos, deshace) el M2 del
+    ahorro del lote con el guardado (Chan et al.):
+
+        M2 = M2_a + M2_b + δ²·n_a·n_b / n,   δ = media_b − media_a
+
+    Las medias salen de las sumas, así que no hay cancelación de Σx² − n·media²
+    con saldos grandes y poca dispersión. None si el lote no toca `risk`.
+    """
+    n_b = inc.get("risk.count", 0)
+    if not n_b:
+        return None
+    stored = {"n": {"$ifNull": ["$risk.count", 0]}, "s": {"$ifNull": ["$risk.savings", 0]},
+              "m2": {"$ifNull": [f"${M2_FIELD}", 0]}}
+    m2_b = inc.get(M2_FIELD, 0.0)
+    mean_b = inc.get("risk.savings", 0.0) / n_b
+
+    if n_b > 0:
+        # Alta: a = lo guardado, n = n_a + n_b.
+        delta = {"$subtract": [mean_b, {"$divide": ["$$s", "$$n"]}]}
+        cross = {"$divide": [{"$multiply": ["$$n", n_b]}, {"$add": ["$$n", n_b]}]}
+        merged = {"$add": ["$$m2", m2_b, {"$multiply": [delta, delta, cross]}]}
+        return {"$let": {"vars": stored, "in": {"$cond": [{"$lte": ["$$n", 0]}, m2_b, merged]}}}
+
+    # Baja: lo guardado es la unión; a = lo que queda (n_a = n − n_b).
+    n_b, m2_b = -n_b, -m2_b
+    rest = {"$subtract": ["$$n", n_b]}
+    delta = {"$subtract": [mean_b, {"$divide": [{"$add": ["$$s", inc.get("risk.savings", 0.0)]}, rest]}]}
+    cross = {"$divide": [{"$multiply": [rest, n_b]}, "$$n"]}
+    remaining = {"$max": [0.0, {"$subtract": ["$$m2", {"$add": [m2_b, {"$multiply": [delta, delta, cross]}]}]}]}
+    return {"$let": {"vars": stored, "in": {"$cond": [{"$lte": [rest, 0]}, 0.0, remaining]}}}
+
+
+def increments_update(inc: Dict[str, float], dates: List[datetime]) -> List[Dict[str, Any]]:
+    """
+    Update con pipeline equivalente a `$inc` + `$min`/`$max` de fechas, más
+    la fusión del M2 (que necesita los valores guardados antes del cambio;
+    dentro de una misma etapa `$set` todas las expresiones los ven).
+    """
+    fields: Dict[str, Any] = {}
+    m2 = _merged_m2(inc)
+    if m2 is not None:
+        fields[M2_FIELD] = m2
+    fields.update({
+        key: {"$add": [{"$ifNull": [f"${key}", 0]}, value]}
+        for key, value in inc.items() if key != M2_FIELD
+    })
+    fields["data_version"] = {"$add": [{"$ifNull": ["$data_version", 0]}, 1]}
+    fields["updated_at"] = {"$literal": datetime.utcnow()}
+    dates = [d for d in dates if isinstance(d, datetime)]
+    if dates:
+        fields["first_date"] = {"$min": ["$first_date", {"$literal": min(dates)}]}
+        fields["last_date"] = {"$max": ["$last_date", {"$literal": max(dates)}]}
+    return [{"$set": fields}]
+
+
+def _current(user_email: str) -> Dict[str, Any]:
+    return {"user_email": user_email, "schema": AGGREGATES_SCHEMA}
+
+
+async def apply_increments(user_email: str, inc: Dict[str, float], dates: List[datetime]) -> None:
+    """
+    Aplica atómicamente los incrementos (y el rango de fechas) al agregado
+    del usuario e incrementa su `data_version`.
+
+    Sin upsert: si el usuario aún no tiene agregado (p. ej. registros
+    anteriores a esta colección) o es de otra versión, actualizarlo dejaría
+    un documento parcial o incoherente. En ese caso se reconstruye desde los
+    registros crudos, que ya incluyen los recién insertados.
+    """
+    result = await user_aggregates_collection.update_one(_current(user_email), increments_update(inc, dates))
+    if not result.matched_count:
+        await rebuild_user_aggregates(user_email)
+
+
+async def add_record_to_aggregates(record: Dict[str, Any]) -> None:
+    await apply_increments(record["user_email"], record_increments(record, 1), [record.get("record_date")])
+
+
+async def remove_record_from_aggregates(record: Dict[str, Any]) -> None:
+    """
+    Resta el registro del agregado. Los límites de fecha no se pueden
+    decrementar, así que si el registro era el primero o el último se
+    recalculan con una consulta indexada.
+    """
+    user_email = record.get("user_email", "")
+    before = await user_aggregates_collection.find_one_and_update(
+        _current(user_email), increments_update(record_increments(record, -1), []),
+    )
+    if not before:
+        return
+
+    record_date = record.get("record_date")
+    if record_date not in (before.get("first_date"), before.get("last_date")):
+        return
+
+    first = await financial_collection.find_one({"user_email": user_email}, {"record_date": 1}, sort=[("record_date", 1)])
+    last = await financial_collection.find_one({"user_email": user_email}, {"record_date": 1}, sort=[("record_date", -1)])
+    await user_aggregates_collection.update_one(
+        {"user_email": user_email},
+        {"$set": {
+            "first_date": first.get("record_date") if first else None,
+            "last_date": last.get("record_date") if last else None,
+        }},
+    )
+
+
+def aggregates_from_columns(columns: FinancialColumns) -> Dict[str, Any]:
+    """
+    Recalcula desde cero el documento de agregados a partir de las columnas
+    de registros crudos.
+    """
+    aggregates: Dict[str, Any] = {}
+    for key, value in column_increments(columns).items():
+        section, _, field = key.partition(".")
+        if field:
+            aggregates.setdefault(section, {})[field] = value
+        else:
+            aggregates[section] = value
+
+    dates = columns.dates[~np.isnat(columns.dates)]
+    aggregates["first_date"] = dates.min().item() if len(dates) else None
+    aggregates["last_date"] = dates.max().item() if len(dates) else None
+    aggregates.setdefault("count", 0)
+    return aggregates
+
+
+def compute_aggregates(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    return aggregates_from_columns(FinancialColumns.from_records(list(records), AGGREGATE_FIELDS))
+
+
+async def rebuild_user_aggregates(user_email: str) -> Dict[str, Any]:
+    # Se calcula en Mongo: solo viaja el documento resultante, no los registros.
+    aggregates = await pipeline_aggregates(user_email)
+    aggregates["updated_at"] = datetime.utcnow()
+    # $set + $unset en lugar de replace_one para conservar (e incrementar) data_version.
+    missing = {section: "" for section in AGGREGATE_SECTIONS if section not in aggregates}
+    update: Dict[str, Any] = {
+        "$set": {"user_email": user_email, "schema": AGGREGATES_SCHEMA, **aggregates},
+        "$inc": {"data_version": 1},
+    }
+    if missing:
+        update["$unset"] = missing
+    await user_aggregates_collection.update_one({"user_email": user_email}, update, upsert=True)
+    return aggregates
+
+
+async def get_user_aggregates(user_email: str) -> Dict[str, Any]:
+    """
+    Devuelve el agregado del usuario. Si aún no existe (usuarios anteriores a
+    esta colección) o es de una versión anterior, se construye una vez desde
+    los registros crudos.
+    """
+    aggregates = await user_aggregates_collection.find_one({"user_email": user_email}, {"_id": 0})
+    if aggregates is None or aggregates.get("schema") != AGGREGATES_SCHEMA:
+        aggregates = await rebuild_user_aggregates(user_email)
+    return aggregates
+
+
+def find_drift(stored: Dict[str, Any], expected: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    Compara dos documentos de agregados y devuelve {campo: (guardado, esperado)}.
+    """
+    drift: Dict[str, Any] = {}
+    for key in set(stored) | set(expected):
+        if key in ("user_email", "updated_at", "data_version", "schema"):
+            continue
+        a, b = stored.get(key), expected.get(key)
+        path = f"{prefix}{key}"
+        if isinstance(a, dict) or isinstance(b, dict):
+            drift.update(find_drift(a or {}, b or {}, f"{path}."))
+        elif isinstance(a, (int, float)) or isinstance(b, (int, float)):
+            if not math.isclose(a or 0, b or 0, rel_tol=DRIFT_TOLERANCE, abs_tol=DRIFT_TOLERANCE):
+                drift[path] = (a, b)
+        elif a != b:
+            drift[path] = (a, b)
+    return drift
+
+
+async def verify_user_aggregates(user_email: str) -> Dict[str, Any]:
+    stored = await user_aggregates_collection.find_one({"user_email": user_email}, {"_id": 0}) or {}
+    expected = await pipeline_aggregates(user_email)
+    return find_drift(stored, expected)
+
+
+async def verify_user_statistics(user_email: str) -> Dict[str, Any]:
+    """
+    Compara las estadísticas que sirven las rutas (derivadas del agregado
+    guardado) con las mismas calculadas directamente en Mongo con
+    `$avg`/`$stdDevPop`. Devuelve {campo: (derivado, pipeline)}.
+    """
+    stored = await user_aggregates_collection.find_one({"user_email": user_email}, {"_id": 0}) or {}
+    derived = {
+        "scenario": scenario_baseline(stored),
+        "risk": risk_statistics(stored),
+        "totals": context_totals(stored),
+    }
+    expected = {
+        "scenario": await scenario_stats(user_email),
+        "risk": await risk_stats(user_email),
+        "totals": await summary_totals(user_email),
+    }
+    return find_drift(derived, expected)
+
+
+def context_totals(aggregates: Dict[str, Any]) -> Dict[str, float]:
+    sums = aggregates.get("sums", {})
+    return {field: sums.get(field, 0) for field in AMOUNT_FIELDS}
+
+
+def scenario_baseline(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Promedios históricos usados por /ai/scenario.
+    """
+    scenario = aggregates.get("scenario", {})
+    n = scenario.get("count", 0)
+    baseline = {"valid_records": n, "total_records": aggregates.get("count", 0)}
+    for field in AMOUNT_FIELDS:
+        baseline[f"avg_{field}"] = scenario.get(field, 0) / n if n else 0
+    return baseline
+
+
+def risk_statistics(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ratio medio de ahorro y volatilidad (desviación estándar poblacional del
+    ahorro, sqrt(M2 / n)) usados por /ai/risk-summary.
+    """
+    risk = aggregates.get("risk", {})
+    n = risk.get("count", 0)
+    if not n:
+        return {"valid_records": 0, "total_records": aggregates.get("count", 0),
+                "avg_save_ratio": 0, "volatility": 0}
+    variance = max(risk.get("savings_m2", 0) / n, 0.0)
+    return {
+        "valid_records": n,
+        "total_records": aggregates.get("count", 0),
+        "avg_save_ratio": risk.get("ratio_sum", 0) / n,
+        "volatility": math.sqrt(variance),
+    }
@@ -0,0 +1,318 @@
+# app/services/ai_cache.py
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from cachetools import TTLCache
+from app.config import settings
+from app.utils.db import ai_cache_collection, user_aggregates_collection
+from app.utils.metrics import AI_CACHE_LOOKUPS
+
+CacheKey = Tuple[str, str]
+# Rango de record_date del que depende una respuesta; None en un extremo = sin límite.
+Window = Tuple[Optional[datetime], Optional[datetime]]
+FULL_HISTORY: Window = (None, None)
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+class _CountingTTLCache(TTLCache):
+    """
+    TTLCache (LRU + expiración) que cuenta los desalojos por capacidad.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class TwoTierAICache:
+    """
+    Caché de respuestas IA en dos niveles: un LRU en memoria con TTL corto
+    delante de la colección `ai_cache` de Mongo.
+
+    Cada respuesta se guarda con la `data_version` del usuario con la que se
+    calculó y la ventana de fechas de la que depende. Las escrituras marcan
+    como `stale` solo las entradas cuya ventana contiene las fechas tocadas.
+
+    `get_or_compute` aplica stale-while-revalidate: una entrada desactualizada
+    (invalidada o más vieja que `max_age_hours`) se sirve de inmediato y se
+    lanza un único recálculo en segundo plano. Sin entrada, aplica
+    single-flight por (usuario, tipo): solo una petición genera la respuesta
+    y las demás esperan su resultado.
+
+    El TTL en memoria acota cuánto puede tardar otro worker en ver una
+    invalidación, ya que la memoria es local a cada proceso.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._memory = _CountingTTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._background: Dict[CacheKey, asyncio.Task] = {}
+        self._stale_ages = deque(maxlen=1024)
+        self.counters = {
+            "memory_hits": 0, "mongo_hits": 0, "misses": 0, "singleflight_waits": 0,
+            "stale_served": 0, "background_refreshes": 0, "refresh_failures": 0, "version_races": 0,
+        }
+
+    def _memory_get(self, key: CacheKey, cutoff: Optional[datetime]):
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            return None
+        response, updated_at = entry
+        if cutoff and updated_at < cutoff:
+            return None
+        return response
+
+    def _memory_set(self, key: CacheKey, response: Any, updated_at: datetime):
+        with self._lock:
+            self._memory[key] = (response, updated_at)
+
+    async def _mongo_get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        return await ai_cache_collection.find_one(
+            {"user_email": key[0], "type": key[1]},
+            {"_id": 0, "response": 1, "updated_at": 1, "stale": 1},
+        )
+
+    async def _mongo_set(self, key: CacheKey, response: Any, updated_at: datetime, stamp: Dict[str, Any]):
+        await ai_cache_collection.update_one(
+            {"user_email": key[0], "type": key[1]},
+            {"$set": {"response": response, "updated_at": updated_at, "stale": False, **stamp},
+             "$unset": {"stale_since": ""}},
+            upsert=True,
+        )
+
+    async def _mongo_mark_stale(self, key: CacheKey):
+        await ai_cache_collection.update_one(
+            {"user_email": key[0], "type": key[1]},
+            {"$set": {"stale": True, "stale_since": datetime.utcnow()}},
+        )
+
+    async def data_version(self, user_email: str) -> int:
+        doc = await user_aggregates_collection.find_one({"user_email": user_email}, {"_id": 0, "data_version": 1})
+        return (doc or {}).get("data_version", 0)
+
+    async def _lookup(self, user_email: str, cache_type: str, max_age_hours: Optional[int]):
+        key = (user_email, cache_type)
+        cutoff = datetime.utcnow() - timedelta(hours=max_age_hours) if max_age_hours else None
+
+        response = self._memory_get(key, cutoff)
+        if response is not None:
+            self.counters["memory_hits"] += 1
+            AI_CACHE_LOOKUPS.inc(cache_type, "memory_hit")
+            return response, FRESH, None
+
+        doc = await self._mongo_get(key)
+        if not doc or "response" not in doc:
+            self.counters["misses"] += 1
+            AI_CACHE_LOOKUPS.inc(cache_type, "miss")
+            return None, None, None
+
+        updated_at = doc.get("updated_at") or datetime.utcnow()
+        if doc.get("stale") or (cutoff and updated_at < cutoff):
+            AI_CACHE_LOOKUPS.inc(cache_type, "stale")
+            return doc["response"], STALE, updated_at
+
+        self.counters["mongo_hits"] += 1
+        AI_CACHE_LOOKUPS.inc(cache_type, "mongo_hit")
+        self._memory_set(key, doc["response"], updated_at)
+        return doc["response"], FRESH, updated_at
+
+    async def lookup(
+        self, user_email: str, cache_type: str, max_age_hours: Optional[int] = 24
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Devuelve (respuesta, estado) con estado FRESH, STALE o None si no hay entrada.
+        """
+        response, state, _ = await self._lookup(user_email, cache_type, max_age_hours)
+        return response, state
+
+    async def get(self, user_email: str, cache_type: str, max_age_hours: Optional[int] = 24):
+        """
+        Solo respuestas vigentes; None si no hay entrada o está desactualizada.
+        """
+        response, state = await self.lookup(user_email, cache_type, max_age_hours)
+        return response if state == FRESH else None
+
+    async def set(
+        self,
+        user_email: str,
+        cache_type: str,
+        response: Any,
+        data_version: Optional[int] = None,
+        window: Window = FULL_HISTORY,
+    ):
+        """
+        Guarda la respuesta sellada con `data_version` (la leída antes de
+        calcularla). Si la versión avanzó mientras tanto, una escritura pudo
+        invalidar antes de este guardado, así que la entrada queda `stale`.
+        """
+        key = (user_email, cache_type)
+        updated_at = datetime.utcnow()
+        if data_version is None:
+            data_version = await self.data_version(user_email)
+        stamp = {"data_version": data_version, "window": {"start": window[0], "end": window[1]}}
+        await self._mongo_set(key, response, updated_at, stamp)
+
+        if await self.data_version(user_email) != data_version:
+            self.counters["version_races"] += 1
+            await self._mongo_mark_stale(key)
+            return
+        self._memory_set(key, response, updated_at)
+
+    async def _compute_once(
+        self,
+        user_email: str,
+        cache_type: str,
+        compute: Callable[[], Awaitable[Any]],
+        window: Window,
+    ) -> Any:
+        key = (user_email, cache_type)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counters["singleflight_waits"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data_version = await self.data_version(user_email)
+            response = await compute()
+            if response is not None:
+                await self.set(user_email, cache_type, response, data_version, window)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "Future exception was never retrieved" si nadie esperaba.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _refresh(self, user_email, cache_type, compute, window):
+        try:
+            await self._compute_once(user_email, cache_type, compute, window)
+        except Exception as e:
+            self.counters["refresh_failures"] += 1
+            print(f"[CACHE] Falló el recálculo en segundo plano de {cache_type} para {user_email}: {e}")
+        finally:
+            self._background.pop((user_email, cache_type), None)
+
+    def _refresh_in_background(self, user_email, cache_type, compute, window):
+        key = (user_email, cache_type)
+        if key in self._inflight or key in self._background:
+            return
+        self.counters["background_refreshes"] += 1
+        self._background[key] = asyncio.create_task(self._refresh(user_email, cache_type, compute, window))
+
+    async def get_or_compute(
+        self,
+        user_email: str,
+        cache_type: str,
+        compute: Callable[[], Awaitable[Any]],
+        max_age_hours: Optional[int] = 24,
+        allow_stale: bool = True,
+        window: Window = FULL_HISTORY,
+        pending: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Devuelve (respuesta, origen) con origen "cache", "stale", "pending" o
+        "computed". Si `compute` devuelve None el resultado no se guarda.
+
+        - `allow_stale=False` obliga a recalcular una entrada desactualizada
+          (lo usa el worker de `ai_jobs`).
+        - `pending` se consulta cuando no hay ninguna entrada: si devuelve algo
+          distinto de None se responde eso en lugar de calcular en línea.
+        """
+        response, state, updated_at = await self._lookup(user_email, cache_type, max_age_hours)
+        if state == FRESH:
+            return response, "cache"
+
+        if state == STALE and allow_stale:
+            self.counters["stale_served"] += 1
+            self._stale_ages.append((datetime.utcnow() - updated_at).total_seconds())
+            self._refresh_in_background(user_email, cache_type, compute, window)
+            return response, "stale"
+
+        if state is None and pending is not None:
+            placeholder = await pending()
+            if placeholder is not None:
+                return placeholder, "pending"
+
+        return await self._compute_once(user_email, cache_type, compute, window), "computed"
+
+    def invalidate_memory(self, user_email: str):
+        with self._lock:
+            for key in [k for k in self._memory.keys() if k[0] == user_email]:
+                self._memory.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["memory_hits"] + self.counters["mongo_hits"] + self.counters["misses"] \
+            + self.counters["stale_served"]
+        hits = self.counters["memory_hits"] + self.counters["mongo_hits"]
+        ages = list(self._stale_ages)
+        return {
+            **self.counters,
+            "evictions": self._memory.evictions,
+            "memory_size": len(self._memory),
+            "memory_maxsize": self._memory.maxsize,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "stale_ratio": round(self.counters["stale_served"] / lookups, 4) if lookups else 0.0,
+            "stale_age_seconds": {
+                "p50": round(_percentile(ages, 0.5), 1),
+                "p95": round(_percentile(ages, 0.95), 1),
+                "max": round(max(ages), 1) if ages else 0.0,
+            },
+        }
+
+
+ai_cache = TwoTierAICache(
+    maxsize=settings.ai_cache_memory_maxsize,
+    ttl_seconds=settings.ai_cache_memory_ttl_seconds,
+)
+
+
+def window_filter(dates: Iterable[datetime]) -> Dict[str, Any]:
+    """
+    Entradas cuya ventana se cruza con el rango [min(dates), max(dates)].
+    Sin fechas conocidas coincide con todas.
+    """
+    dates = [d for d in dates if isinstance(d, datetime)]
+    if not dates:
+        return {}
+    lo, hi = min(dates), max(dates)
+    return {"$and": [
+        {"$or": [{"window.start": None}, {"window.start": {"$lte": hi}}]},
+        {"$or": [{"window.end": None}, {"window.end": {"$gte": lo}}]},
+    ]}
+
+
+async def invalidate_ai_cache_for_user(user_email: str, dates: Optional[Iterable[datetime]] = None):
+    """
+    Invalida las respuestas IA del usuario que dependen de las fechas
+    modificadas (todas si no se indican). En Mongo se marcan como `stale` en
+    lugar de borrarse: siguen disponibles como último valor bueno mientras
+    se recalculan.
+    """
+    ai_cache.invalidate_memory(user_email)
+    now = datetime.utcnow()
+    query = {"user_email": user_email, "stale": {"$ne": True}, **window_filter(dates or [])}
+    result = await ai_cache_collection.update_many(query, {"$set": {"stale": True, "stale_since": now}})
+    print(f"[CACHE] Invalidada IA para {user_email}: {result.modified_count} documentos marcados.")
@@ -0,0 +1,246 @@
+# app/services/ai_jobs.py
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+from app.utils.db import ai_jobs_collection
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+AI_ARTIFACTS = ("summary", "forecast", "risk_summary")
+
+
+def job_backoff_delay(attempt: int, base: float) -> float:
+    """
+    Espera antes del reintento `attempt` (1, 2, ...): exponencial con jitter.
+    """
+    return base * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+async def enqueue_ai_refresh(user_email: str, artifacts: Iterable[str] = AI_ARTIFACTS) -> Optional[str]:
+    """
+    Encola el recálculo de los artefactos IA del usuario.
+
+    Hay como máximo un job pendiente por usuario (índice único parcial): cada
+    escritura nueva se fusiona en él y aplaza `run_after`, así una ráfaga de
+    cargas produce un solo job cuando termina.
+    """
+    if not settings.ai_jobs_enabled:
+        return None
+
+    now = datetime.utcnow()
+    update = {
+        "$set": {
+            "run_after": now + timedelta(seconds=settings.ai_jobs_debounce_seconds),
+            "updated_at": now,
+        },
+        "$addToSet": {"artifacts": {"$each": list(artifacts)}},
+        "$setOnInsert": {"created_at": now, "attempts": 0},
+    }
+    for _ in range(2):
+        try:
+            job = await ai_jobs_collection.find_one_and_update(
+                {"user_email": user_email, "status": PENDING},
+                update,
+                upsert=True,
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            return str(job["_id"])
+        except DuplicateKeyError:
+            # Otra petición creó el job pendiente al mismo tiempo; el reintento lo actualiza.
+            continue
+    return None
+
+
+async def claim_next_job() -> Optional[Dict[str, Any]]:
+    """
+    Toma el siguiente job listo. Los jobs `running` cuyo lease venció (worker
+    caído) vuelven a ser elegibles.
+    """
+    now = datetime.utcnow()
+    return await ai_jobs_collection.find_one_and_update(
+        {"$or": [
+            {"status": PENDING, "run_after": {"$lte": now}},
+            {"status": RUNNING, "locked_until": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": RUNNING,
+                "started_at": now,
+                "locked_until": now + timedelta(seconds=settings.ai_jobs_lease_seconds),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def complete_job(job: Dict[str, Any]) -> None:
+    now = datetime.utcnow()
+    await ai_jobs_collection.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": DONE, "finished_at": now, "updated_at": now, "last_error": None}},
+    )
+
+
+async def fail_job(job: Dict[str, Any], errors: Dict[str, str]) -> str:
+    """
+    Reprograma los artefactos fallidos con backoff o marca el job como
+    fallido al agotar `ai_jobs_max_attempts`. Devuelve el nuevo estado.
+    """
+    now = datetime.utcnow()
+    failed = list(errors)
+    message = "; ".join(f"{artifact}: {error}" for artifact, error in errors.items())
+    attempts = job.get("attempts", 1)
+
+    if attempts >= settings.ai_jobs_max_attempts:
+        await ai_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": FAILED, "finished_at": now, "updated_at": now, "last_error": message}},
+        )
+        return FAILED
+
+    run_after = now + timedelta(seconds=job_backoff_delay(attempts, settings.ai_jobs_backoff_base_seconds))
+    try:
+        await ai_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {
+                "status": PENDING, "run_after": run_after, "artifacts": failed,
+                "last_error": message, "updated_at": now,
+            }},
+        )
+        return PENDING
+    except DuplicateKeyError:
+        # Llegaron escrituras nuevas y ya hay un job pendiente: se fusiona en él.
+        await ai_jobs_collection.update_one(
+            {"user_email": job["user_email"], "status": PENDING},
+            {"$addToSet": {"artifacts": {"$each": failed}}},
+        )
+        await ai_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": SUPERSEDED, "finished_at": now, "updated_at": now, "last_error": message}},
+        )
+        return SUPERSEDED
+
+
+async def active_job(user_email: str, artifact: str) -> Optional[Dict[str, Any]]:
+    """
+    Job pendiente o en curso que recalculará `artifact` para el usuario.
+    """
+    return await ai_jobs_collection.find_one(
+        {"user_email": user_email, "status": {"$in": list(ACTIVE_STATUSES)}, "artifacts": artifact},
+        sort=[("created_at", -1)],
+    )
+
+
+async def get_job(job_id: str, user_email: str) -> Optional[Dict[str, Any]]:
+    try:
+        oid = ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+    return await ai_jobs_collection.find_one({"_id": oid, "user_email": user_email})
+
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": str(job["_id"]),
+        "status": job.get("status"),
+        "artifacts": job.get("artifacts", []),
+        "attempts": job.get("attempts", 0),
+        "run_after": job.get("run_after"),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at"),
+        "last_error": job.get("last_error"),
+    }
+
+
+class AIJobWorker:
+    """
+    Pool de workers asyncio que consume la cola `ai_jobs` dentro del proceso
+    de la API. Con varios procesos cada uno corre su pool; el reclamo atómico
+    con `find_one_and_update` evita que dos workers tomen el mismo job.
+
+    `handler(user_email, artifact)` recalcula un artefacto y lanza excepción
+    si falla. Un HTTPException 4xx (por ejemplo, usuario sin registros) se
+    considera resuelto y no se reintenta.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, str], Awaitable[None]],
+        concurrency: int,
+        poll_interval: float,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {DONE: 0, PENDING: 0, FAILED: 0, SUPERSEDED: 0}
+
+    def start(self) -> None:
+        for n in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._loop(n)))
+        print(f"[AI-JOBS] {self.concurrency} workers iniciados.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, n: int) -> None:
+        while True:
+            try:
+                job = await claim_next_job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[AI-JOBS] Worker {n}: error tomando job: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.process(job)
+
+    async def process(self, job: Dict[str, Any]) -> Optional[str]:
+        errors: Dict[str, str] = {}
+        for artifact in job.get("artifacts", []):
+            try:
+                await self.handler(job["user_email"], artifact)
+            except asyncio.CancelledError:
+                raise
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    errors[artifact] = str(e.detail)
+            except Exception as e:
+                errors[artifact] = str(e)
+
+        try:
+            outcome = await fail_job(job, errors) if errors else DONE
+            if not errors:
+                await complete_job(job)
+        except Exception as e:
+            print(f"[AI-JOBS] No se pudo cerrar el job {job['_id']}: {e}")
+            return None
+
+        self.counters[outcome] += 1
+        print(f"[AI-JOBS] Job {job['_id']} ({job['user_email']}, intento {job.get('attempts')}): {outcome}")
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._tasks), **self.counters}
@@ -1,26 +1,30 @@
 # app/services/ai_service.py
 import json
 import time
-from datetime import datetime, timedelta
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional
-from app.utils.db import ai_cache_collection  
-from app.config import settings
-from sklearn.linear_model import LinearRegression
 import numpy as np
-
-
-GEMINI_API_KEY = settings.gemini_api_key
-
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY no configurado en .env")
-
-genai.configure(api_key=GEMINI_API_KEY)
-
-DEFAULT_MODELS = [
-    "gemini-2.5-pro",
-    "gemini-2.5-flash",
-]
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.utils.db import ai_cache_collection
+from app.config import settings
+from app.services.llm_client import generate_structured, stream_structured
+from app.services.trend_engine import fit_trend, fit_trend_advanced
+from app.services.projection_engine import monte_carlo_projection
+from app.services.aggregates_service import context_totals, get_user_aggregates
+from app.services.ai_cache import ai_cache
+from app.services.columnar import AMOUNT_FIELDS, FinancialColumns, column_totals, load_financial_columns
+from app.services.context_builder import estimate_tokens, serialize_context
+
+
+# Tier mínimo de calidad por uso; el registro de modelos elige el más
+# rápido de los sanos que lo cumplen.
+ENDPOINT_TIERS = {
+    "assistant": "pro",
+    "summary": "flash",
+    "forecast": "pro",
+    "risk_summary": "pro",
+    "scenario": "pro",
+}
 
 SYSTEM_FINANCE_HINT = (
     "Eres un asesor financiero profesional de FinScope AI. "
@@ -34,35 +38,27 @@ SYSTEM_FINANCE_HINT = (
 )
 
 
-def _strip_code_fences(text: str) -> str:
-    if not text:
-        return text
-    t = text.strip()
-    if t.startswith("```"):
-        t = t.strip("`")
-        lines = t.splitlines()
-        if lines and lines[0].lower().startswith("json"):
-            t = "\n".join(lines[1:])
-    return t.strip()
-
-
-def _safe_json(text: str) -> Optional[Dict[str, Any]]:
-    try:
-        return json.loads(text)
-    except Exception:
-        return None
-
-
-def call_gemini_structured(
+async def call_gemini_structured(
     prompt: str,
     models: Optional[List[str]] = None,
     system: Optional[str] = SYSTEM_FINANCE_HINT,
     max_attempts_per_model: int = 2,
-    sleep_on_quota: float = 1.0,
+    hedge_after_ms: Optional[int] = None,
+    deadline_seconds: Optional[float] = None,
+    tier: str = "pro",
 ) -> Dict[str, Any]:
-    models = models or DEFAULT_MODELS
-    last_error = None
+    return await generate_structured(
+        structured_prompt(prompt, system),
+        models,
+        max_attempts_per_model=max_attempts_per_model,
+        hedge_after_ms=hedge_after_ms,
+        deadline_seconds=deadline_seconds,
+        system=system,
+        tier=tier,
+    )
+
 
+def structured_prompt(prompt: str, system: Optional[str] = SYSTEM_FINANCE_HINT) -> str:
     structured_hint = (
         "Responde en formato JSON válido con las claves:\n"
         '{ "insight": "análisis realista de la situación", '
@@ -75,46 +71,28 @@ def call_gemini_structured(
         "No uses frases como 'excelente', 'fantástico' o 'brillante'; usa términos técnicos."
     )
 
-    full_prompt = f"{system}\n\n{prompt}\n\n{structured_hint}"
+    return f"{system}\n\n{prompt}\n\n{structured_hint}"
 
-    for m in models:
-        try:
-            model = genai.GenerativeModel(m)
-            resp = model.generate_content(full_prompt)
-            text = _strip_code_fences((resp.text or "").strip())
-            js = _safe_json(text)
 
-            if js:
-                return {"ok": True, "model": m, "data": js, "text": None, "error": None}
-
-            if max_attempts_per_model > 1:
-                retry_prompt = full_prompt + "\n\nIMPORTANTE: Devuelve SOLO JSON válido."
-                resp2 = model.generate_content(retry_prompt)
-                text2 = _strip_code_fences((resp2.text or "").strip())
-                js2 = _safe_json(text2)
-                if js2:
-                    return {"ok": True, "model": m, "data": js2, "text": None, "error": None}
-
-            if text:
-                return {"ok": True, "model": m, "data": None, "text": text, "error": None}
-
-            last_error = f"Respuesta vacía del modelo {m}"
+def build_user_context_summary(financial_rows: List[Dict[str, Any]]) -> str:
+    if not financial_rows:
+        return "El usuario no tiene registros financieros cargados."
+    totals = column_totals(FinancialColumns.from_records(financial_rows, AMOUNT_FIELDS))
+    return _format_context_summary(totals["income"], totals["expenses"], totals["savings"])
 
-        except Exception as e:
-            last_error = str(e)
-            if "quota" in last_error.lower() or "rate" in last_error.lower():
-                time.sleep(sleep_on_quota)
-            continue
 
-    return {"ok": False, "model": None, "data": None, "text": None, "error": f"Fallo final: {last_error}"}
+def build_context_summary_from_aggregates(aggregates: Dict[str, Any]) -> str:
+    """
+    Igual que `build_user_context_summary`, pero a partir del documento de
+    agregados del usuario en lugar de recorrer todo su historial.
+    """
+    if not aggregates or not aggregates.get("count"):
+        return "El usuario no tiene registros financieros cargados."
+    totals = context_totals(aggregates)
+    return _format_context_summary(totals["income"], totals["expenses"], totals["savings"])
 
 
-def build_user_context_summary(financial_rows: List[Dict[str, Any]]) -> str:
-    if not financial_rows:
-        return "El usuario no tiene registros financieros cargados."
-    total_income = sum(r.get("income", 0) for r in financial_rows)
-    total_exp = sum(r.get("expenses", 0) for r in financial_rows)
-    total_save = sum(r.get("savings", 0) for r in financial_rows)
+def _format_context_summary(total_income: float, total_exp: float, total_save: float) -> str:
     ahorro_pct = round((total_save / total_income) *
                        100, 2) if total_income > 0 else 0
 
@@ -124,13 +102,12 @@ def build_user_context_summary(financial_rows: List[Dict[str, Any]]) -> str:
         "Usa esta información para generar recomendaciones personalizadas."
     )
 
-def ask_financial_assistant(question: str, user_context: dict):
-    try:
-        prompt = f"""
+def _assistant_prompt(question: str, context_json: str) -> str:
+    return f"""
         Eres un asesor financiero experto. Analiza los siguientes datos del usuario y responde de forma clara y práctica a la pregunta final.
 
         --- DATOS FINANCIEROS ---
-        {json.dumps(user_context, indent=2)}
+        {context_json}
 
         --- PREGUNTA ---
         {question}
@@ -144,46 +121,82 @@ def ask_financial_assistant(question: str, user_context: dict):
         }}
         """
 
-        model = genai.GenerativeModel("gemini-2.5-pro")
-        response = model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
 
-        parsed = json.loads(response.text)
-        return {"model": "gemini-2.5-pro", "data": parsed, "ok": True}
+def _log_assistant_prompt(prompt: str, context_json: str, context_report: Optional[dict], elapsed_ms: float):
+    report = context_report or {}
+    print(
+        f"[AI] Asistente: prompt {len(prompt)} caracteres (~{estimate_tokens(prompt)} tokens), "
+        f"contexto ~{report.get('tokens', estimate_tokens(context_json))}/{report.get('budget', '-')} tokens, "
+        f"recortado {report.get('truncated') or {}}, {elapsed_ms:.0f} ms"
+    )
+
+
+async def ask_financial_assistant(question: str, user_context: dict, context_report: Optional[dict] = None):
+    """
+    `user_context` ya viene recortado por `context_builder`; se serializa en
+    JSON compacto. Se registra el tamaño del prompt y la latencia de cada
+    consulta para seguir el efecto del presupuesto de tokens.
+    """
+    try:
+        context_json = serialize_context(user_context)
+        prompt = _assistant_prompt(question, context_json)
+
+        start = time.perf_counter()
+        res = await generate_structured(prompt, max_attempts_per_model=1, tier=ENDPOINT_TIERS["assistant"])
+        _log_assistant_prompt(prompt, context_json, context_report, (time.perf_counter() - start) * 1000)
+        if not res.get("ok"):
+            return {"ok": False, "error": res.get("error")}
+        return res
 
     except Exception as e:
         print("Error consultando al asistente:", e)
         return {"ok": False, "error": str(e)}
 
-def predict_savings_trend(records: list[dict]) -> dict:
+
+async def stream_financial_assistant(
+    question: str, user_context: dict, context_report: Optional[dict] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Igual que `ask_financial_assistant` pero en streaming: produce
+    ("delta", {"text": ...}) por fragmento y al final ("result", resultado)
+    con las claves de `generate_structured` más `ttft_ms`/`total_ms`.
+    """
+    context_json = serialize_context(user_context)
+    prompt = _assistant_prompt(question, context_json)
+    async for event in stream_structured(prompt, tier=ENDPOINT_TIERS["assistant"]):
+        if event["event"] == "delta":
+            yield "delta", {"text": event["text"]}
+            continue
+        _log_assistant_prompt(prompt, context_json, context_report, event["total_ms"] or 0)
+        yield "result", event
+
+
+def predict_savings_trend(records: list[dict], model: str = "linear") -> dict:
+    """
+    Pronóstico de ahorro del siguiente periodo. Por defecto usa la recta de
+    mínimos cuadrados en forma cerrada; `model="huber"` usa un ajuste robusto
+    de scikit-learn, importado solo cuando se solicita.
+    """
     if not records or len(records) < 2:
         return {"message": "No hay suficientes datos para el análisis."}
 
-    x = np.arange(len(records)).reshape(-1, 1)
-    y = np.array([r.get("savings", 0) for r in records])
-    model = LinearRegression().fit(x, y)
+    savings = [r.get("savings", 0) for r in records]
+    if model == "linear":
+        return fit_trend(savings)
+    return fit_trend_advanced(savings, model)
 
-    next_value = float(model.predict([[len(records) + 1]])[0])
-    trend = "positiva" if model.coef_[0] > 0 else "negativa"
 
+def _forecast_numbers(forecast: dict) -> dict:
     return {
-        "next_savings_estimate": round(next_value, 2),
-        "trend": trend,
-        "slope": round(model.coef_[0], 2),
-    }
-
-
-def generate_forecast_explanation(forecast: dict, financial_rows: list[dict[str, Any]] | None = None) -> dict:
-    ctx = build_user_context_summary(financial_rows or [])
-    num = {
         "next_savings_estimate": forecast.get("next_savings_estimate"),
         "trend": forecast.get("trend"),
         "slope": forecast.get("slope"),
     }
 
-    prompt = f"""
+
+def _forecast_prompt(forecast: dict, ctx: str) -> str:
+    num = _forecast_numbers(forecast)
+    return f"""
 Con base en estos resultados del modelo de regresión lineal:
 {json.dumps(num, ensure_ascii=False)}
 
@@ -197,8 +210,14 @@ Requisitos:
 Devuelve el texto en formato conciso, no académico.
 """
 
-    res = call_gemini_structured(prompt)
+
+def _forecast_narrative(res: Dict[str, Any], forecast: dict) -> dict:
+    """
+    Narrativa a partir del resultado de Gemini (`generate_structured` o el
+    evento final de `stream_structured`), con un texto base si falló.
+    """
     if not res.get("ok"):
+        num = _forecast_numbers(forecast)
         base = f"Tendencia {num['trend']}. Próximo ahorro estimado: {num['next_savings_estimate']}. Pendiente: {num['slope']}."
         return {
             "answer": base,
@@ -224,76 +243,98 @@ Devuelve el texto en formato conciso, no académico.
     }
 
 
-def get_cached_ai_response(user_email: str, cache_type: str, max_age_hours: int = 24):
-    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
-    cached = ai_cache_collection.find_one({
-        "user_email": user_email,
-        "type": cache_type,
-        "updated_at": {"$gte": cutoff}
-    })
-    return cached["response"] if cached else None
-
-
-def save_ai_response_to_cache(user_email: str, cache_type: str, response: dict):
-    ai_cache_collection.update_one(
-        {"user_email": user_email, "type": cache_type},
-        {"$set": {
-            "response": response,
-            "updated_at": datetime.utcnow()
-        }},
-        upsert=True
-    )
-
+async def generate_forecast_explanation(
+    forecast: dict,
+    financial_rows: list[dict[str, Any]] | None = None,
+    context: Optional[str] = None,
+) -> dict:
+    ctx = context if context is not None else build_user_context_summary(financial_rows or [])
+    res = await call_gemini_structured(_forecast_prompt(forecast, ctx), tier=ENDPOINT_TIERS["forecast"])
+    return _forecast_narrative(res, forecast)
 
-def get_or_generate_ai_summary(user_email: str, financial_rows: list[dict[str, any]]):
-    cached = get_cached_ai_response(user_email, "summary")
-    if cached:
-        return {"source": "cache", "summary": cached.get("summary", "Resumen guardado.")}
 
-    context = build_user_context_summary(financial_rows)
+async def _resolve_context(
+    user_email: str,
+    financial_rows: list[dict[str, Any]] | None,
+    context: Optional[str],
+) -> str:
+    """
+    Contexto para el prompt: el explícito, el de las filas recibidas o, por
+    defecto, el del documento de agregados del usuario.
+    """
+    if context is not None:
+        return context
+    if financial_rows is not None:
+        return build_user_context_summary(financial_rows)
+    aggregates = await get_user_aggregates(user_email)
+    return build_context_summary_from_aggregates(aggregates)
+
+
+async def _generate_summary(
+    user_email: str,
+    financial_rows: list[dict[str, any]] | None = None,
+    context: Optional[str] = None,
+) -> Optional[dict]:
+    ctx = await _resolve_context(user_email, financial_rows, context)
     prompt = f"""
 Analiza objetivamente la situación financiera del usuario.
-{context}
+{ctx}
 Usa tono profesional, realista, y resume en máximo 5 frases.
 """
 
-    res = call_gemini_structured(prompt, models=["gemini-2.5-flash"])
+    res = await call_gemini_structured(prompt, tier=ENDPOINT_TIERS["summary"])
     if not res.get("ok"):
-        return {"summary": "No se pudo generar resumen financiero."}
+        return None
 
     summary_text = res["data"].get("insight") if res.get(
         "data") else res.get("text")
-    save_ai_response_to_cache(user_email, "summary", {"summary": summary_text})
+    return {"summary": summary_text}
 
-    return {"source": "gemini", "summary": summary_text}
 
-def generate_ai_forecast(user_email: str, financial_rows: list[dict[str, any]]):
+async def get_or_generate_ai_summary(
+    user_email: str,
+    financial_rows: list[dict[str, any]] | None = None,
+    context: Optional[str] = None,
+    pending=None,
+):
+    async def generate():
+        return await _generate_summary(user_email, financial_rows, context)
+
+    response, origin = await ai_cache.get_or_compute(user_email, "summary", generate, pending=pending)
+    if response is None:
+        return {"summary": "No se pudo generar resumen financiero."}
+    if origin == "pending":
+        return response
+    if origin in ("cache", "stale"):
+        summary = {"source": "cache", "summary": response.get("summary", "Resumen guardado.")}
+        return {**summary, "stale": True} if origin == "stale" else summary
+    return {"source": "gemini", "summary": response["summary"]}
+
+async def generate_ai_forecast(user_email: str, financial_rows: list[dict[str, any]]):
     """
     Genera un pronóstico de ahorro usando regresión lineal + Gemini.
     """
-    cached = get_cached_ai_response(user_email, "forecast")
-    if cached:
-        return {"source": "cache", **cached}
-
-    forecast = predict_savings_trend(financial_rows)
-    explanation = generate_forecast_explanation(forecast, financial_rows)
-
-    data = {
-        "source": "gemini",
-        "forecast": forecast,
-        "explanation": explanation
-    }
+    async def generate():
+        forecast = predict_savings_trend(financial_rows)
+        explanation = await generate_forecast_explanation(forecast, financial_rows)
+        return {
+            "source": "gemini",
+            "forecast": forecast,
+            "explanation": explanation
+        }
 
-    save_ai_response_to_cache(user_email, "forecast", data)
+    data, origin = await ai_cache.get_or_compute(user_email, "forecast", generate)
+    if origin in ("cache", "stale"):
+        return {**data, "source": "cache"}
     return data
 
 
-def generate_forecast_history(user_email: str):
+async def generate_forecast_history(user_email: str):
     """
     Devuelve el historial de pronósticos guardados en caché.
     """
-    docs = list(ai_cache_collection.find(
-        {"user_email": user_email, "type": "forecast"}))
+    docs = await ai_cache_collection.find(
+        {"user_email": user_email, "type": "forecast"}).to_list(None)
     if not docs:
         return {"history": []}
     return {
@@ -308,7 +349,7 @@ def generate_forecast_history(user_email: str):
     }
 
 
-def generate_ai_scenario(user_email: str, params: dict):
+async def generate_ai_scenario(user_email: str, params: dict):
     """
     Simula escenarios modificando ingresos o gastos.
     """
@@ -317,25 +358,165 @@ def generate_ai_scenario(user_email: str, params: dict):
     delta = base_income - base_expenses
     msg = f"Escenario simulado con ingresos {base_income}, gastos {base_expenses}, resultado neto {delta}."
     prompt = f"Evalúa este escenario financiero: {msg}"
-    res = call_gemini_structured(prompt)
+    res = await call_gemini_structured(prompt, tier=ENDPOINT_TIERS["scenario"])
     return res.get("data") or {"insight": msg, "actions": ["Optimizar gastos", "Aumentar ahorro"]}
 
 
-def generate_ai_risk_summary(user_email: str, financial_rows: list[dict[str, any]]):
-    """
-    Detecta riesgos financieros generales.
-    """
-    cached = get_cached_ai_response(user_email, "risk_summary")
-    if cached:
-        return {"source": "cache", **cached}
-
-    context = build_user_context_summary(financial_rows)
+async def _generate_risk_summary(
+    user_email: str,
+    financial_rows: list[dict[str, any]] | None = None,
+    context: Optional[str] = None,
+) -> Optional[dict]:
+    ctx = await _resolve_context(user_email, financial_rows, context)
     prompt = f"""
 Analiza riesgos financieros y patrones de gasto con base en:
-{context}
+{ctx}
 Incluye tres posibles riesgos y tres recomendaciones para mitigarlos.
 """
-    res = call_gemini_structured(prompt)
-    data = res.get("data") or {"insight": "Sin riesgos críticos detectados."}
-    save_ai_response_to_cache(user_email, "risk_summary", data)
-    return {"source": "gemini", **data}
+    res = await call_gemini_structured(prompt, tier=ENDPOINT_TIERS["risk_summary"])
+    if not res.get("ok"):
+        return None
+    return res.get("data") or {"insight": res.get("text")}
+
+
+async def generate_ai_risk_summary(
+    user_email: str,
+    financial_rows: list[dict[str, any]] | None = None,
+    context: Optional[str] = None,
+):
+    """
+    Detecta riesgos financieros generales.
+    """
+    async def generate():
+        return await _generate_risk_summary(user_email, financial_rows, context)
+
+    data, origin = await ai_cache.get_or_compute(user_email, "risk_summary", generate)
+    if data is None:
+        return {"insight": "No se pudo generar el análisis de riesgos."}
+    return {"source": "cache" if origin in ("cache", "stale") else "gemini", **data}
+
+
+async def savings_trend(user_email: str) -> Optional[dict]:
+    """
+    Tendencia de ahorro sobre todo el historial, sin narrativa. None si no hay
+    suficientes datos; 404 si no hay registros.
+    """
+    columns = await load_financial_columns(user_email, ("savings",))
+    if not len(columns):
+        raise HTTPException(
+            status_code=404, detail="No se encontraron registros financieros.")
+
+    if len(columns) < 2:
+        return None
+    # Como en `predict_savings_trend`, un ahorro faltante cuenta como 0.
+    return fit_trend(np.nan_to_num(columns.savings))
+
+
+async def savings_projection(user_email: str, horizon: int, paths: int, seed: int) -> Optional[dict]:
+    """
+    Proyección Monte Carlo de /ai/forecast?mode=montecarlo sobre los
+    registros con ingreso y gasto. None si no hay suficientes datos; 404 si
+    no hay registros.
+    """
+    columns = await load_financial_columns(user_email, ("income", "expenses"))
+    if not len(columns):
+        raise HTTPException(
+            status_code=404, detail="No se encontraron registros financieros.")
+
+    valid = columns.present("income") & columns.present("expenses")
+    # Con muchas trayectorias el cálculo dura cientos de ms: fuera del event loop.
+    projection = await run_in_threadpool(
+        monte_carlo_projection, columns.income[valid], columns.expenses[valid], horizon, paths, seed)
+    if "message" in projection:
+        return None
+    return projection
+
+
+def _with_narrative(forecast: dict, narrative: dict) -> dict:
+    return {
+        **forecast,
+        "insight": narrative.get("answer"),
+        "highlights": narrative.get("highlights", []),
+        "actions": narrative.get("actions", []),
+        "risk_level": narrative.get("risk_level", "unknown"),
+    }
+
+
+class NarrativeUnavailable(RuntimeError):
+    """
+    Gemini no generó la narrativa del pronóstico. `fallback` lleva los
+    números con el texto base: se puede responder, pero no se guarda.
+    """
+
+    def __init__(self, fallback: dict):
+        super().__init__("No se pudo generar la narrativa del pronóstico")
+        self.fallback = fallback
+
+
+async def _aggregates_context(user_email: str) -> str:
+    return build_context_summary_from_aggregates(await get_user_aggregates(user_email))
+
+
+async def compute_savings_forecast(user_email: str, explain: bool = True) -> Optional[dict]:
+    """
+    Pronóstico de ahorro de /ai/forecast: tendencia sobre todo el historial y,
+    si `explain`, la narrativa generada con el contexto de agregados.
+    Devuelve None si no hay suficientes datos; 404 si no hay registros.
+    Si Gemini falla lanza `NarrativeUnavailable`, para que el texto base no
+    quede en caché como si fuera la respuesta.
+    """
+    forecast = await savings_trend(user_email)
+    if forecast is None or not explain:
+        return forecast
+
+    prompt = _forecast_prompt(forecast, await _aggregates_context(user_email))
+    res = await call_gemini_structured(prompt, tier=ENDPOINT_TIERS["forecast"])
+    result = _with_narrative(forecast, _forecast_narrative(res, forecast))
+    if not res.get("ok"):
+        raise NarrativeUnavailable(result)
+    return result
+
+
+async def stream_savings_forecast(user_email: str, forecast: dict, data_version: int) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    /ai/forecast?stream=true: emite primero ("forecast", números), luego
+    ("delta", {"text": ...}) con la narrativa según llega y al final
+    ("result", pronóstico completo). Si Gemini respondió, el resultado se
+    guarda en la caché IA sellado con `data_version` (leída antes de
+    calcular la tendencia).
+    """
+    yield "forecast", forecast
+    prompt = structured_prompt(_forecast_prompt(forecast, await _aggregates_context(user_email)))
+    async for event in stream_structured(prompt, system=SYSTEM_FINANCE_HINT, tier=ENDPOINT_TIERS["forecast"]):
+        if event["event"] == "delta":
+            yield "delta", {"text": event["text"]}
+            continue
+        result = _with_narrative(forecast, _forecast_narrative(event, forecast))
+        if event["ok"]:
+            try:
+                await ai_cache.set(user_email, "forecast", result, data_version)
+            except Exception as e:
+                print(f"[CACHE] No se pudo guardar el pronóstico de {user_email}: {e}")
+        yield "result", {**result, "model": event["model"], "ttft_ms": event["ttft_ms"], "total_ms": event["total_ms"]}
+
+
+async def refresh_ai_artifact(user_email: str, cache_type: str) -> None:
+    """
+    Recalcula y guarda en caché un artefacto IA del usuario (usado por el
+    worker de `ai_jobs`). Las entradas vigentes, cuya ventana no tocó la
+    escritura, se omiten. Si Gemini falla no se guarda nada y se lanza
+    excepción, para que el job se reintente con backoff.
+    """
+    generators = {
+        "summary": lambda: _generate_summary(user_email),
+        "forecast": lambda: compute_savings_forecast(user_email),
+        "risk_summary": lambda: _generate_risk_summary(user_email),
+    }
+    if cache_type not in generators:
+        raise ValueError(f"Artefacto IA desconocido: {cache_type}")
+
+    response, _ = await ai_cache.get_or_compute(
+        user_email, cache_type, generators[cache_type], max_age_hours=None, allow_stale=False)
+    # Un pronóstico None significa datos insuficientes, no un fallo.
+    if response is None and cache_type != "forecast":
+        raise RuntimeError(f"No se pudo generar {cache_type} para {user_email}")
@@ -0,0 +1,170 @@
+# app/services/context_builder.py
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.aggregates_service import context_totals, get_user_aggregates
+from app.utils.db import financial_collection
+
+# Secciones del contexto, de mayor a menor valor. Al exceder el presupuesto se
+# recortan empezando por la última; `totals` nunca se recorta.
+SECTION_ORDER = ("totals", "periods", "categories", "recent", "client")
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_WORD = 1.3
+
+RECENT_PROJECTION = {"_id": 0, "income": 1, "expenses": 1, "savings": 1, "record_date": 1, "category": 1}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Aproximación local del número de tokens (sin llamar al tokenizador de
+    Gemini): el mayor entre ~4 caracteres por token y ~1.3 tokens por palabra.
+    """
+    if not text:
+        return 0
+    return math.ceil(max(len(text) / CHARS_PER_TOKEN, len(text.split()) * TOKENS_PER_WORD))
+
+
+def serialize_context(context: Dict[str, Any]) -> str:
+    return json.dumps(context, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _round(value: Any) -> Any:
+    return round(value, 2) if isinstance(value, float) else value
+
+
+def _take(section: Any, n: int) -> Any:
+    if isinstance(section, dict):
+        return dict(list(section.items())[:n])
+    return section[:n]
+
+
+def fit_to_budget(sections: Dict[str, Any], budget: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Recorta el contexto hasta que su serialización compacta quepa en `budget`
+    tokens. Cada sección (lista o dict) está ordenada de más a menos
+    relevante, así que se conserva el prefijo más largo que quepa; si no cabe
+    ni un elemento la sección se elimina.
+
+    Devuelve (contexto, reporte) con los tokens estimados y lo recortado.
+    """
+    context = {name: sections[name] for name in SECTION_ORDER if sections.get(name)}
+    truncated: Dict[str, int] = {}
+
+    def tokens() -> int:
+        return estimate_tokens(serialize_context(context))
+
+    for name in reversed(SECTION_ORDER[1:]):
+        if tokens() <= budget:
+            break
+        if name not in context:
+            continue
+        full = context[name]
+        lo, hi = 0, len(full)
+        # Mayor prefijo que cabe (búsqueda binaria sobre la cantidad de elementos).
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            context[name] = _take(full, mid)
+            if tokens() <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        truncated[name] = len(full) - lo
+        if lo:
+            context[name] = _take(full, lo)
+        else:
+            del context[name]
+
+    return context, {"tokens": tokens(), "budget": budget, "truncated": truncated}
+
+
+def _totals_section(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    totals = {field: _round(value) for field, value in context_totals(aggregates).items()}
+    income = totals["income"]
+    totals["savings_rate_pct"] = round(totals["savings"] / income * 100, 2) if income > 0 else 0
+    totals["records"] = aggregates.get("count", 0)
+    for key in ("first_date", "last_date"):
+        if isinstance(aggregates.get(key), datetime):
+            totals[key] = aggregates[key].date().isoformat()
+    return totals
+
+
+async def _period_rollups(user_email: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Totales por mes, del más reciente al más antiguo.
+    """
+    cursor = await financial_collection.aggregate([
+        {"$match": {"user_email": user_email, "record_date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": "$record_date"}},
+            "income": {"$sum": "$income"},
+            "expenses": {"$sum": "$expenses"},
+            "savings": {"$sum": "$savings"},
+            "n": {"$sum": 1},
+        }},
+        {"$sort": {"_id": -1}},
+        {"$limit": limit},
+    ])
+    return [
+        {"period": row["_id"], **{k: _round(row[k]) for k in ("income", "expenses", "savings", "n")}}
+        for row in await cursor.to_list(None)
+    ]
+
+
+async def _category_breakdown(user_email: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Totales por categoría, de mayor a menor gasto.
+    """
+    cursor = await financial_collection.aggregate([
+        {"$match": {"user_email": user_email}},
+        {"$group": {
+            "_id": {"$ifNull": ["$category", "general"]},
+            "income": {"$sum": "$income"},
+            "expenses": {"$sum": "$expenses"},
+            "n": {"$sum": 1},
+        }},
+        {"$sort": {"expenses": -1}},
+        {"$limit": limit},
+    ])
+    return [
+        {"category": row["_id"], **{k: _round(row[k]) for k in ("income", "expenses", "n")}}
+        for row in await cursor.to_list(None)
+    ]
+
+
+async def _recent_rows(user_email: str, limit: int) -> List[Dict[str, Any]]:
+    rows = await financial_collection.find({"user_email": user_email}, RECENT_PROJECTION) \
+        .sort("record_date", -1).limit(limit).to_list(None)
+    recent = []
+    for row in rows:
+        rd = row.get("record_date")
+        item = {"date": rd.date().isoformat() if isinstance(rd, datetime) else rd}
+        item.update({k: _round(row.get(k)) for k in ("income", "expenses", "savings")})
+        if row.get("category"):
+            item["category"] = row["category"]
+        recent.append(item)
+    return recent
+
+
+async def build_assistant_context(
+    user_email: str,
+    client_context: Optional[Dict[str, Any]] = None,
+    budget: Optional[int] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Contexto compacto para el asistente: totales del agregado, totales por
+    mes, desglose por categoría, últimos registros y lo que envíe el
+    frontend, ajustado a `assistant_context_token_budget`.
+    """
+    budget = budget or settings.assistant_context_token_budget
+    aggregates = await get_user_aggregates(user_email)
+    sections: Dict[str, Any] = {"totals": _totals_section(aggregates)}
+    if aggregates.get("count"):
+        sections["periods"] = await _period_rollups(user_email, settings.assistant_context_max_periods)
+        sections["categories"] = await _category_breakdown(user_email, settings.assistant_context_max_categories)
+        sections["recent"] = await _recent_rows(user_email, settings.assistant_context_recent_rows)
+    if client_context:
+        sections["client"] = client_context
+    return fit_to_budget(sections, budget)
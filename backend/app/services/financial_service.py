@@ -1,16 +1,25 @@
 # app/services/financial_service.py
+import base64
+import json
 from datetime import datetime, date
 from bson import ObjectId
-from typing import List
+from typing import AsyncIterator, List, Optional
 from fastapi import HTTPException
-from pymongo.collection import Collection
-from app.utils.db import financial_collection, invalidate_ai_cache_for_user
+from fastapi.encoders import jsonable_encoder
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
+from app.utils.db import financial_collection
+from app.services.ai_cache import invalidate_ai_cache_for_user
+from app.services.ai_jobs import enqueue_ai_refresh
 from app.models.financial import FinancialRecord, FinancialQuery
+from app.services.aggregates_service import add_record_to_aggregates, remove_record_from_aggregates
+from app.services.rollups_service import add_record_to_rollups, remove_record_from_rollups
 
 
-def insert_financial_record(record: FinancialRecord):
+def build_record_document(record: FinancialRecord) -> dict:
     """
-    Inserta un nuevo registro financiero y limpia la caché IA asociada al usuario.
+    Valida un registro y lo convierte al documento que se guarda en Mongo
+    (fecha normalizada a datetime en `record_date`).
     """
     if record.savings > record.income:
         raise HTTPException(
@@ -29,59 +38,188 @@ def insert_financial_record(record: FinancialRecord):
         record_dict["record_date"] = datetime.utcnow()
 
     record_dict.pop("date", None)
+    return record_dict
 
-    existing = financial_collection.find_one({
-        "user_email": record.user_email,
-        "record_date": record_dict["record_date"]
-    })
 
-    if existing:
+async def insert_financial_record(record: FinancialRecord):
+    """
+    Inserta un nuevo registro financiero, invalida la caché IA asociada al
+    usuario y encola su recálculo en segundo plano.
+    """
+    record_dict = build_record_document(record)
+
+    try:
+        result = await financial_collection.insert_one(record_dict)
+    except DuplicateKeyError:
         raise HTTPException(
             status_code=409,
             detail=f"Ya existe un registro para el usuario '{record.user_email}' en la fecha {record_dict['record_date'].date()}."
         )
 
-    result = financial_collection.insert_one(record_dict)
+    try:
+        await add_record_to_aggregates(record_dict)
+    except Exception as e:
+        print(f"[WARN] No se pudo actualizar agregados para {record.user_email}: {e}")
+
+    try:
+        await add_record_to_rollups(record_dict)
+    except Exception as e:
+        print(f"[WARN] No se pudo actualizar rollups para {record.user_email}: {e}")
 
     try:
-        invalidate_ai_cache_for_user(record.user_email)
+        await invalidate_ai_cache_for_user(record.user_email, [record_dict["record_date"]])
     except Exception as e:
         print(f"[WARN] No se pudo invalidar caché IA para {record.user_email}: {e}")
 
+    try:
+        await enqueue_ai_refresh(record.user_email)
+    except Exception as e:
+        print(f"[WARN] No se pudo encolar el recálculo IA para {record.user_email}: {e}")
+
     return str(result.inserted_id)
 
 
-def get_user_financial_records(query: FinancialQuery):
-    records = financial_collection.find({"user_email": query.user_email}).sort("record_date", 1)
-    cleaned = []
+HISTORY_PROJECTION = {
+    "user_email": 1, "income": 1, "expenses": 1, "savings": 1,
+    "record_date": 1, "date": 1, "category": 1, "description": 1,
+}
+HISTORY_BATCH_SIZE = 1000
+
+
+def encode_history_cursor(doc: dict) -> str:
+    """
+    Cursor opaco con la posición (record_date, _id) del último documento entregado.
+    """
+    rd = doc.get("record_date")
+    payload = {"d": rd.isoformat() if isinstance(rd, datetime) else None, "i": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> dict:
+    """
+    Traduce un cursor a la condición de keyset sobre (record_date, _id).
+    Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        last_id = ObjectId(payload["i"])
+        last_date = datetime.fromisoformat(payload["d"]) if payload.get("d") else None
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
 
-    for r in records:
-        record_date = r.get("record_date")
-        if not record_date:
-            if isinstance(r.get("date"), str):
-                try:
-                    record_date = datetime.fromisoformat(r["date"])
-                except ValueError:
-                    record_date = datetime.utcnow()
-            else:
+    if last_date is None:
+        # Registros antiguos sin record_date se ordenan primero (null < fecha).
+        return {"$or": [
+            {"record_date": None, "_id": {"$gt": last_id}},
+            {"record_date": {"$type": "date"}},
+        ]}
+    return {"$or": [
+        {"record_date": {"$gt": last_date}},
+        {"record_date": last_date, "_id": {"$gt": last_id}},
+    ]}
+
+
+def iter_financial_documents(
+    collection: AsyncCollection,
+    query: dict,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    projection: Optional[dict] = None,
+) -> AsyncIterator[dict]:
+    """
+    Recorre los documentos en orden (record_date, _id) sin cargarlos todos en
+    memoria. Con `cursor` continúa después de la última posición entregada.
+    """
+    if cursor:
+        query = {"$and": [query, decode_history_cursor(cursor)]}
+    mongo_cursor = collection.find(query, projection or HISTORY_PROJECTION) \
+        .sort([("record_date", 1), ("_id", 1)]) \
+        .batch_size(min(limit or HISTORY_BATCH_SIZE, HISTORY_BATCH_SIZE))
+    if limit:
+        mongo_cursor = mongo_cursor.limit(limit)
+    return mongo_cursor
+
+
+async def fetch_page(docs: AsyncIterator[dict], limit: int, clean) -> tuple[List[dict], Optional[str]]:
+    """
+    Limpia como máximo `limit` documentos y calcula el cursor siguiente
+    (None si la página no se llenó).
+    """
+    items, last = [], None
+    async for doc in docs:
+        items.append(clean(doc))
+        last = doc
+    next_cursor = encode_history_cursor(last) if last is not None and len(items) == limit else None
+    return items, next_cursor
+
+
+def clean_financial_record(r: dict) -> dict:
+    record_date = r.get("record_date")
+    if not record_date:
+        if isinstance(r.get("date"), str):
+            try:
+                record_date = datetime.fromisoformat(r["date"])
+            except ValueError:
                 record_date = datetime.utcnow()
+        else:
+            record_date = datetime.utcnow()
+
+    return {
+        "id": str(r.get("_id", "")),
+        "user_email": r.get("user_email", ""),
+        "income": float(r.get("income", 0)),
+        "expenses": float(r.get("expenses", 0)),
+        "savings": float(r.get("savings", 0)),
+        "record_date": record_date,
+        "category": r.get("category", "general"),
+        "description": r.get("description", "")
+    }
+
+
+async def get_user_financial_records(query: FinancialQuery):
+    records = iter_financial_documents(financial_collection, {"user_email": query.user_email})
+    return [clean_financial_record(r) async for r in records]
 
-        cleaned.append({
-            "id": str(r.get("_id", "")),
-            "user_email": r.get("user_email", ""),
-            "income": float(r.get("income", 0)),
-            "expenses": float(r.get("expenses", 0)),
-            "savings": float(r.get("savings", 0)),
-            "record_date": record_date,
-            "category": r.get("category", "general"),
-            "description": r.get("description", "")
-        })
 
-    return cleaned
+def history_query(
+    user_email: str,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> dict:
+    query = {"user_email": user_email}
+
+    if start_date or end_date:
+        query["record_date"] = {}
+        if start_date:
+            query["record_date"]["$gte"] = datetime.combine(start_date, datetime.min.time())
+        if end_date:
+            query["record_date"]["$lte"] = datetime.combine(end_date, datetime.max.time())
+    return query
+
 
+def clean_history_record(doc: dict) -> dict:
+    record = {
+        "user_email": doc.get("user_email", ""),
+        "income": float(doc.get("income", 0)),
+        "expenses": float(doc.get("expenses", 0)),
+        "savings": float(doc.get("savings", 0)),
+        "category": doc.get("category", "general"),
+        "description": doc.get("description", "")
+    }
 
-def get_financial_history(
-    collection: Collection,
+    rd = doc.get("record_date") or doc.get("date")
+    if isinstance(rd, str):
+        try:
+            rd = datetime.fromisoformat(rd)
+        except ValueError:
+            rd = None
+    record["record_date"] = rd
+    return record
+
+
+async def get_financial_history(
+    collection: AsyncCollection,
     user_email: str,
     start_date: date | None = None,
     end_date: date | None = None
@@ -91,67 +229,66 @@ def get_financial_history(
     Tolera registros incompletos y formatos de fecha variados.
     """
     try:
-        query = {"user_email": user_email}
-
-        if start_date or end_date:
-            query["record_date"] = {}
-            if start_date:
-                query["record_date"]["$gte"] = datetime.combine(start_date, datetime.min.time())
-            if end_date:
-                query["record_date"]["$lte"] = datetime.combine(end_date, datetime.max.time())
-
-        docs = list(collection.find(query).sort("record_date", 1))
-        if not docs:
-            return []
-
-        results = []
-        for doc in docs:
-            if "_id" in doc:
-                doc["id"] = str(doc["_id"])
-                doc.pop("_id", None)
-
-            record = {
-                "user_email": doc.get("user_email", ""),
-                "income": float(doc.get("income", 0)),
-                "expenses": float(doc.get("expenses", 0)),
-                "savings": float(doc.get("savings", 0)),
-                "category": doc.get("category", "general"),
-                "description": doc.get("description", "")
-            }
-
-            rd = doc.get("record_date") or doc.get("date")
-            if isinstance(rd, str):
-                try:
-                    rd = datetime.fromisoformat(rd)
-                except ValueError:
-                    rd = None
-            record["record_date"] = rd
-
-            results.append(record)
-
-        return results
+        docs = iter_financial_documents(collection, history_query(user_email, start_date, end_date))
+        return [clean_history_record(doc) async for doc in docs]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener historial financiero: {str(e)}")
 
 
-def delete_financial_record(record_id: str) -> bool:
+async def stream_ndjson(docs: AsyncIterator[dict], clean, fields: Optional[List[str]] = None) -> AsyncIterator[str]:
+    """
+    Serializa los documentos como NDJSON a medida que llegan del cursor.
+    `fields` limita las claves de cada línea.
+    """
+    async for doc in docs:
+        record = clean(doc)
+        if fields:
+            record = {k: v for k, v in record.items() if k in fields}
+        yield json.dumps(jsonable_encoder(record), ensure_ascii=False) + "\n"
+
+
+def projection_for(fields: Optional[List[str]]) -> dict:
+    """
+    Proyección de Mongo para las claves pedidas; `id` no requiere campo extra.
+    """
+    if not fields:
+        return HISTORY_PROJECTION
+    projection = {f: 1 for f in fields if f in HISTORY_PROJECTION}
+    # record_date siempre se proyecta porque forma parte del cursor.
+    projection.update({"record_date": 1, "date": 1})
+    return projection
+
+
+async def delete_financial_record(record_id: str) -> bool:
     """
     Elimina un documento financiero y limpia la caché IA del usuario afectado.
     Retorna True si fue eliminado, False si no existe.
     """
     try:
-        record = financial_collection.find_one({"_id": ObjectId(record_id)})
+        record = await financial_collection.find_one({"_id": ObjectId(record_id)})
         if not record:
             return False
 
-        result = financial_collection.delete_one({"_id": ObjectId(record_id)})
+        result = await financial_collection.delete_one({"_id": ObjectId(record_id)})
 
         if result.deleted_count > 0:
             try:
-                invalidate_ai_cache_for_user(record.get("user_email", ""))
+                await remove_record_from_aggregates(record)
+            except Exception as e:
+                print(f"[WARN] No se pudo actualizar agregados para {record.get('user_email')}: {e}")
+            try:
+                await remove_record_from_rollups(record)
+            except Exception as e:
+                print(f"[WARN] No se pudo actualizar rollups para {record.get('user_email')}: {e}")
+            try:
+                await invalidate_ai_cache_for_user(record.get("user_email", ""), [record.get("record_date")])
             except Exception as e:
                 print(f"[WARN] No se pudo invalidar cache IA para {record.get('user_email')}: {e}")
+            try:
+                await enqueue_ai_refresh(record.get("user_email", ""))
+            except Exception as e:
+                print(f"[WARN] No se pudo encolar el recálculo IA para {record.get('user_email')}: {e}")
             return True
 
         return False
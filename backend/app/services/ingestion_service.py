@@ -0,0 +1,346 @@
+# app/services/ingestion_service.py
+import codecs
+import csv
+import json
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from app.config import settings
+from app.models.financial import FinancialRecord
+from app.services.aggregates_service import merge_increments, apply_increments
+from app.services.financial_service import build_record_document
+from app.services.rollups_service import add_records_to_rollups
+from app.utils.db import financial_collection
+from app.services.ai_cache import invalidate_ai_cache_for_user
+from app.services.ai_jobs import enqueue_ai_refresh
+
+SUPPORTED_FORMATS = ("json", "ndjson", "csv")
+DUPLICATE_KEY_CODE = 11000
+MAX_PENDING_BYTES = 1024 * 1024
+
+# (número de fila, objeto parseado o None, error de parseo o None)
+ParsedRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+def detect_format(content_type: Optional[str], explicit: Optional[str] = None) -> str:
+    if explicit:
+        fmt = explicit.lower()
+    else:
+        ct = (content_type or "").split(";")[0].strip().lower()
+        fmt = {
+            "application/x-ndjson": "ndjson",
+            "application/ndjson": "ndjson",
+            "application/jsonl": "ndjson",
+            "text/csv": "csv",
+        }.get(ct, "json")
+    if fmt not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=415, detail=f"Formato no soportado: {fmt}")
+    return fmt
+
+
+async def _iter_text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    pending = ""
+    async for text in _iter_text(chunks):
+        pending += text
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(pending) > MAX_PENDING_BYTES:
+            raise HTTPException(status_code=413, detail="Línea demasiado larga en la carga masiva.")
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRow]:
+    row = 0
+    async for line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield row, None, f"JSON inválido: {e.msg}"
+
+
+class _LineFeed:
+    """
+    Fuente de líneas para un único `csv.reader`. Solo se le pide un registro
+    cuando ya tiene todas sus líneas (comillas balanceadas), así el reader
+    nunca se queda sin datos a mitad de un campo con saltos de línea.
+    """
+
+    def __init__(self):
+        self.lines: deque = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def _iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[List[str]], Optional[str]]]:
+    """
+    Registros CSV (RFC 4180) como (valores, error): un campo entre comillas
+    puede contener saltos de línea, así que un registro termina en la primera
+    línea en la que el total de comillas es par. Las líneas en blanco fuera
+    de comillas se omiten.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    quotes = pending_bytes = 0
+    async for line in _iter_lines(chunks):
+        if not feed.lines and not line.strip():
+            continue
+        feed.lines.append(line + "\n")
+        quotes += line.count('"')
+        pending_bytes += len(line)
+        if quotes % 2:
+            if pending_bytes > MAX_PENDING_BYTES:
+                raise HTTPException(status_code=413, detail="Línea demasiado larga en la carga masiva.")
+            continue
+        quotes = pending_bytes = 0
+        yield next(reader), None
+    if feed.lines:
+        yield None, "CSV inválido: comillas sin cerrar al final del archivo"
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRow]:
+    header: Optional[List[str]] = None
+    row = 0
+    async for values, error in _iter_csv_records(chunks):
+        if error:
+            yield row + 1, None, error
+            return
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, None, f"Se esperaban {len(header)} columnas y llegaron {len(values)}"
+            continue
+        yield row, {k: v.strip() for k, v in zip(header, values) if v.strip() != ""}, None
+
+
+async def iter_json_array_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRow]:
+    """
+    Parser incremental de un arreglo JSON: solo mantiene en memoria el objeto
+    que se está leyendo, no el cuerpo completo. Un error estructural se
+    reporta como fila fallida y detiene la lectura.
+    """
+    decoder = json.JSONDecoder()
+    texts = _iter_text(chunks)
+    buffer = ""
+    started = exhausted = False
+    row = 0
+
+    while True:
+        if not exhausted:
+            try:
+                buffer += await texts.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    yield row + 1, None, "El cuerpo JSON debe ser un arreglo de registros."
+                    return
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if exhausted:
+                    yield row + 1, None, f"JSON inválido: {e.msg}"
+                    return
+                break
+            row += 1
+            if isinstance(obj, dict):
+                yield row, obj, None
+            else:
+                yield row, None, "La fila no es un objeto JSON."
+
+        buffer = buffer[pos:]
+        if len(buffer) > MAX_PENDING_BYTES:
+            yield row + 1, None, "Registro demasiado grande en la carga masiva."
+            return
+        if exhausted:
+            yield row + 1, None, "Arreglo JSON incompleto." if started else "El cuerpo JSON debe ser un arreglo de registros."
+            return
+
+
+PARSERS = {
+    "json": iter_json_array_rows,
+    "ndjson": iter_ndjson_rows,
+    "csv": iter_csv_rows,
+}
+
+
+class IngestionReport:
+    """
+    Resumen de la carga. Las listas de filas con problemas se truncan a
+    `max_reported` para que la memoria no crezca con el tamaño de la carga.
+    """
+
+    def __init__(self, max_reported: int):
+        self.max_reported = max_reported
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.duplicate_rows: List[int] = []
+        self.error_rows: List[Dict[str, Any]] = []
+        # Rango de fechas insertadas por usuario, para invalidar solo lo afectado.
+        self.users: Dict[str, Tuple[datetime, datetime]] = {}
+
+    def add_duplicate(self, row: int):
+        self.duplicates += 1
+        if len(self.duplicate_rows) < self.max_reported:
+            self.duplicate_rows.append(row)
+
+    def add_error(self, row: int, detail: str):
+        self.errors += 1
+        if len(self.error_rows) < self.max_reported:
+            self.error_rows.append({"row": row, "detail": detail})
+
+    def add_inserted(self, user_email: str, dates: List[datetime]):
+        self.inserted += len(dates)
+        lo, hi = min(dates), max(dates)
+        if user_email in self.users:
+            prev_lo, prev_hi = self.users[user_email]
+            lo, hi = min(lo, prev_lo), max(hi, prev_hi)
+        self.users[user_email] = (lo, hi)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "duplicate_rows": self.duplicate_rows,
+            "error_rows": self.error_rows,
+            "truncated": self.duplicates > len(self.duplicate_rows) or self.errors > len(self.error_rows),
+            "affected_users": len(self.users),
+        }
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+async def insert_batch(batch: List[Tuple[int, dict]], report: IngestionReport) -> None:
+    """
+    Inserta un lote con `insert_many(ordered=False)` y actualiza los
+    agregados con un único `$inc` por usuario y las rollups con un
+    `bulk_write` por usuario.
+    """
+    if not batch:
+        return
+
+    docs = [doc for _, doc in batch]
+    failed: Set[int] = set()
+    try:
+        await financial_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            idx = err["index"]
+            failed.add(idx)
+            if err.get("code") == DUPLICATE_KEY_CODE:
+                report.add_duplicate(batch[idx][0])
+            else:
+                report.add_error(batch[idx][0], err.get("errmsg", "Error de escritura"))
+
+    inserted_by_user: Dict[str, List[dict]] = defaultdict(list)
+    for idx, doc in enumerate(docs):
+        if idx not in failed:
+            inserted_by_user[doc["user_email"]].append(doc)
+
+    for user_email, user_docs in inserted_by_user.items():
+        report.add_inserted(user_email, [d["record_date"] for d in user_docs])
+        try:
+            await apply_increments(user_email, merge_increments(user_docs), [d["record_date"] for d in user_docs])
+        except Exception as e:
+            print(f"[WARN] No se pudo actualizar agregados para {user_email}: {e}")
+        try:
+            await add_records_to_rollups(user_email, user_docs)
+        except Exception as e:
+            print(f"[WARN] No se pudo actualizar rollups para {user_email}: {e}")
+
+
+async def ingest_stream(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    batch_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Valida e inserta registros por lotes a medida que llegan del cuerpo de la
+    petición. La caché IA de cada usuario afectado se invalida, y su recálculo
+    se encola, una sola vez al final de la carga.
+    """
+    batch_size = batch_size or settings.ingest_batch_size
+    report = IngestionReport(settings.ingest_max_reported_rows)
+    batch: List[Tuple[int, dict]] = []
+
+    async for row, obj, parse_error in PARSERS[fmt](chunks):
+        report.received += 1
+        if parse_error:
+            report.add_error(row, parse_error)
+            continue
+        try:
+            batch.append((row, build_record_document(FinancialRecord(**obj))))
+        except ValidationError as e:
+            report.add_error(row, _validation_message(e))
+            continue
+        except HTTPException as e:
+            report.add_error(row, e.detail)
+            continue
+        except (TypeError, ValueError) as e:
+            report.add_error(row, str(e))
+            continue
+
+        if len(batch) >= batch_size:
+            await insert_batch(batch, report)
+            batch = []
+
+    await insert_batch(batch, report)
+
+    for user_email, dates in report.users.items():
+        try:
+            await invalidate_ai_cache_for_user(user_email, dates)
+        except Exception as e:
+            print(f"[WARN] No se pudo invalidar caché IA para {user_email}: {e}")
+        try:
+            await enqueue_ai_refresh(user_email)
+        except Exception as e:
+            print(f"[WARN] No se pudo encolar el recálculo IA para {user_email}: {e}")
+
+    print(f"[INGEST] {report.inserted}/{report.received} registros insertados ({fmt}).")
+    return report.to_dict()
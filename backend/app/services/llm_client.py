@@ -0,0 +1,366 @@
+# app/services/llm_client.py
+import asyncio
+import json
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.config import settings
+from app.services.model_registry import model_registry
+from app.services.prompt_cache import prompt_cache, prompt_key
+from app.utils.metrics import LLM_FALLBACKS, LLM_JSON_FAILURES, LLM_LATENCY, LLM_RETRIES
+
+
+JSON_ONLY_REMINDER = "\n\nIMPORTANTE: Devuelve SOLO JSON válido."
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+# Error cuando ningún candidato pasó `try_acquire` y no se llegó a llamar a la red.
+NO_MODELS_AVAILABLE = "sin modelos disponibles (circuitos abiertos)"
+
+
+def _strip_code_fences(text: str) -> str:
+    if not text:
+        return text
+    t = text.strip()
+    if t.startswith("```"):
+        t = t.strip("`")
+        lines = t.splitlines()
+        if lines and lines[0].lower().startswith("json"):
+            t = "\n".join(lines[1:])
+    return t.strip()
+
+
+def _safe_json(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(text)
+    except Exception:
+        return None
+
+
+def _is_quota_error(message: str) -> bool:
+    msg = message.lower()
+    return "quota" in msg or "rate" in msg or "429" in msg
+
+
+def _backoff_delay(attempt: int, base: float) -> float:
+    """
+    Backoff exponencial con jitter completo: evita que todos los workers
+    reintenten al mismo tiempo durante una tormenta de cuota.
+    """
+    return random.uniform(0, base * (2 ** attempt))
+
+
+async def _attempt_model(
+    model_name: str,
+    prompt: str,
+    deadline: float,
+    generation_config: Optional[Dict[str, Any]],
+    max_attempts: int,
+    backoff_base: float,
+) -> Dict[str, Any]:
+    """
+    Ejecuta un modelo con reintentos no bloqueantes. Nunca lanza excepciones:
+    devuelve un dict con `data` (JSON válido), `text` (respuesta no JSON) o `error`.
+    Cada llamada alimenta la latencia y el cortocircuito del registro de modelos.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        model = model_registry.get_model(model_name)
+    except Exception as e:
+        # p. ej. Gemini sin API key: cuenta como fallo del modelo, no de la petición.
+        model_registry.record_failure(model_name)
+        return {"model": model_name, "data": None, "text": None, "error": str(e)}
+    last_text = None
+    last_error = None
+
+    for attempt in range(max_attempts):
+        current_prompt = prompt if attempt == 0 else prompt + JSON_ONLY_REMINDER
+        started = loop.time()
+        try:
+            resp = await model.generate_content_async(
+                current_prompt, generation_config=generation_config
+            )
+            elapsed = loop.time() - started
+            model_registry.record_success(model_name, elapsed * 1000)
+            text = _strip_code_fences((resp.text or "").strip())
+            js = _safe_json(text)
+            if js:
+                LLM_LATENCY.observe(elapsed, model_name, "ok")
+                return {"model": model_name, "data": js, "text": None, "error": None}
+            LLM_LATENCY.observe(elapsed, model_name, "invalid_json")
+            if text:
+                LLM_JSON_FAILURES.inc(model_name)
+                last_text = text
+            else:
+                last_error = f"Respuesta vacía del modelo {model_name}"
+            if attempt + 1 < max_attempts:
+                LLM_RETRIES.inc(model_name, "invalid_json")
+        except asyncio.CancelledError:
+            LLM_LATENCY.observe(loop.time() - started, model_name, "cancelled")
+            raise
+        except Exception as e:
+            LLM_LATENCY.observe(loop.time() - started, model_name, "error")
+            model_registry.record_failure(model_name)
+            last_error = str(e)
+            remaining = deadline - loop.time()
+            if not _is_quota_error(last_error) or attempt + 1 >= max_attempts:
+                break
+            delay = min(_backoff_delay(attempt, backoff_base), max(remaining, 0))
+            LLM_RETRIES.inc(model_name, "quota")
+            print(f"[LLM] Cuota en {model_name}, reintento en {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    return {"model": model_name, "data": None, "text": last_text, "error": last_error}
+
+
+_background_tasks = set()
+
+
+async def _store_in_prompt_cache(key: str, result: Dict[str, Any], elapsed: float) -> None:
+    try:
+        await prompt_cache.store(key, result["model"], result["data"], result["text"], elapsed * 1000)
+    except Exception as e:
+        print(f"[PROMPT-CACHE] No se pudo guardar la respuesta: {e}")
+
+
+def _remember(key: str, result: Dict[str, Any], elapsed: float) -> None:
+    """
+    Guarda la respuesta en segundo plano para no sumar la escritura a la latencia.
+    """
+    task = asyncio.create_task(_store_in_prompt_cache(key, result, elapsed))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def generate_structured(
+    prompt: str,
+    models: Optional[List[str]] = None,
+    generation_config: Optional[Dict[str, Any]] = JSON_GENERATION_CONFIG,
+    max_attempts_per_model: int = 2,
+    hedge_after_ms: Optional[int] = None,
+    deadline_seconds: Optional[float] = None,
+    backoff_base: Optional[float] = None,
+    system: Optional[str] = None,
+    use_cache: bool = True,
+    tier: str = "pro",
+) -> Dict[str, Any]:
+    """
+    Llama a Gemini de forma asíncrona con solicitudes cubiertas (hedged requests).
+
+    Se lanza el primer modelo; si no respondió en `hedge_after_ms`, o si falló,
+    se lanza el siguiente de la lista en paralelo. Gana el primer JSON válido y
+    las tareas restantes se cancelan. Todo el proceso respeta `deadline_seconds`.
+    Si ningún modelo devuelve JSON se usa el primer texto libre recibido.
+
+    Sin `models`, el registro elige los candidatos para `tier` (el más rápido
+    de los sanos primero); con una lista explícita solo se omiten los modelos
+    con el cortocircuito abierto.
+
+    Antes de llamar a la red se consulta la caché por contenido
+    (`prompt_cache`) con la clave de cada modelo candidato.
+    """
+    models = model_registry.route(tier) if models is None else model_registry.available(models)
+    # Si todos tienen el cortocircuito abierto se prueban igual, como último recurso.
+    forced = not any(model_registry.is_available(m) for m in models)
+    hedge_after = (hedge_after_ms if hedge_after_ms is not None else settings.gemini_hedge_after_ms) / 1000
+    deadline_seconds = deadline_seconds or settings.gemini_deadline_seconds
+    backoff_base = backoff_base if backoff_base is not None else settings.gemini_backoff_base_seconds
+
+    use_cache = use_cache and settings.prompt_cache_enabled
+    keys = {m: prompt_key(m, system, prompt, generation_config) for m in models}
+    if use_cache:
+        try:
+            hit = await prompt_cache.lookup(list(keys.values()))
+        except Exception as e:
+            print(f"[PROMPT-CACHE] Error consultando caché: {e}")
+            hit = None
+        if hit:
+            return {"ok": True, "model": hit["model"], "data": hit.get("data"), "text": hit.get("text"), "error": None}
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    deadline = started_at + deadline_seconds
+    pending_models = list(models)
+    running: Dict[asyncio.Task, str] = {}
+    text_fallback = None
+    last_error = None
+    launched = 0
+
+    def launch_next():
+        nonlocal launched
+        while pending_models:
+            name = pending_models.pop(0)
+            if not forced and not model_registry.try_acquire(name):
+                # Otra petición ya está usando la prueba de este modelo semiabierto.
+                continue
+            task = asyncio.create_task(_attempt_model(
+                name, prompt, deadline, generation_config,
+                max_attempts_per_model, backoff_base,
+            ))
+            running[task] = name
+            launched += 1
+            return
+
+    launch_next()
+    try:
+        while running:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                last_error = f"Tiempo límite de {deadline_seconds}s agotado"
+                break
+
+            timeout = min(hedge_after, remaining) if pending_models else remaining
+            done, _ = await asyncio.wait(
+                running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                if pending_models:
+                    print(f"[LLM] Sin respuesta tras {hedge_after:.2f}s, lanzando {pending_models[0]}")
+                    LLM_FALLBACKS.inc("hedge")
+                    launch_next()
+                continue
+
+            for task in done:
+                running.pop(task)
+                result = task.result()
+                if result["data"]:
+                    if use_cache:
+                        _remember(keys[result["model"]], result, loop.time() - started_at)
+                    return {"ok": True, "model": result["model"], "data": result["data"], "text": None, "error": None}
+                if result["text"] and text_fallback is None:
+                    text_fallback = result
+                if result["error"]:
+                    last_error = result["error"]
+
+            if not running and pending_models:
+                LLM_FALLBACKS.inc("failover")
+                launch_next()
+    finally:
+        for task in running:
+            task.cancel()
+
+    if text_fallback:
+        LLM_FALLBACKS.inc("text")
+        if use_cache:
+            _remember(keys[text_fallback["model"]], text_fallback, loop.time() - started_at)
+        return {"ok": True, "model": text_fallback["model"], "data": None, "text": text_fallback["text"], "error": None}
+
+    if not launched:
+        last_error = NO_MODELS_AVAILABLE
+    return {"ok": False, "model": None, "data": None, "text": None, "error": f"Fallo final: {last_error}"}
+
+
+def _chunk_text(chunk) -> str:
+    # El SDK lanza ValueError al leer `.text` de un fragmento sin partes (p. ej. el de cierre).
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+async def stream_structured(
+    prompt: str,
+    models: Optional[List[str]] = None,
+    generation_config: Optional[Dict[str, Any]] = JSON_GENERATION_CONFIG,
+    deadline_seconds: Optional[float] = None,
+    system: Optional[str] = None,
+    use_cache: bool = True,
+    tier: str = "pro",
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versión en streaming de `generate_structured`: produce eventos
+    `{"event": "delta", "text": ...}` a medida que llegan los fragmentos y un
+    evento final `{"event": "done", ...}` con las mismas claves que
+    `generate_structured` más `ttft_ms` y `total_ms`.
+
+    Sin hedging: los modelos se prueban en orden y solo se pasa al siguiente
+    si el actual falla antes del primer fragmento; una vez enviado texto, un
+    fallo termina el stream con error. Comparte la caché por contenido con
+    `generate_structured`: un acierto se emite como un único fragmento.
+    """
+    models = model_registry.route(tier) if models is None else model_registry.available(models)
+    forced = not any(model_registry.is_available(m) for m in models)
+    deadline_seconds = deadline_seconds or settings.gemini_deadline_seconds
+
+    use_cache = use_cache and settings.prompt_cache_enabled
+    keys = {m: prompt_key(m, system, prompt, generation_config) for m in models}
+    if use_cache:
+        try:
+            hit = await prompt_cache.lookup(list(keys.values()))
+        except Exception as e:
+            print(f"[PROMPT-CACHE] Error consultando caché: {e}")
+            hit = None
+        if hit:
+            text = hit.get("text") or json.dumps(hit.get("data"), ensure_ascii=False)
+            yield {"event": "delta", "text": text}
+            yield {"event": "done", "ok": True, "model": hit["model"], "data": hit.get("data"),
+                   "text": hit.get("text"), "error": None, "ttft_ms": 0.0, "total_ms": 0.0, "cached": True}
+            return
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    deadline = started_at + deadline_seconds
+    last_error = None
+
+    tried = 0
+    for name in models:
+        if not forced and not model_registry.try_acquire(name):
+            continue
+        if tried:
+            LLM_FALLBACKS.inc("failover")
+        tried += 1
+        attempt_started = loop.time()
+        parts: List[str] = []
+        ttft_ms = None
+        try:
+            model = model_registry.get_model(name)
+            stream = await asyncio.wait_for(
+                model.generate_content_async(prompt, generation_config=generation_config, stream=True),
+                max(deadline - loop.time(), 0),
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                text = _chunk_text(chunk)
+                if not text:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = (loop.time() - started_at) * 1000
+                parts.append(text)
+                yield {"event": "delta", "text": text}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LLM_LATENCY.observe(loop.time() - attempt_started, name, "error")
+            model_registry.record_failure(name)
+            last_error = str(e) or f"Tiempo límite de {deadline_seconds}s agotado"
+            if parts:
+                break
+            continue
+
+        model_registry.record_success(name, (loop.time() - attempt_started) * 1000)
+        text = _strip_code_fences("".join(parts).strip())
+        js = _safe_json(text) if text else None
+        LLM_LATENCY.observe(loop.time() - attempt_started, name, "ok" if js else "invalid_json")
+        if text and not js:
+            LLM_JSON_FAILURES.inc(name)
+            LLM_FALLBACKS.inc("text")
+        if not text:
+            last_error = f"Respuesta vacía del modelo {name}"
+            continue
+
+        total_ms = (loop.time() - started_at) * 1000
+        result = {"model": name, "data": js, "text": None if js else text}
+        if use_cache:
+            _remember(keys[name], result, total_ms / 1000)
+        print(f"[LLM] Streaming {name}: primer fragmento {ttft_ms:.0f} ms, respuesta completa {total_ms:.0f} ms")
+        yield {"event": "done", "ok": True, **result, "error": None,
+               "ttft_ms": round(ttft_ms, 1), "total_ms": round(total_ms, 1), "cached": False}
+        return
+
+    if not tried:
+        last_error = NO_MODELS_AVAILABLE
+    yield {"event": "done", "ok": False, "model": None, "data": None, "text": None,
+           "error": f"Fallo final: {last_error}", "ttft_ms": None,
+           "total_ms": round((loop.time() - started_at) * 1000, 1), "cached": False}
@@ -0,0 +1,351 @@
+# app/services/llm_providers.py
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services.prompt_cache import prompt_key
+
+PROVIDERS = ("gemini", "local", "record", "replay")
+
+
+class TextResponse:
+    """
+    Respuesta (o fragmento de stream) con la forma que lee `llm_client`: `.text`.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ChunkedStream:
+    """
+    Stream de `TextResponse` de `chunk_size` caracteres, uno cada `chunk_delay` segundos.
+    """
+
+    def __init__(self, text: str, chunk_size: int, chunk_delay: float):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.chunk_delay = chunk_delay
+
+    async def __aiter__(self):
+        for n, chunk in enumerate(self.chunks):
+            if n:
+                await asyncio.sleep(self.chunk_delay)
+            yield TextResponse(chunk)
+
+
+class LLMProvider(ABC):
+    """
+    Fuente de objetos de modelo para `ModelRegistry`. Cada objeto expone la
+    interfaz de `genai.GenerativeModel` que usa `llm_client`:
+
+        await model.generate_content_async(prompt, generation_config=..., stream=False)
+
+    que devuelve algo con `.text` o, con `stream=True`, un iterable asíncrono
+    de fragmentos con `.text`.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def create_model(self, model_name: str):
+        ...
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Gemini real. El SDK se importa y configura con la primera creación de
+    modelo, no al importar la app: sin `GEMINI_API_KEY` la app arranca y solo
+    fallan (como error del modelo) las llamadas al LLM.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._genai = None
+
+    def _sdk(self):
+        if self._genai is None:
+            if not self.api_key:
+                raise RuntimeError("GEMINI_API_KEY no configurado en .env")
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def create_model(self, model_name: str):
+        return self._sdk().GenerativeModel(model_name)
+
+
+class LocalProvider(LLMProvider):
+    """
+    Modelo local determinista, sin red, para pruebas de carga y capacidad.
+
+    - Respuesta: JSON válido derivado del hash de (modelo, prompt); el mismo
+      prompt produce siempre la misma respuesta.
+    - Latencia: `latency_ms` por llamada (o la `prior_latency_ms` del
+      catálogo si es None) multiplicada por un factor log-normal de
+      desviación `jitter`, para tener colas realistas.
+    - Errores: con probabilidad `error_rate` la llamada lanza un 503 y con
+      `quota_error_rate` un 429 (que `llm_client` reintenta).
+
+    Latencias y errores salen de un generador con `seed`: la misma secuencia
+    de llamadas reproduce exactamente los mismos tiempos y fallos.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter: float = 0.3,
+        error_rate: float = 0.0,
+        quota_error_rate: float = 0.0,
+        seed: int = 42,
+        chunk_size: int = 24,
+        chunk_delay_ms: float = 20.0,
+        catalog: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay_ms = chunk_delay_ms
+        self.catalog = catalog or {}
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def create_model(self, model_name: str):
+        return LocalModel(model_name, self)
+
+    def latency_for(self, model_name: str) -> float:
+        base = self.latency_ms
+        if base is None:
+            base = self.catalog.get(model_name, {}).get("prior_latency_ms", 1000)
+        factor = self.rng.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        return base * factor / 1000
+
+    def response_for(self, model_name: str, prompt: str) -> Dict[str, Any]:
+        digest = hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+        tag = digest[:8]
+        text = f"Respuesta local {tag}: revisa la relación entre ingresos, gastos y ahorro del periodo."
+        return {
+            "answer": text,
+            "insight": text,
+            "highlights": [f"Indicador {tag[:4]}", f"Indicador {tag[4:]}"],
+            "actions": ["Revisar gastos recurrentes", "Definir una meta de ahorro mensual"],
+            "risk_level": ("low", "medium", "high")[int(digest[8:10], 16) % 3],
+        }
+
+
+class LocalModel:
+    def __init__(self, model_name: str, provider: LocalProvider):
+        self.model_name = model_name
+        self.provider = provider
+
+    async def generate_content_async(self, prompt, generation_config=None, stream: bool = False):
+        provider = self.provider
+        provider.calls += 1
+        latency = provider.latency_for(self.model_name)
+        roll = provider.rng.random()
+        await asyncio.sleep(latency)
+
+        if roll < provider.error_rate:
+            raise RuntimeError(f"503 {self.model_name} no disponible (local)")
+        if roll < provider.error_rate + provider.quota_error_rate:
+            raise RuntimeError(f"429 quota excedida en {self.model_name} (local)")
+
+        text = json.dumps(provider.response_for(self.model_name, prompt), ensure_ascii=False)
+        if stream:
+            return ChunkedStream(text, provider.chunk_size, provider.chunk_delay_ms / 1000)
+        return TextResponse(text)
+
+
+def recording_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]]) -> str:
+    # Misma clave que la caché de prompts; el system ya va dentro del prompt.
+    return prompt_key(model_name, None, prompt, generation_config)
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Envuelve otro proveedor (normalmente Gemini) y agrega cada respuesta a
+    `path` como una línea JSON {key, model, latency_ms, text}. Las llamadas
+    que fallan no se graban.
+
+    La escritura va al threadpool para no bloquear el event loop, y un lock
+    la serializa: las llamadas en paralelo del hedging no intercalan líneas.
+    """
+
+    name = "record"
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.path = path
+        # Lock de hilo y no de asyncio: la escritura ocurre en el threadpool.
+        self._lock = threading.Lock()
+
+    def create_model(self, model_name: str):
+        return RecordingModel(model_name, self.inner.create_model(model_name), self)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    async def write(self, model_name: str, prompt: str, generation_config, text: str, latency_ms: float) -> None:
+        entry = {
+            "key": recording_key(model_name, prompt, generation_config),
+            "model": model_name,
+            "latency_ms": round(latency_ms, 1),
+            "text": text,
+        }
+        await run_in_threadpool(self._append, entry)
+
+
+class RecordingModel:
+    def __init__(self, model_name: str, model, provider: RecordingProvider):
+        self.model_name = model_name
+        self.model = model
+        self.provider = provider
+
+    async def generate_content_async(self, prompt, generation_config=None, stream: bool = False):
+        started = time.perf_counter()
+        response = await self.model.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+        if not stream:
+            await self.provider.write(self.model_name, prompt, generation_config, response.text or "",
+                                (time.perf_counter() - started) * 1000)
+            return response
+        return self._record_stream(response, prompt, generation_config, started)
+
+    async def _record_stream(self, stream, prompt, generation_config, started):
+        parts: List[str] = []
+        async for chunk in stream:
+            try:
+                parts.append(chunk.text or "")
+            except ValueError:
+                pass
+            yield chunk
+        await self.provider.write(self.model_name, prompt, generation_config, "".join(parts),
+                            (time.perf_counter() - started) * 1000)
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Reproduce las respuestas grabadas por `RecordingProvider`, esperando la
+    latencia grabada multiplicada por `speed` (0 = sin espera). Si un prompt
+    se grabó varias veces se alternan las grabaciones. Un prompt sin grabar
+    se delega en `fallback` o, sin él, falla como un error del modelo.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0, fallback: Optional[LLMProvider] = None):
+        self.path = path
+        self.speed = speed
+        self.fallback = fallback
+        self.recordings: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recordings[entry["key"]].append(entry)
+        print(f"[LLM] Replay: {sum(map(len, self.recordings.values()))} respuestas cargadas de {path}")
+
+    def create_model(self, model_name: str):
+        fallback = self.fallback.create_model(model_name) if self.fallback else None
+        return ReplayModel(model_name, self, fallback)
+
+    def take(self, key: str) -> Optional[Dict[str, Any]]:
+        entries = self.recordings.get(key)
+        if not entries:
+            return None
+        entry = entries[self._next[key] % len(entries)]
+        self._next[key] += 1
+        return entry
+
+
+class ReplayModel:
+    def __init__(self, model_name: str, provider: ReplayProvider, fallback=None):
+        self.model_name = model_name
+        self.provider = provider
+        self.fallback = fallback
+
+    async def generate_content_async(self, prompt, generation_config=None, stream: bool = False):
+        provider = self.provider
+        entry = provider.take(recording_key(self.model_name, prompt, generation_config))
+        if entry is None:
+            provider.misses += 1
+            if self.fallback is not None:
+                return await self.fallback.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+            raise RuntimeError(f"Sin grabación para este prompt en {self.model_name}")
+
+        provider.hits += 1
+        await asyncio.sleep(entry["latency_ms"] * provider.speed / 1000)
+        if stream:
+            return ChunkedStream(entry["text"], len(entry["text"]) or 1, 0)
+        return TextResponse(entry["text"])
+
+
+def build_provider(name: Optional[str] = None) -> LLMProvider:
+    """
+    Proveedor según `llm_provider`: gemini | local | record | replay.
+    """
+    from app.services.model_registry import MODEL_CATALOG
+
+    name = name or settings.llm_provider
+    if name == "gemini":
+        if not settings.gemini_api_key:
+            print("[LLM] GEMINI_API_KEY no configurado: las llamadas a Gemini fallarán.")
+        return GeminiProvider(settings.gemini_api_key)
+    if name == "local":
+        return LocalProvider(
+            latency_ms=settings.llm_local_latency_ms,
+            jitter=settings.llm_local_jitter,
+            error_rate=settings.llm_local_error_rate,
+            quota_error_rate=settings.llm_local_quota_error_rate,
+            seed=settings.llm_local_seed,
+            catalog=MODEL_CATALOG,
+        )
+    if name == "record":
+        return RecordingProvider(GeminiProvider(settings.gemini_api_key), settings.llm_recordings_path)
+    if name == "replay":
+        fallback = build_provider("local") if settings.llm_replay_fallback_local else None
+        return ReplayProvider(settings.llm_recordings_path, settings.llm_replay_speed, fallback)
+    raise ValueError(f"Proveedor LLM desconocido: {name} (opciones: {', '.join(PROVIDERS)})")
+
+
+_provider: Optional[LLMProvider] = None
+
+
+def get_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        _provider = build_provider()
+        print(f"[LLM] Proveedor: {_provider.name}")
+    return _provider
+
+
+def set_provider(provider: Optional[LLMProvider]) -> None:
+    """
+    Reemplaza el proveedor (None vuelve a leerlo de la configuración). Los
+    modelos ya creados por `ModelRegistry` se conservan hasta `reset()`.
+    """
+    global _provider
+    _provider = provider
@@ -0,0 +1,254 @@
+# app/services/model_registry.py
+import statistics
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from app.config import settings
+from app.services.llm_providers import get_provider
+
+TIER_RANK = {"flash": 1, "pro": 2}
+
+# Catálogo: tier de calidad y latencia esperada (ms) antes de tener mediciones.
+MODEL_CATALOG: Dict[str, Dict[str, Any]] = {
+    "gemini-2.5-pro": {"tier": "pro", "prior_latency_ms": 8000},
+    "gemini-2.5-flash": {"tier": "flash", "prior_latency_ms": 3000},
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito por modelo. Se abre con `failure_threshold` fallos
+    consecutivos o si la tasa de error de la ventana supera
+    `error_rate_threshold`; tras `cooldown_seconds` pasa a semiabierto y deja
+    pasar una sola petición de prueba que decide si vuelve a cerrarse.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self.trips = 0
+
+    def is_available(self) -> bool:
+        """
+        Si `try_acquire` dejaría pasar una petición ahora. No cambia el
+        estado: sirve para ordenar candidatos y para las estadísticas.
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self.clock() - self.opened_at >= self.cooldown_seconds
+        return self.clock() - self.probe_started_at >= self.cooldown_seconds
+
+    def try_acquire(self) -> bool:
+        """
+        Reserva el paso justo antes de llamar al modelo. En semiabierto
+        consume la única prueba, así que solo debe llamarse si la petición
+        se va a enviar de verdad.
+        """
+        now = self.clock()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now - self.opened_at < self.cooldown_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.probe_started_at = now
+            return True
+        # Semiabierto: una prueba a la vez; si la prueba se perdió (la tarea se
+        # canceló antes de responder), se permite otra tras el cooldown.
+        if now - self.probe_started_at >= self.cooldown_seconds:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self, error_rate_exceeded: bool = False):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold or error_rate_exceeded:
+            self.trip()
+
+    def trip(self):
+        if self.state != OPEN:
+            self.trips += 1
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.probe_started_at = None
+
+
+class ModelStats:
+    """
+    Ventana móvil de las últimas `window` llamadas: latencias de las exitosas
+    y resultado (éxito/fallo) de todas.
+    """
+
+    def __init__(self, window: int):
+        self.latencies_ms = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, ok: bool, latency_ms: Optional[float] = None):
+        self.calls += 1
+        self.failures += not ok
+        self.outcomes.append(ok)
+        if ok and latency_ms is not None:
+            self.latencies_ms.append(latency_ms)
+
+    @property
+    def p50_ms(self) -> Optional[float]:
+        return statistics.median(self.latencies_ms) if self.latencies_ms else None
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ModelRegistry:
+    """
+    Reutiliza los objetos de modelo (uno por nombre) y mantiene por modelo la
+    latencia móvil, la tasa de error y un cortocircuito.
+
+    `route(tier)` ordena los modelos sanos que cumplen el tier por latencia
+    (p50 medido o la latencia esperada del catálogo); después, como respaldo,
+    los sanos de tier inferior. Los modelos con el cortocircuito abierto se
+    omiten salvo que no quede ninguno.
+
+    `factory(nombre)` crea el objeto de modelo; por defecto el proveedor
+    configurado (`llm_providers.get_provider()`: Gemini, local, grabación o
+    replay), resuelto en cada creación para poder sustituirlo (por ejemplo
+    por el doble `tests.fakes.FakeModelBackend.factory`).
+    """
+
+    def __init__(
+        self,
+        catalog: Dict[str, Dict[str, Any]],
+        factory: Optional[Callable[[str], Any]] = None,
+        window: int = 50,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.catalog = catalog
+        self.factory = factory
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def _create(self, name: str):
+        factory = self.factory or get_provider().create_model
+        return factory(name)
+
+    def get_model(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = self._create(name)
+        return model
+
+    def stats_for(self, name: str) -> ModelStats:
+        if name not in self._stats:
+            self._stats[name] = ModelStats(self.window)
+        return self._stats[name]
+
+    def breaker_for(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(self.failure_threshold, self.cooldown_seconds, self.clock)
+        return self._breakers[name]
+
+    def record_success(self, name: str, latency_ms: float):
+        self.stats_for(name).record(True, latency_ms)
+        self.breaker_for(name).record_success()
+
+    def record_failure(self, name: str):
+        stats = self.stats_for(name)
+        stats.record(False)
+        exceeded = len(stats.outcomes) >= self.min_samples and stats.error_rate >= self.error_rate_threshold
+        breaker = self.breaker_for(name)
+        was_open = breaker.state == OPEN
+        breaker.record_failure(exceeded)
+        if breaker.state == OPEN and not was_open:
+            print(f"[LLM] Cortocircuito abierto para {name} durante {self.cooldown_seconds:.0f}s")
+
+    def expected_latency_ms(self, name: str) -> float:
+        measured = self.stats_for(name).p50_ms
+        if measured is not None:
+            return measured
+        return self.catalog.get(name, {}).get("prior_latency_ms", float("inf"))
+
+    def tier_rank(self, name: str) -> int:
+        return TIER_RANK.get(self.catalog.get(name, {}).get("tier"), 0)
+
+    def is_available(self, name: str) -> bool:
+        return self.breaker_for(name).is_available()
+
+    def try_acquire(self, name: str) -> bool:
+        return self.breaker_for(name).try_acquire()
+
+    def available(self, models: List[str]) -> List[str]:
+        """
+        Respeta el orden dado pero omite los modelos con el cortocircuito
+        abierto. Si todos lo están, devuelve la lista original. No consume
+        la prueba de un modelo semiabierto: eso lo hace `try_acquire` al
+        despachar.
+        """
+        healthy = [m for m in models if self.is_available(m)]
+        return healthy or list(models)
+
+    def route(self, tier: str) -> List[str]:
+        required = TIER_RANK.get(tier, 0)
+        meeting = [m for m in self.catalog if self.tier_rank(m) >= required]
+        below = [m for m in self.catalog if self.tier_rank(m) < required]
+        meeting.sort(key=self.expected_latency_ms)
+        below.sort(key=lambda m: (-self.tier_rank(m), self.expected_latency_ms(m)))
+        return self.available(meeting + below)
+
+    def stats(self) -> Dict[str, Any]:
+        names = set(self.catalog) | set(self._stats)
+        report = {}
+        for name in sorted(names):
+            stats = self.stats_for(name)
+            breaker = self.breaker_for(name)
+            p50 = stats.p50_ms
+            report[name] = {
+                "tier": self.catalog.get(name, {}).get("tier"),
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "error_rate": round(stats.error_rate, 4),
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "breaker": breaker.state,
+                "trips": breaker.trips,
+                "pooled": name in self._models,
+            }
+        return report
+
+
+model_registry = ModelRegistry(
+    MODEL_CATALOG,
+    window=settings.model_stats_window,
+    failure_threshold=settings.model_breaker_failure_threshold,
+    cooldown_seconds=settings.model_breaker_cooldown_seconds,
+    error_rate_threshold=settings.model_breaker_error_rate,
+)
@@ -0,0 +1,155 @@
+# app/services/prompt_cache.py
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.utils.db import prompt_cache_collection
+
+
+def prompt_key(
+    model: str,
+    system: Optional[str],
+    prompt: str,
+    generation_config: Optional[Dict[str, Any]],
+) -> str:
+    """
+    Hash SHA-256 de (modelo, instrucción de sistema, prompt completo, configuración).
+    """
+    material = json.dumps(
+        [model, system or "", prompt, generation_config or {}],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    Caché direccionada por contenido de respuestas de Gemini, guardada en
+    `llm_prompt_cache`. Se ubica debajo de `ai_cache`: aunque se invalide la
+    caché por usuario, un prompt idéntico no vuelve a pagar la latencia del modelo.
+
+    La expiración la aplica el índice TTL sobre `created_at`; el tamaño total se
+    acota desalojando las entradas usadas hace más tiempo. El total se lleva
+    en un contador en memoria (sumando lo que guarda este proceso); la suma
+    real sobre la colección solo se recalcula al arrancar, cuando el contador
+    supera el presupuesto y cada `resync_every` escrituras, para recoger lo
+    que expiró por TTL o guardaron otros workers.
+    """
+
+    def __init__(self, collection, max_bytes: int, resync_every: int = 1000):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.resync_every = resync_every
+        self._estimated_bytes: Optional[int] = None
+        self._stores_since_sync = 0
+        self._background_tasks = set()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0, "saved_latency_ms": 0.0}
+
+    async def _lookup(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        # Solo lectura: un fallo de caché no paga una escritura.
+        return await self.collection.find_one(
+            {"_id": {"$in": keys}}, {"model": 1, "data": 1, "text": 1, "latency_ms": 1},
+        )
+
+    async def _touch(self, key: str) -> None:
+        try:
+            await self.collection.update_one(
+                {"_id": key}, {"$set": {"last_hit_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+            )
+        except Exception as e:
+            print(f"[PROMPT-CACHE] No se pudo actualizar last_hit_at: {e}")
+
+    def _touch_in_background(self, key: str) -> None:
+        """
+        La marca de uso (para el desalojo LRU) no necesita estar al día antes
+        de responder: se escribe en segundo plano.
+        """
+        task = asyncio.create_task(self._touch(key))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _store(self, key: str, model: str, data, text, latency_ms: float) -> int:
+        """
+        Guarda la entrada y devuelve los bytes que añade (0 si ya existía).
+        """
+        size = len(json.dumps({"data": data, "text": text}, ensure_ascii=False, default=str))
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "model": model, "data": data, "text": text, "size": size,
+                "latency_ms": latency_ms, "created_at": now, "last_hit_at": now,
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True,
+        )
+        return size if result.upserted_id is not None else 0
+
+    async def _sync_size(self) -> int:
+        cursor = await self.collection.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$size"}}}])
+        totals = await cursor.to_list(None)
+        self._estimated_bytes = totals[0]["bytes"] if totals else 0
+        self._stores_since_sync = 0
+        return self._estimated_bytes
+
+    async def enforce_size_budget(self) -> int:
+        """
+        Si el total supera `max_bytes`, elimina las entradas menos usadas
+        recientemente hasta volver a un 90% del presupuesto. Mientras el
+        contador esté por debajo del presupuesto no consulta la colección.
+        """
+        synced = False
+        if self._estimated_bytes is None or self._stores_since_sync >= self.resync_every:
+            await self._sync_size()
+            synced = True
+        if self._estimated_bytes <= self.max_bytes:
+            return 0
+        # Confirmar con la suma real antes de desalojar: parte pudo expirar por TTL.
+        total = self._estimated_bytes if synced else await self._sync_size()
+        if total <= self.max_bytes:
+            return 0
+
+        to_free = total - int(self.max_bytes * 0.9)
+        victims, freed = [], 0
+        cursor = self.collection.find({}, {"size": 1}).sort("last_hit_at", 1)
+        async for doc in cursor:
+            victims.append(doc["_id"])
+            freed += doc.get("size", 0)
+            if freed >= to_free:
+                break
+        await cursor.close()
+        deleted = (await self.collection.delete_many({"_id": {"$in": victims}})).deleted_count
+        self._estimated_bytes = max(total - freed, 0)
+        self.counters["evicted"] += deleted
+        print(f"[PROMPT-CACHE] Desalojadas {deleted} entradas ({freed} bytes).")
+        return deleted
+
+    async def lookup(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        doc = await self._lookup(keys)
+        if doc is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self.counters["saved_latency_ms"] += doc.get("latency_ms") or 0.0
+        self._touch_in_background(doc["_id"])
+        return doc
+
+    async def store(self, key: str, model: str, data, text, latency_ms: float) -> None:
+        added = await self._store(key, model, data, text, latency_ms)
+        self.counters["stores"] += 1
+        self._stores_since_sync += 1
+        if self._estimated_bytes is not None:
+            self._estimated_bytes += added
+        await self.enforce_size_budget()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "saved_latency_ms": round(self.counters["saved_latency_ms"], 1),
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptCache(prompt_cache_collection, max_bytes=settings.prompt_cache_max_bytes)
@@ -0,0 +1,363 @@
+# app/services/rollups_service.py
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from app.config import settings
+from app.services.aggregates_service import find_drift
+from app.services.columnar import AMOUNT_FIELDS, to_number
+from app.utils.db import financial_collection, financial_rollups_collection
+
+GRANULARITIES = ("day", "week", "month")
+HISTORY_GRANULARITIES = ("raw", "auto") + GRANULARITIES
+DEFAULT_CATEGORY = "general"
+
+BucketKey = Tuple[str, datetime]
+
+
+def bucket_start(value: date, granularity: str) -> datetime:
+    """
+    Inicio del periodo que contiene `value`: el día, el lunes de su semana
+    (ISO) o el día 1 de su mes, a medianoche.
+    """
+    day = date(value.year, value.month, value.day)
+    if granularity == "week":
+        day -= timedelta(days=day.weekday())
+    elif granularity == "month":
+        day = day.replace(day=1)
+    return datetime.combine(day, datetime.min.time())
+
+
+def next_bucket_start(start: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def bucket_count(start: date, end: date, granularity: str) -> int:
+    first, last = bucket_start(start, granularity), bucket_start(end, granularity)
+    if granularity == "day":
+        return (last - first).days + 1
+    if granularity == "week":
+        return (last - first).days // 7 + 1
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+
+def choose_granularity(start: date, end: date, max_points: Optional[int] = None) -> str:
+    """
+    Granularidad más fina cuyo número de periodos en el rango no supera
+    `max_points`; si ninguna cabe, la mensual.
+    """
+    max_points = max_points or settings.rollup_auto_max_points
+    for granularity in GRANULARITIES:
+        if bucket_count(start, end, granularity) <= max_points:
+            return granularity
+    return "month"
+
+
+def category_key(category: Any) -> str:
+    # Las claves se usan en notación de puntos dentro de $inc.
+    if not isinstance(category, str) or not category.strip():
+        return DEFAULT_CATEGORY
+    return category.strip().replace(".", "_").lstrip("$") or DEFAULT_CATEGORY
+
+
+def _empty_bucket() -> Dict[str, Any]:
+    return {"count": 0, "sums": {f: 0.0 for f in AMOUNT_FIELDS}, "min": {}, "max": {}, "categories": {}}
+
+
+def _add_record(bucket: Dict[str, Any], record: Dict[str, Any]) -> None:
+    values = {f: to_number(record.get(f)) for f in AMOUNT_FIELDS}
+    split = bucket["categories"].setdefault(
+        category_key(record.get("category")), {"count": 0, **{f: 0.0 for f in AMOUNT_FIELDS}},
+    )
+    bucket["count"] += 1
+    split["count"] += 1
+    for field, value in values.items():
+        bucket["sums"][field] += value or 0.0
+        split[field] += value or 0.0
+        if value is not None:
+            bucket["min"][field] = min(bucket["min"].get(field, value), value)
+            bucket["max"][field] = max(bucket["max"].get(field, value), value)
+
+
+def merge_buckets(buckets: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combina varios buckets (p. ej. los días de un mes parcial) en uno.
+    """
+    merged = _empty_bucket()
+    for bucket in buckets:
+        merged["count"] += bucket.get("count", 0)
+        for field in AMOUNT_FIELDS:
+            merged["sums"][field] += bucket.get("sums", {}).get(field, 0.0)
+            for bound, pick in (("min", min), ("max", max)):
+                value = bucket.get(bound, {}).get(field)
+                if value is not None:
+                    current = merged[bound].get(field)
+                    merged[bound][field] = value if current is None else pick(current, value)
+        for key, split in bucket.get("categories", {}).items():
+            target = merged["categories"].setdefault(key, {"count": 0, **{f: 0.0 for f in AMOUNT_FIELDS}})
+            for name, value in split.items():
+                target[name] = target.get(name, 0) + value
+    return merged
+
+
+def add_to_buckets(buckets: Dict[BucketKey, Dict[str, Any]], record: Dict[str, Any]) -> None:
+    record_date = record.get("record_date")
+    if not isinstance(record_date, datetime):
+        return
+    for granularity in GRANULARITIES:
+        key = (granularity, bucket_start(record_date, granularity))
+        _add_record(buckets.setdefault(key, _empty_bucket()), record)
+
+
+def build_buckets(records: Iterable[Dict[str, Any]]) -> Dict[BucketKey, Dict[str, Any]]:
+    """
+    Buckets diarios, semanales y mensuales de los registros, indexados por
+    (granularidad, inicio del periodo). Los registros sin `record_date` no
+    entran en ningún bucket.
+    """
+    buckets: Dict[BucketKey, Dict[str, Any]] = {}
+    for record in records:
+        add_to_buckets(buckets, record)
+    return buckets
+
+
+async def _buckets_from_records(user_email: str) -> Dict[BucketKey, Dict[str, Any]]:
+    # Se acumula registro a registro: la memoria la ocupan los buckets, no los documentos.
+    projection = {"_id": 0, "record_date": 1, "category": 1, **{f: 1 for f in AMOUNT_FIELDS}}
+    buckets: Dict[BucketKey, Dict[str, Any]] = {}
+    async for record in financial_collection.find({"user_email": user_email}, projection) \
+            .batch_size(settings.columnar_batch_size):
+        add_to_buckets(buckets, record)
+    return buckets
+
+
+def bucket_update(bucket: Dict[str, Any], sign: int = 1) -> Dict[str, Any]:
+    """
+    Update de Mongo que suma (o resta, con `sign=-1`) el bucket a su
+    documento. Mínimos y máximos solo se amplían al sumar.
+    """
+    inc: Dict[str, Any] = {"count": sign * bucket["count"]}
+    for field, value in bucket["sums"].items():
+        inc[f"sums.{field}"] = sign * value
+    for key, split in bucket["categories"].items():
+        for name, value in split.items():
+            inc[f"categories.{key}.{name}"] = sign * value
+    update: Dict[str, Any] = {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    if sign > 0:
+        if bucket["min"]:
+            update["$min"] = {f"min.{f}": v for f, v in bucket["min"].items()}
+        if bucket["max"]:
+            update["$max"] = {f"max.{f}": v for f, v in bucket["max"].items()}
+    return update
+
+
+def _bucket_filter(user_email: str, key: BucketKey) -> Dict[str, Any]:
+    granularity, start = key
+    return {"user_email": user_email, "granularity": granularity, "bucket_start": start}
+
+
+async def add_records_to_rollups(user_email: str, records: Iterable[Dict[str, Any]]) -> None:
+    """
+    Suma los registros a los buckets del usuario con un solo `bulk_write`
+    (un upsert por bucket afectado, no por registro).
+
+    Si el usuario aún no tiene buckets (registros anteriores a las rollups)
+    los upserts crearían solo los periodos de los registros nuevos y el
+    historial perdería el resto; en ese caso se reconstruye desde los
+    registros crudos, que ya incluyen los recién insertados.
+    """
+    if not await financial_rollups_collection.find_one({"user_email": user_email}, {"_id": 1}):
+        await rebuild_user_rollups(user_email)
+        return
+    operations = [
+        UpdateOne(_bucket_filter(user_email, key), bucket_update(bucket), upsert=True)
+        for key, bucket in build_buckets(records).items()
+    ]
+    if operations:
+        await financial_rollups_collection.bulk_write(operations, ordered=False)
+
+
+async def add_record_to_rollups(record: Dict[str, Any]) -> None:
+    await add_records_to_rollups(record["user_email"], [record])
+
+
+async def _recompute_extremes(user_email: str, key: BucketKey) -> None:
+    granularity, start = key
+    records = financial_collection.find(
+        {"user_email": user_email,
+         "record_date": {"$gte": start, "$lt": next_bucket_start(start, granularity)}},
+        {"_id": 0, **{f: 1 for f in AMOUNT_FIELDS}},
+    )
+    bucket = _empty_bucket()
+    async for record in records:
+        _add_record(bucket, record)
+    await financial_rollups_collection.update_one(
+        _bucket_filter(user_email, key), {"$set": {"min": bucket["min"], "max": bucket["max"]}},
+    )
+
+
+async def remove_record_from_rollups(record: Dict[str, Any]) -> None:
+    """
+    Resta el registro de sus tres buckets. Un bucket que queda vacío se
+    elimina; si el registro tenía el mínimo o el máximo de algún campo, esos
+    límites se recalculan con los registros del periodo (consulta indexada
+    por usuario y fecha).
+    """
+    user_email = record.get("user_email", "")
+    for key, bucket in build_buckets([record]).items():
+        after = await financial_rollups_collection.find_one_and_update(
+            _bucket_filter(user_email, key), bucket_update(bucket, -1),
+            return_document=ReturnDocument.AFTER,
+        )
+        if not after:
+            continue
+        if after.get("count", 0) <= 0:
+            await financial_rollups_collection.delete_one(_bucket_filter(user_email, key))
+            continue
+
+        empty = {f"categories.{k}": "" for k, split in after.get("categories", {}).items()
+                 if split.get("count", 0) <= 0}
+        if empty:
+            await financial_rollups_collection.update_one(_bucket_filter(user_email, key), {"$unset": empty})
+
+        touched = any(
+            value is not None and value in (after.get("min", {}).get(f), after.get("max", {}).get(f))
+            for f, value in ((f, to_number(record.get(f))) for f in AMOUNT_FIELDS)
+        )
+        if touched:
+            await _recompute_extremes(user_email, key)
+
+
+async def rebuild_user_rollups(user_email: str) -> int:
+    """
+    Reconstruye desde cero los buckets del usuario a partir de sus registros.
+    Devuelve el número de documentos escritos.
+
+    Los buckets nuevos reemplazan a los guardados uno a uno (upsert) y
+    después se borran los que ya no corresponden a ningún registro: los
+    lectores nunca ven el historial vacío. `now` se toma antes de leer los
+    registros, así que un bucket con `updated_at` anterior que no se
+    reescribió está obsoleto, y uno que una escritura concurrente tocó
+    después no se borra.
+    """
+    now = datetime.utcnow()
+    buckets = await _buckets_from_records(user_email)
+    if buckets:
+        await financial_rollups_collection.bulk_write([
+            ReplaceOne(_bucket_filter(user_email, key),
+                       {**_bucket_filter(user_email, key), **bucket, "updated_at": now}, upsert=True)
+            for key, bucket in buckets.items()
+        ], ordered=True)
+    await financial_rollups_collection.delete_many({"user_email": user_email, "updated_at": {"$lt": now}})
+    return len(buckets)
+
+
+def _day(value: Optional[date]) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+async def _data_bounds(user_email: str) -> Tuple[Optional[date], Optional[date]]:
+    query = {"user_email": user_email, "granularity": "day"}
+    first = await financial_rollups_collection.find_one(query, {"bucket_start": 1}, sort=[("bucket_start", 1)])
+    last = await financial_rollups_collection.find_one(query, {"bucket_start": 1}, sort=[("bucket_start", -1)])
+    if not first or not last:
+        return None, None
+    return first["bucket_start"].date(), last["bucket_start"].date()
+
+
+async def _buckets(user_email: str, granularity: str, first: datetime, last: datetime) -> List[Dict[str, Any]]:
+    return await financial_rollups_collection.find(
+        {"user_email": user_email, "granularity": granularity, "bucket_start": {"$gte": first, "$lte": last}},
+        {"_id": 0, "user_email": 0, "updated_at": 0},
+    ).sort("bucket_start", 1).to_list(None)
+
+
+async def _partial_bucket(user_email: str, start: date, end: date) -> Optional[Dict[str, Any]]:
+    days = await _buckets(user_email, "day", bucket_start(start, "day"), bucket_start(end, "day"))
+    return merge_buckets(days) if days else None
+
+
+def rollup_point(bucket: Dict[str, Any], granularity: str, start: date, end: date) -> Dict[str, Any]:
+    return {
+        "granularity": granularity,
+        "period_start": start,
+        "period_end": end,
+        "count": bucket["count"],
+        **{f: round(bucket["sums"].get(f, 0.0), 2) for f in AMOUNT_FIELDS},
+        "min": bucket.get("min", {}),
+        "max": bucket.get("max", {}),
+        "categories": bucket.get("categories", {}),
+    }
+
+
+async def get_rollup_history(
+    user_email: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: str = "auto",
+) -> List[Dict[str, Any]]:
+    """
+    Historial agregado por periodo en lugar de registro a registro.
+
+    Con `auto` se usa la granularidad más fina que no supere
+    `rollup_auto_max_points` periodos (cinco años → ~60 meses). Los periodos
+    de los extremos que el rango corta a medias se recomponen con los buckets
+    diarios de la parte incluida, así los totales coinciden exactamente con
+    los registros del rango. `period_end` es inclusivo.
+    """
+    first_day, last_day = await _data_bounds(user_email)
+    if first_day is None:
+        # Usuarios con registros anteriores a las rollups: se construyen una vez.
+        if not await financial_collection.find_one({"user_email": user_email}, {"_id": 1}):
+            return []
+        await rebuild_user_rollups(user_email)
+        first_day, last_day = await _data_bounds(user_email)
+        if first_day is None:
+            return []
+
+    range_start, range_end = _day(start_date), _day(end_date)
+    start = max(range_start or first_day, first_day)
+    end = min(range_end or last_day, last_day)
+    if start > end:
+        return []
+    if granularity == "auto":
+        granularity = choose_granularity(start, end)
+
+    points = []
+    for bucket in await _buckets(user_email, granularity, bucket_start(start, granularity), bucket_start(end, granularity)):
+        period_start = bucket["bucket_start"].date()
+        period_end = next_bucket_start(bucket["bucket_start"], granularity).date() - timedelta(days=1)
+        clipped_start = max(period_start, range_start) if range_start else period_start
+        clipped_end = min(period_end, range_end) if range_end else period_end
+        if (clipped_start, clipped_end) != (period_start, period_end):
+            bucket = await _partial_bucket(user_email, clipped_start, clipped_end)
+            if bucket is None:
+                continue
+        points.append(rollup_point(bucket, granularity, clipped_start, clipped_end))
+    return points
+
+
+async def verify_user_rollups(user_email: str) -> Dict[str, Any]:
+    """
+    Compara los buckets guardados con los recalculados desde los registros.
+    Devuelve {"granularidad:fecha": (guardado, esperado)} con los que difieren.
+    """
+    expected = await _buckets_from_records(user_email)
+    stored = {
+        (doc["granularity"], doc["bucket_start"]): doc
+        async for doc in financial_rollups_collection.find({"user_email": user_email}, {"_id": 0})
+    }
+    drift: Dict[str, Any] = {}
+    for key in set(stored) | set(expected):
+        diff = find_drift(
+            {k: v for k, v in (stored.get(key) or {}).items() if k in ("count", "sums", "min", "max", "categories")},
+            expected.get(key) or {},
+        )
+        if diff:
+            drift[f"{key[0]}:{key[1].date()}"] = diff
+    return drift
@@ -0,0 +1,76 @@
+# app/services/scenario_engine.py
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+DELTA_FIELDS = ("delta_income", "delta_expenses", "delta_savings")
+METRIC_FIELDS = ("income", "expenses", "savings", "change_income", "change_expenses", "change_savings")
+TABLE_COLUMNS = DELTA_FIELDS + METRIC_FIELDS + ("trend", "impact_level")
+
+
+def _change_pct(simulated: np.ndarray, average: float) -> np.ndarray:
+    if not average:
+        return np.zeros_like(simulated)
+    return (simulated - average) / average * 100
+
+
+def simulate_scenarios(
+    baseline: Dict[str, Any],
+    delta_income,
+    delta_expenses,
+    delta_savings,
+) -> Dict[str, np.ndarray]:
+    """
+    Evalúa de una vez todos los escenarios (los deltas se difunden entre sí
+    con las reglas de broadcasting de NumPy) sobre los promedios históricos
+    de `scenario_baseline`. Devuelve un arreglo por métrica.
+    """
+    di, de, ds = np.broadcast_arrays(
+        *(np.asarray(d, dtype=np.float64) for d in (delta_income, delta_expenses, delta_savings))
+    )
+    avg_income = baseline["avg_income"]
+    avg_expenses = baseline["avg_expenses"]
+    avg_savings = baseline["avg_savings"]
+
+    income = np.maximum(avg_income + di, 0)
+    expenses = np.maximum(avg_expenses + de, 0)
+    savings = np.maximum(income - expenses + ds, 0)
+
+    slope = (savings - avg_savings) / max(avg_savings, 1)
+    magnitude = np.abs(slope)
+    return {
+        "delta_income": di,
+        "delta_expenses": de,
+        "delta_savings": ds,
+        "income": income,
+        "expenses": expenses,
+        "savings": savings,
+        "change_income": _change_pct(income, avg_income),
+        "change_expenses": _change_pct(expenses, avg_expenses),
+        "change_savings": _change_pct(savings, avg_savings),
+        "slope": slope,
+        "trend": np.where(slope >= 0, "positiva", "negativa"),
+        "impact_level": np.where(magnitude > 0.3, "alto", np.where(magnitude > 0.1, "moderado", "bajo")),
+    }
+
+
+def scenario_grid(
+    delta_income: Optional[Sequence[float]] = None,
+    delta_expenses: Optional[Sequence[float]] = None,
+    delta_savings: Optional[Sequence[float]] = None,
+) -> List[np.ndarray]:
+    """
+    Producto cartesiano de los valores de cada delta (un eje vacío equivale a [0]).
+    """
+    axes = [np.asarray(values if values else [0.0], dtype=np.float64)
+            for values in (delta_income, delta_expenses, delta_savings)]
+    return [axis.reshape(-1) for axis in np.meshgrid(*axes, indexing="ij")]
+
+
+def scenario_table(results: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Tabla compacta: nombres de columna una sola vez y una fila por escenario,
+    con las cifras redondeadas a 2 decimales.
+    """
+    columns = [np.round(results[name], 2).tolist() for name in DELTA_FIELDS + METRIC_FIELDS]
+    columns += [results["trend"].tolist(), results["impact_level"].tolist()]
+    return {"columns": list(TABLE_COLUMNS), "rows": [list(row) for row in zip(*columns)]}
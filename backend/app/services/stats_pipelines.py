@@ -0,0 +1,161 @@
+# app/services/stats_pipelines.py
+from typing import Any, Dict, List
+from app.services.columnar import AMOUNT_FIELDS
+from app.utils.db import financial_collection
+
+
+def _number(field: str) -> Dict[str, Any]:
+    """
+    Valor numérico del campo como double, o null si falta, es booleano o no
+    se puede convertir: el mismo criterio que `columnar.to_number`.
+    """
+    return {"$cond": [
+        {"$in": [{"$type": f"${field}"}, ["missing", "null", "bool"]]},
+        None,
+        {"$convert": {"input": f"${field}", "to": "double", "onError": None, "onNull": None}},
+    ]}
+
+
+def _numeric_stages(user_email: str) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {"user_email": user_email}},
+        {"$project": {"_id": 0, "record_date": 1, **{f: _number(f) for f in AMOUNT_FIELDS}}},
+    ]
+
+
+def _present(*fields: str) -> Dict[str, Any]:
+    return {"$and": [{"$ne": [f"${f}", None]} for f in fields]}
+
+
+# Filtros de validez de las rutas, evaluados en el servidor.
+SCENARIO_VALID = _present("income", "expenses", "savings")
+RISK_VALID = {"$and": [_present("income", "savings"), {"$gt": ["$income", 0]}]}
+
+
+def _when(condition: Dict[str, Any], value: Any, otherwise: Any = None) -> Dict[str, Any]:
+    return {"$cond": [condition, value, otherwise]}
+
+
+def scenario_pipeline(user_email: str) -> List[Dict[str, Any]]:
+    return _numeric_stages(user_email) + [
+        {"$group": {
+            "_id": None,
+            "total_records": {"$sum": 1},
+            "valid_records": {"$sum": _when(SCENARIO_VALID, 1, 0)},
+            # $avg ignora los null: promedia solo los registros válidos.
+            **{f"avg_{f}": {"$avg": _when(SCENARIO_VALID, f"${f}")} for f in AMOUNT_FIELDS},
+        }},
+        {"$project": {"_id": 0}},
+    ]
+
+
+def risk_pipeline(user_email: str) -> List[Dict[str, Any]]:
+    return _numeric_stages(user_email) + [
+        {"$group": {
+            "_id": None,
+            "total_records": {"$sum": 1},
+            "valid_records": {"$sum": _when(RISK_VALID, 1, 0)},
+            "avg_save_ratio": {"$avg": _when(RISK_VALID, {"$divide": ["$savings", "$income"]})},
+            "volatility": {"$stdDevPop": _when(RISK_VALID, "$savings")},
+        }},
+        {"$project": {"_id": 0}},
+    ]
+
+
+def totals_pipeline(user_email: str) -> List[Dict[str, Any]]:
+    # $sum ignora los null, así que un valor faltante cuenta como 0.
+    return _numeric_stages(user_email) + [
+        {"$group": {"_id": None, **{f: {"$sum": f"${f}"} for f in AMOUNT_FIELDS}}},
+        {"$project": {"_id": 0}},
+    ]
+
+
+def aggregates_pipeline(user_email: str) -> List[Dict[str, Any]]:
+    """
+    Documento de agregados completo (mismas secciones que
+    `aggregates_service.compute_aggregates`) calculado en el servidor.
+    """
+    group: Dict[str, Any] = {"_id": None, "count": {"$sum": 1}}
+    for f in AMOUNT_FIELDS:
+        group[f"sums_{f}"] = {"$sum": f"${f}"}
+        group[f"sumsq_{f}"] = {"$sum": {"$multiply": [{"$ifNull": [f"${f}", 0]}, {"$ifNull": [f"${f}", 0]}]}}
+        group[f"scenario_{f}"] = {"$sum": _when(SCENARIO_VALID, f"${f}", 0)}
+    group.update({
+        "scenario_count": {"$sum": _when(SCENARIO_VALID, 1, 0)},
+        "risk_count": {"$sum": _when(RISK_VALID, 1, 0)},
+        "risk_ratio_sum": {"$sum": _when(RISK_VALID, {"$divide": ["$savings", "$income"]}, 0)},
+        "risk_savings": {"$sum": _when(RISK_VALID, "$savings", 0)},
+        "risk_savings_std": {"$stdDevPop": _when(RISK_VALID, "$savings")},
+        "first_date": {"$min": _when({"$eq": [{"$type": "$record_date"}, "date"]}, "$record_date")},
+        "last_date": {"$max": _when({"$eq": [{"$type": "$record_date"}, "date"]}, "$record_date")},
+    })
+    return _numeric_stages(user_email) + [
+        {"$group": group},
+        {"$project": {
+            "_id": 0,
+            "count": 1,
+            "first_date": 1,
+            "last_date": 1,
+            "sums": {f: f"$sums_{f}" for f in AMOUNT_FIELDS},
+            "sumsq": {f: f"$sumsq_{f}" for f in AMOUNT_FIELDS},
+            "scenario": {"count": "$scenario_count", **{f: f"$scenario_{f}" for f in AMOUNT_FIELDS}},
+            "risk": {
+                "count": "$risk_count",
+                "ratio_sum": "$risk_ratio_sum",
+                "savings": "$risk_savings",
+                # M2 = n·σ²; $stdDevPop no sufre la cancelación de Σx² − n·media².
+                "savings_m2": {"$multiply": ["$risk_count", {"$pow": [{"$ifNull": ["$risk_savings_std", 0]}, 2]}]},
+            },
+        }},
+    ]
+
+
+async def _one(pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    cursor = await financial_collection.aggregate(pipeline)
+    rows = await cursor.to_list(1)
+    return rows[0] if rows else {}
+
+
+async def scenario_stats(user_email: str) -> Dict[str, Any]:
+    """
+    Promedios de /ai/scenario; misma forma que `scenario_baseline`.
+    """
+    doc = await _one(scenario_pipeline(user_email))
+    stats = {"valid_records": doc.get("valid_records", 0), "total_records": doc.get("total_records", 0)}
+    for f in AMOUNT_FIELDS:
+        stats[f"avg_{f}"] = doc.get(f"avg_{f}") or 0
+    return stats
+
+
+async def risk_stats(user_email: str) -> Dict[str, Any]:
+    """
+    Ratio medio de ahorro y volatilidad de /ai/risk-summary; misma forma que
+    `risk_statistics`.
+    """
+    doc = await _one(risk_pipeline(user_email))
+    return {
+        "valid_records": doc.get("valid_records", 0),
+        "total_records": doc.get("total_records", 0),
+        "avg_save_ratio": doc.get("avg_save_ratio") or 0,
+        "volatility": doc.get("volatility") or 0,
+    }
+
+
+async def summary_totals(user_email: str) -> Dict[str, float]:
+    doc = await _one(totals_pipeline(user_email))
+    return {f: doc.get(f, 0) for f in AMOUNT_FIELDS}
+
+
+async def pipeline_aggregates(user_email: str) -> Dict[str, Any]:
+    """
+    Agregados del usuario transfiriendo un único documento. Como en
+    `compute_aggregates`, las secciones `scenario`/`risk` se omiten si no hay
+    registros válidos para ellas.
+    """
+    doc = await _one(aggregates_pipeline(user_email))
+    if not doc:
+        return {"count": 0, "first_date": None, "last_date": None}
+    for section in ("scenario", "risk"):
+        if not doc[section]["count"]:
+            del doc[section]
+    return doc
@@ -0,0 +1,147 @@
+# app/services/trend_engine.py
+from typing import Dict, List, Sequence
+import numpy as np
+
+
+INSUFFICIENT_DATA = {"message": "No hay suficientes datos para el análisis."}
+ADVANCED_MODELS = ("huber",)
+
+
+def _trend_label(slope: float) -> str:
+    return "positiva" if slope > 0 else "negativa"
+
+
+def _format_trend(slope: float, next_value: float) -> dict:
+    return {
+        "next_savings_estimate": round(float(next_value), 2),
+        "trend": _trend_label(slope),
+        "slope": round(float(slope), 2),
+    }
+
+
+def prefix_savings_trends(savings: Sequence[float]) -> List[dict]:
+    """
+    Calcula en una sola pasada el pronóstico de cada prefijo de la serie
+    (registros 1..2, 1..3, ..., 1..n), equivalente a ajustar una regresión
+    lineal por prefijo como hacía `predict_savings_trend(docs[:i])`.
+
+    Usa mínimos cuadrados incrementales: para x = 0..i-1 las sumas Σx y Σx²
+    tienen forma cerrada, y Σy y Σxy se mantienen como sumas acumuladas.
+    El costo total es O(n) en lugar de O(n²).
+    """
+    y = np.asarray(savings, dtype=np.float64)
+    n_total = y.shape[0]
+    if n_total < 2:
+        return []
+
+    x = np.arange(n_total, dtype=np.float64)
+    sum_y = np.cumsum(y)
+    sum_xy = np.cumsum(x * y)
+
+    n = np.arange(1, n_total + 1, dtype=np.float64)
+    mean_x = (n - 1) / 2
+    sxx = n * (n * n - 1) / 12
+    sxy = sum_xy - mean_x * sum_y
+
+    n, sum_y, sxx, sxy, mean_x = n[1:], sum_y[1:], sxx[1:], sxy[1:], mean_x[1:]
+    slope = sxy / sxx
+    # Series constantes: evita que el ruido de redondeo invierta la tendencia.
+    tolerance = 1e-12 * np.maximum(np.abs(sum_y) / n, 1.0)
+    slope = np.where(np.abs(slope) < tolerance, 0.0, slope)
+    intercept = sum_y / n - slope * mean_x
+    next_values = intercept + slope * (n + 1)
+
+    return [_format_trend(s, v) for s, v in zip(slope.tolist(), next_values.tolist())]
+
+
+def fit_trends_batch(matrix) -> Dict[str, np.ndarray]:
+    """
+    Ajusta en una sola llamada vectorizada una recta por fila de una matriz
+    usuarios × periodos. Los valores NaN se ignoran, lo que permite series de
+    distinta longitud rellenando con NaN al final.
+
+    Devuelve arreglos con `slope`, `intercept`, `next_value` (estimación para
+    x = n + 1, igual que el modelo original) y `n` (puntos válidos por fila).
+    Las filas con menos de dos puntos quedan en NaN.
+    """
+    y = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+    mask = ~np.isnan(y)
+    x = np.arange(y.shape[1], dtype=np.float64)
+
+    n = mask.sum(axis=1).astype(np.float64)
+    yv = np.where(mask, y, 0.0)
+    xv = np.where(mask, x, 0.0)
+    sum_x = xv.sum(axis=1)
+    sum_y = yv.sum(axis=1)
+    sum_xx = (xv * xv).sum(axis=1)
+    sum_xy = (xv * yv).sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = sum_x / n
+        sxx = sum_xx - sum_x * mean_x
+        sxy = sum_xy - sum_y * mean_x
+        slope = sxy / sxx
+        tolerance = 1e-12 * np.maximum(np.abs(sum_y) / n, 1.0)
+        slope = np.where(np.abs(slope) < tolerance, 0.0, slope)
+        intercept = sum_y / n - slope * mean_x
+
+    valid = n >= 2
+    slope = np.where(valid, slope, np.nan)
+    intercept = np.where(valid, intercept, np.nan)
+    next_value = intercept + slope * (n + 1)
+
+    return {"slope": slope, "intercept": intercept, "next_value": next_value, "n": n}
+
+
+def fit_trend(values: Sequence[float]) -> dict:
+    """
+    Pronóstico de ahorro para una sola serie usando mínimos cuadrados en forma cerrada.
+    """
+    if len(values) < 2:
+        return dict(INSUFFICIENT_DATA)
+    fit = fit_trends_batch([values])
+    return _format_trend(fit["slope"][0], fit["next_value"][0])
+
+
+def fit_trend_advanced(values: Sequence[float], model: str = "huber") -> dict:
+    """
+    Ajuste robusto opcional. scikit-learn se importa solo aquí para no
+    cargarlo en el arranque de los workers.
+    """
+    if model not in ADVANCED_MODELS:
+        raise ValueError(f"Modelo de tendencia no soportado: {model}")
+    if len(values) < 2:
+        return dict(INSUFFICIENT_DATA)
+
+    from sklearn.linear_model import HuberRegressor
+
+    x = np.arange(len(values), dtype=np.float64).reshape(-1, 1)
+    y = np.asarray(values, dtype=np.float64)
+    regressor = HuberRegressor().fit(x, y)
+    next_value = regressor.predict([[len(values) + 1]])[0]
+    return _format_trend(regressor.coef_[0], next_value)
+
+
+def score_users(series_by_user: Dict[str, Sequence[float]]) -> Dict[str, dict]:
+    """
+    Calcula la tendencia de muchos usuarios a la vez (p. ej. en procesos nocturnos).
+    Las series se rellenan con NaN hasta la longitud máxima y se ajustan en bloque.
+    """
+    if not series_by_user:
+        return {}
+
+    users = list(series_by_user)
+    width = max(len(v) for v in series_by_user.values())
+    matrix = np.full((len(users), max(width, 1)), np.nan)
+    for row, user in enumerate(users):
+        values = series_by_user[user]
+        matrix[row, :len(values)] = values
+
+    fit = fit_trends_batch(matrix)
+    scores = {}
+    for row, user in enumerate(users):
+        if fit["n"][row] < 2:
+            scores[user] = dict(INSUFFICIENT_DATA)
+        else:
+            scores[user] = _format_trend(fit["slope"][row], fit["next_value"][row])
+    return scores
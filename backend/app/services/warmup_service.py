@@ -0,0 +1,122 @@
+# app/services/warmup_service.py
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.services.model_registry import model_registry
+from app.services.projection_engine import monte_carlo_projection
+from app.services.trend_engine import fit_trend, prefix_savings_trends
+from app.utils.db import connect_mongo, get_db
+from app.utils.indexes import ensure_indexes
+
+
+class WarmupState:
+    """
+    Progreso del calentamiento que consulta `/ready`. Cada paso guarda si
+    terminó bien, cuánto tardó y el último error.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.attempts = 0
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.finished_at = datetime.utcnow()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "attempts": self.attempts,
+            "steps": self.steps,
+        }
+
+
+async def _mongo() -> None:
+    # aconnect no garantiza un servidor disponible; el ping sí abre el pool.
+    await connect_mongo()
+    await get_db().command("ping")
+
+
+async def _indexes() -> None:
+    await ensure_indexes()
+
+
+async def _models() -> None:
+    """
+    Crea los objetos de modelo del catálogo. Con Gemini es donde se importa
+    y configura el SDK, fuera del arranque del proceso.
+    """
+    failed = []
+    for name in model_registry.catalog:
+        try:
+            model_registry.get_model(name)
+        except Exception as e:
+            failed.append(f"{name}: {e}")
+    if failed:
+        raise RuntimeError("; ".join(failed))
+
+
+def _synthetic_forecast() -> None:
+    # Serie sintética de dos años: ejercita las rutas de NumPy del pronóstico
+    # lineal, los prefijos y el Monte Carlo antes de la primera petición real.
+    months = 24
+    income = [3000.0 + 15 * i for i in range(months)]
+    expenses = [2200.0 + 10 * i + (120 if i % 3 == 0 else 0) for i in range(months)]
+    savings = [i - e for i, e in zip(income, expenses)]
+    fit_trend(savings)
+    prefix_savings_trends(savings)
+    monte_carlo_projection(income, expenses, horizon=12, paths=200, seed=0)
+
+
+async def _forecast() -> None:
+    await run_in_threadpool(_synthetic_forecast)
+
+
+# (nombre, paso, obligatorio). Un paso obligatorio que falla se reintenta y
+# retiene la disponibilidad; uno opcional solo queda registrado.
+WARMUP_STEPS: List[Tuple[str, Callable[[], Awaitable[None]], bool]] = [
+    ("mongo", _mongo, True),
+    # Los índices únicos sostienen la detección de duplicados: sin ellos no hay disponibilidad.
+    ("indexes", _indexes, True),
+    ("models", _models, False),
+    ("forecast", _forecast, True),
+]
+
+
+async def run_warmup(state: WarmupState, retry_seconds: float, steps=None) -> None:
+    """
+    Ejecuta los pasos en orden hasta que todos los obligatorios terminen
+    bien; entonces marca el estado como listo. Los pasos ya completados no
+    se repiten entre intentos.
+    """
+    steps = WARMUP_STEPS if steps is None else steps
+    state.started_at = datetime.utcnow()
+    while True:
+        state.attempts += 1
+        pending = False
+        for name, step, required in steps:
+            if state.steps.get(name, {}).get("ok"):
+                continue
+            started = time.perf_counter()
+            try:
+                await step()
+                state.steps[name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+            except Exception as e:
+                state.steps[name] = {"ok": False, "required": required, "error": str(e)}
+                print(f"[WARMUP] Paso {name} falló (intento {state.attempts}): {e}")
+                if required:
+                    pending = True
+                    break
+        if not pending:
+            state.mark_ready()
+            timings = {n: s.get("ms") for n, s in state.steps.items()}
+            print(f"[WARMUP] Listo tras {state.attempts} intento(s): {timings}")
+            return
+        await asyncio.sleep(retry_seconds)
@@ -1,24 +1,105 @@
 # app/utils/db.py
-
-from pymongo import MongoClient
+import asyncio
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from app.config import settings
+from app.utils.metrics import mongo_command_metrics
+
+DB_NAME = "finscope"
+
+_client: Optional[AsyncMongoClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def create_client() -> AsyncMongoClient:
+    """
+    Cliente asíncrono con el pool configurado en Settings. No abre conexiones
+    hasta la primera operación (o hasta `connect_mongo`). Con
+    `metrics_enabled` registra el listener que cronometra cada comando.
+    """
+    return AsyncMongoClient(
+        settings.mongo_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        socketTimeoutMS=settings.mongo_socket_timeout_ms,
+        waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+        event_listeners=[mongo_command_metrics] if settings.metrics_enabled else [],
+    )
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_client() -> AsyncMongoClient:
+    """
+    Cliente del event loop actual. En la app lo crea el lifespan; en scripts y
+    pruebas (asyncio.run, TestClient sin contexto) se crea bajo demanda y se
+    reemplaza si cambia el loop, porque AsyncMongoClient no se comparte entre loops.
+    """
+    global _client, _client_loop
+    loop = _running_loop()
+    if _client is None or (loop is not None and _client_loop is not loop):
+        _client = create_client()
+        _client_loop = loop
+    return _client
+
+
+async def connect_mongo() -> AsyncMongoClient:
+    client = get_client()
+    await client.aconnect()
+    print(f"[DB] Cliente Mongo listo (maxPoolSize={settings.mongo_max_pool_size}).")
+    return client
+
+
+async def close_mongo() -> None:
+    global _client, _client_loop
+    if _client is not None and _client_loop is _running_loop():
+        await _client.close()
+    _client = None
+    _client_loop = None
+
+
+def get_db() -> AsyncDatabase:
+    return get_client()[DB_NAME]
+
+
+class CollectionProxy:
+    """
+    Referencia perezosa a una colección: resuelve el cliente en cada acceso,
+    así los servicios la importan al cargar sin fijar un cliente ni un loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self) -> str:
+        return f"CollectionProxy({self.name!r})"
 
-client = MongoClient(settings.mongo_uri)
-db = client["finscope"]
 
-user_collection = db["users"]
-financial_collection = db["financial_data"]
-ai_cache_collection = db["ai_cache"]  
+user_collection = CollectionProxy("users")
+financial_collection = CollectionProxy("financial_data")
+ai_cache_collection = CollectionProxy("ai_cache")
+user_aggregates_collection = CollectionProxy("user_aggregates")
+financial_rollups_collection = CollectionProxy("financial_rollups")
+prompt_cache_collection = CollectionProxy("llm_prompt_cache")
+ai_jobs_collection = CollectionProxy("ai_jobs")
 
-def get_db():
-    return db
 
-def get_financial_collection():
-    return db["financial_data"]
+def get_financial_collection() -> AsyncCollection:
+    return get_db()["financial_data"]
 
-def get_ai_cache_collection():
-    return db["ai_cache"]  
 
-def invalidate_ai_cache_for_user(user_email: str):    
-    result = ai_cache_collection.delete_many({"user_email": user_email})
-    print(f"[CACHE] Invalidada IA para {user_email}: {result.deleted_count} documentos eliminados.")
\ No newline at end of file
+def get_ai_cache_collection() -> AsyncCollection:
+    return get_db()["ai_cache"]
@@ -1,3 +1,7 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+from cachetools import TLRUCache, TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -6,27 +10,100 @@ from app.utils.db import user_collection
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+DEFAULT_TOKEN_TTL_SECONDS = 300
+
+
+def _token_expiry(_key, identity: Dict[str, Any], now: float) -> float:
+    """
+    Un token verificado vale en caché hasta su `exp`, nunca más.
+    """
+    return identity.get("exp") or now + DEFAULT_TOKEN_TTL_SECONDS
+
+
+_cache_lock = threading.Lock()
+_token_cache = TLRUCache(maxsize=settings.auth_token_cache_maxsize, ttu=_token_expiry, timer=time.time)
+_user_cache = TTLCache(maxsize=settings.auth_user_cache_maxsize, ttl=settings.auth_user_cache_ttl_seconds)
+
+
+def invalidate_user_cache(email: str):
+    """
+    Llamar cuando cambie el documento de un usuario (registro, rol, perfil).
+    """
+    with _cache_lock:
+        _user_cache.pop(email, None)
+
+
+def clear_auth_caches():
+    with _cache_lock:
+        _token_cache.clear()
+        _user_cache.clear()
+
+
+def _verify_token(token: str) -> Optional[Dict[str, Any]]:
+    if settings.auth_cache_enabled:
+        with _cache_lock:
+            identity = _token_cache.get(token)
+        if identity is not None:
+            return identity
+
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+
+    email = payload.get("sub")
+    if email is None:
+        return None
+
+    identity = {"email": email, "role": payload.get("role"), "exp": payload.get("exp")}
+    if settings.auth_cache_enabled:
+        with _cache_lock:
+            _token_cache[token] = identity
+    return identity
+
+
+async def _load_user(email: str) -> Optional[Dict[str, Any]]:
+    if settings.auth_cache_enabled:
+        with _cache_lock:
+            user = _user_cache.get(email)
+        if user is not None:
+            return user
+
+    doc = await user_collection.find_one({"email": email}, {"_id": 0, "email": 1, "full_name": 1, "role": 1})
+    if doc is None:
+        return None
+
+    user = {
+        "email": doc["email"],
+        "full_name": doc.get("full_name"),
+        "role": doc.get("role", "user"),
+    }
+    if settings.auth_cache_enabled:
+        with _cache_lock:
+            _user_cache[email] = user
+    return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """
+    Decodifica el token JWT y devuelve la identidad del usuario actual.
+    Lanza 401 si el token es inválido, ha expirado o el usuario no existe.
+
+    Los tokens verificados se guardan hasta su `exp` y los usuarios con un TTL
+    corto, así una carga del dashboard no consulta Mongo en cada widget.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Token inválido o no proporcionado",
+        detail="Credenciales inválidas o token expirado",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    identity = _verify_token(token)
+    if identity is None:
         raise credentials_exception
 
-    user = user_collection.find_one({"email": email})
+    user = await _load_user(identity["email"])
     if user is None:
         raise credentials_exception
 
-    return {
-        "email": user["email"],
-        "full_name": user.get("full_name"),
-        "role": user.get("role", "user")
-    }
+    return dict(user)
@@ -0,0 +1,182 @@
+# app/utils/indexes.py
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from app.config import settings
+from app.utils.db import get_db
+
+
+def index_specs() -> Dict[str, List[IndexModel]]:
+    """
+    Índices requeridos por las rutas calientes, agrupados por colección.
+    """
+    return {
+        "financial_data": [
+            # Un registro por usuario y fecha. Parcial: los registros antiguos que
+            # solo tienen `date` (record_date nulo) no colisionan entre sí.
+            IndexModel([("user_email", ASCENDING), ("record_date", ASCENDING)],
+                       unique=True, name="user_email_record_date_unique",
+                       partialFilterExpression={"record_date": {"$type": "date"}}),
+            # El parcial no sirve consultas sin filtro de fecha: el historial
+            # (ordenado por record_date, _id, con los antiguos primero) usa este.
+            IndexModel([("user_email", ASCENDING), ("record_date", ASCENDING), ("_id", ASCENDING)],
+                       name="user_email_record_date_id"),
+        ],
+        "ai_cache": [
+            IndexModel([("user_email", ASCENDING), ("type", ASCENDING)], name="user_email_type"),
+            IndexModel([("updated_at", ASCENDING)],
+                       expireAfterSeconds=settings.ai_cache_ttl_seconds, name="updated_at_ttl"),
+        ],
+        "user_aggregates": [
+            IndexModel([("user_email", ASCENDING)], unique=True, name="user_email_unique"),
+        ],
+        "financial_rollups": [
+            # Un bucket por usuario, granularidad e inicio de periodo; sirve también los rangos.
+            IndexModel([("user_email", ASCENDING), ("granularity", ASCENDING), ("bucket_start", ASCENDING)],
+                       unique=True, name="user_email_granularity_bucket_start_unique"),
+        ],
+        "llm_prompt_cache": [
+            IndexModel([("created_at", ASCENDING)],
+                       expireAfterSeconds=settings.prompt_cache_ttl_seconds, name="created_at_ttl"),
+            IndexModel([("last_hit_at", ASCENDING)], name="last_hit_at"),
+        ],
+        "ai_jobs": [
+            # Un solo job pendiente por usuario: las escrituras se fusionan en él.
+            IndexModel([("user_email", ASCENDING)], unique=True, name="user_email_pending_unique",
+                       partialFilterExpression={"status": "pending"}),
+            IndexModel([("status", ASCENDING), ("run_after", ASCENDING)], name="status_run_after"),
+            IndexModel([("user_email", ASCENDING), ("status", ASCENDING)], name="user_email_status"),
+            IndexModel([("finished_at", ASCENDING)],
+                       expireAfterSeconds=settings.ai_jobs_retention_seconds, name="finished_at_ttl"),
+        ],
+        "users": [
+            IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        ],
+    }
+
+
+# Índices únicos cuyo fallo solo se registra: este backend no escribe en
+# `users`, así que unos emails duplicados antiguos no deben retener el arranque.
+OPTIONAL_UNIQUE = {"users"}
+
+
+def has_unique_index(models: List[IndexModel]) -> bool:
+    return any(model.document.get("unique") for model in models)
+
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Crea los índices de forma idempotente. Se intentan todas las colecciones;
+    un fallo en una sin índices únicos (o en `OPTIONAL_UNIQUE`) solo se
+    registra, pero si falla una con índice único (por ejemplo, duplicados
+    previos) se lanza RuntimeError: la detección de duplicados y las
+    escrituras idempotentes dependen de ellos. `unique_index_collisions`
+    muestra esos duplicados antes de desplegar.
+    """
+    db = get_db()
+    created: Dict[str, List[str]] = {}
+    failed_unique: Dict[str, str] = {}
+    for collection_name, models in index_specs().items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(models)
+        except PyMongoError as e:
+            print(f"[INDEX] No se pudieron crear índices en {collection_name}: {e}")
+            if has_unique_index(models) and collection_name not in OPTIONAL_UNIQUE:
+                failed_unique[collection_name] = str(e)
+    print(f"[INDEX] Índices verificados: {created}")
+    if failed_unique:
+        raise RuntimeError(f"Faltan índices únicos en {', '.join(sorted(failed_unique))}: {failed_unique}")
+    return created
+
+
+async def unique_index_collisions(limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Claves repetidas que impedirían crear cada índice único, como
+    `colección.índice` -> ejemplos `{key, count}`. Igual que en el índice, un
+    campo ausente cuenta como null y los índices parciales solo miran los
+    documentos de su filtro.
+    """
+    db = get_db()
+    collisions: Dict[str, List[Dict[str, Any]]] = {}
+    for collection_name, models in index_specs().items():
+        for model in models:
+            spec = model.document
+            if not spec.get("unique"):
+                continue
+            key = {field.replace(".", "_"): {"$ifNull": [f"${field}", None]} for field in spec["key"]}
+            pipeline = [
+                {"$match": spec.get("partialFilterExpression", {})},
+                {"$group": {"_id": key, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+                {"$limit": limit},
+            ]
+            cursor = await db[collection_name].aggregate(pipeline, allowDiskUse=True)
+            dupes = await cursor.to_list(limit)
+            if dupes:
+                collisions[f"{collection_name}.{spec['name']}"] = [{"key": d["_id"], "count": d["count"]} for d in dupes]
+    return collisions
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    for key in ("inputStage", "queryPlan"):
+        stages.extend(_plan_stages(plan.get(key)))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def winning_plan_stages(explain: Dict[str, Any]) -> List[str]:
+    return _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+async def hot_query_plans(user_email: str = "explain@finscope.ai") -> Dict[str, List[str]]:
+    """
+    Ejecuta `explain()` sobre las consultas calientes y devuelve las etapas
+    del plan ganador de cada una.
+    """
+    db = get_db()
+    now = datetime.utcnow()
+    cursors = {
+        "financial_history": db["financial_data"].find({"user_email": user_email}).sort("record_date", 1),
+        "financial_history_range": db["financial_data"].find({
+            "user_email": user_email,
+            "record_date": {"$gte": now - timedelta(days=365), "$lte": now},
+        }).sort("record_date", 1),
+        "financial_duplicate_check": db["financial_data"].find({"user_email": user_email, "record_date": now}),
+        "ai_cache_lookup": db["ai_cache"].find({
+            "user_email": user_email, "type": "summary",
+            "updated_at": {"$gte": now - timedelta(hours=24)},
+        }),
+        "user_aggregates_lookup": db["user_aggregates"].find({"user_email": user_email}),
+        "financial_rollups_range": db["financial_rollups"].find({
+            "user_email": user_email, "granularity": "month",
+            "bucket_start": {"$gte": now - timedelta(days=5 * 365), "$lte": now},
+        }).sort("bucket_start", 1),
+        "user_lookup": db["users"].find({"email": user_email}),
+        "ai_jobs_claim": db["ai_jobs"].find({"$or": [
+            {"status": "pending", "run_after": {"$lte": now}},
+            {"status": "running", "locked_until": {"$lt": now}},
+        ]}).sort("run_after", 1),
+        "ai_jobs_active": db["ai_jobs"].find({
+            "user_email": user_email, "status": {"$in": ["pending", "running"]}, "artifacts": "summary",
+        }),
+    }
+    return {name: winning_plan_stages(await cursor.explain()) for name, cursor in cursors.items()}
+
+
+async def queries_without_index(user_email: str = "explain@finscope.ai") -> Dict[str, List[str]]:
+    """
+    Consultas calientes cuyo plan ganador no usa IXSCAN (vacío si todo está indexado).
+    """
+    plans = await hot_query_plans(user_email)
+    return {
+        name: stages
+        for name, stages in plans.items()
+        if "IXSCAN" not in stages and "IDHACK" not in stages
+    }
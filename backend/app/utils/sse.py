@@ -0,0 +1,33 @@
+# app/utils/sse.py
+import json
+from typing import Any, AsyncIterator, Tuple
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Evita que nginx acumule la respuesta antes de enviarla.
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """
+    Envía como Server-Sent Events los pares (evento, datos) de `events`. Un
+    error a mitad del stream ya no puede cambiar el status, así que se
+    informa con un evento `error`.
+    """
+    async def body():
+        try:
+            async for event, data in events:
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"[SSE] Error durante el stream: {e}")
+            detail = e.detail if hasattr(e, "detail") else str(e)
+            yield sse_event("error", {"detail": detail})
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers=SSE_HEADERS)
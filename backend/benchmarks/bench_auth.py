@@ -0,0 +1,70 @@
+# benchmarks/bench_auth.py
+"""
+Mide la latencia por petición de una ruta /ai/* autenticada con y sin la
+caché de tokens/usuarios de `get_current_user`.
+
+Usa la base de datos configurada en .env: crea (si no existe) un usuario de
+prueba y llama N veces a GET /ai/cache/stats, que solo depende de la
+autenticación, para aislar el costo del dependency.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_auth --requests 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.main import app
+from app.utils.db import user_collection
+from app.utils.dependencies import clear_auth_caches
+from app.utils.jwt_handler import create_access_token
+
+BENCH_EMAIL = "bench-auth@finscope.ai"
+
+
+def measure(client: TestClient, headers: dict, requests: int, cache_enabled: bool) -> dict:
+    settings.auth_cache_enabled = cache_enabled
+    clear_auth_caches()
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/ai/cache/stats", headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(user_collection.update_one(
+        {"email": BENCH_EMAIL},
+        {"$setOnInsert": {"email": BENCH_EMAIL, "full_name": "Bench", "role": "user", "password": "-"}},
+        upsert=True,
+    ))
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': BENCH_EMAIL, 'role': 'user'})}"}
+    client = TestClient(app)
+
+    uncached = measure(client, headers, args.requests, cache_enabled=False)
+    cached = measure(client, headers, args.requests, cache_enabled=True)
+    report = {
+        "requests": args.requests,
+        "without_cache": uncached,
+        "with_cache": cached,
+        "p50_saved_ms": round(uncached["p50_ms"] - cached["p50_ms"], 3),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/bench_columnar.py
+"""
+Compara la analítica fila a fila sobre dicts (sumas con generadores por
+campo y comprensiones `valid_rows` para escenario y riesgo, como hacían las
+rutas) contra el cargador columnar con operaciones vectorizadas.
+
+- `dicts`: analítica original sobre la lista de documentos.
+- `columnar`: conversión a columnas + analítica vectorizada.
+- `vectorized`: solo la analítica, con las columnas ya construidas.
+
+Con `--mongo` además siembra un usuario temporal y mide la carga desde Mongo:
+documentos completos con `{"_id": 0}` contra `load_financial_columns`.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_columnar --rows 100 10000 1000000
+    python -m benchmarks.bench_columnar --rows 10000 --mongo
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+import numpy as np
+from app.services.aggregates_service import aggregates_from_columns, risk_statistics, scenario_baseline
+from app.services.columnar import AMOUNT_FIELDS, FinancialColumns, column_totals
+
+
+def make_records(n: int, seed: int = 42) -> list:
+    rng = np.random.default_rng(seed)
+    income = rng.normal(3000, 500, n)
+    expenses = rng.normal(2000, 400, n)
+    start = datetime(2015, 1, 1)
+    records = []
+    for i in range(n):
+        record = {
+            "income": float(income[i]),
+            "expenses": float(expenses[i]),
+            "savings": float(income[i] - expenses[i]),
+            "record_date": start + timedelta(hours=i),
+            "category": ("rent", "food", "leisure", "investment")[i % 4],
+        }
+        if i % 50 == 0:
+            del record["expenses"]
+        records.append(record)
+    return records
+
+
+def dict_analytics(rows: list) -> dict:
+    total_income = sum(r.get("income", 0) for r in rows)
+    total_exp = sum(r.get("expenses", 0) for r in rows)
+    total_save = sum(r.get("savings", 0) for r in rows)
+
+    valid_rows = [r for r in rows if r.get("income") is not None and r.get("expenses") is not None
+                  and r.get("savings") is not None]
+    avg_income = sum(r["income"] for r in valid_rows) / len(valid_rows)
+    avg_expenses = sum(r["expenses"] for r in valid_rows) / len(valid_rows)
+    avg_savings = sum(r["savings"] for r in valid_rows) / len(valid_rows)
+
+    risk_rows = [r for r in rows if r.get("income", 0) > 0 and r.get("savings") is not None]
+    ratios = [r["savings"] / r["income"] for r in risk_rows]
+    volatility = statistics.pstdev([r["savings"] for r in risk_rows])
+    return {
+        "totals": (total_income, total_exp, total_save),
+        "averages": (avg_income, avg_expenses, avg_savings),
+        "risk": (sum(ratios) / len(ratios), volatility),
+    }
+
+
+def columnar_analytics(columns: FinancialColumns) -> dict:
+    totals = column_totals(columns)
+    aggregates = aggregates_from_columns(columns)
+    baseline = scenario_baseline(aggregates)
+    risk = risk_statistics(aggregates)
+    return {
+        "totals": tuple(totals[f] for f in AMOUNT_FIELDS),
+        "averages": tuple(baseline[f"avg_{f}"] for f in AMOUNT_FIELDS),
+        "risk": (risk["avg_save_ratio"], risk["volatility"]),
+    }
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def mongo_load(records: list) -> dict:
+    from app.services.columnar import load_financial_columns
+    from app.utils.db import close_mongo, connect_mongo, financial_collection
+
+    await connect_mongo()
+    user_email = f"bench-columnar-{uuid4().hex[:8]}@finscope.ai"
+    try:
+        await financial_collection.insert_many([{**r, "user_email": user_email} for r in records], ordered=False)
+
+        start = time.perf_counter()
+        await financial_collection.find({"user_email": user_email}, {"_id": 0}).to_list(None)
+        full_docs = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        await load_financial_columns(user_email)
+        columns = (time.perf_counter() - start) * 1000
+        return {"full_docs_ms": round(full_docs, 2), "columnar_ms": round(columns, 2)}
+    finally:
+        await financial_collection.delete_many({"user_email": user_email})
+        await close_mongo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo", action="store_true", help="Medir también la carga desde Mongo")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.rows:
+        records = make_records(n)
+        columns = FinancialColumns.from_records(records)
+        legacy, vectorized = dict_analytics(records), columnar_analytics(columns)
+        for key in legacy:
+            assert np.allclose(legacy[key], vectorized[key], rtol=1e-9), key
+
+        repeat = args.repeat if n < 1_000_000 else 1
+        result = {
+            "rows": n,
+            "dicts_ms": round(best_of(lambda: dict_analytics(records), repeat), 3),
+            "columnar_ms": round(best_of(lambda: columnar_analytics(FinancialColumns.from_records(records)), repeat), 3),
+            "vectorized_ms": round(best_of(lambda: columnar_analytics(columns), repeat), 3),
+        }
+        if args.mongo:
+            result["mongo"] = asyncio.run(mongo_load(records))
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
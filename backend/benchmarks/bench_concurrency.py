@@ -0,0 +1,129 @@
+# benchmarks/bench_concurrency.py
+"""
+Prueba de carga de un solo worker: dispara peticiones concurrentes contra
+rutas que leen Mongo y reporta throughput y latencias por nivel de
+concurrencia.
+
+Con rutas síncronas cada petición ocupa un hilo del threadpool de Starlette
+(40 por defecto), así que el throughput se aplana al pasar ese límite; con el
+cliente asíncrono el techo lo marca `mongo_max_pool_size`.
+
+Sin `--url` levanta `uvicorn app.main:app --workers 1` con el árbol actual.
+Para comparar con otra versión, arráncala aparte y apunta `--url` a ella.
+
+Uso (desde backend/, con Mongo disponible):
+    python -m benchmarks.bench_concurrency --concurrency 1 16 64 256 --requests 2000
+    python -m benchmarks.bench_concurrency --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+import httpx
+
+SEED_RECORDS = 200
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_server():
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{url}/docs", timeout=0.5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+async def seed(client: httpx.AsyncClient) -> dict:
+    """
+    Registra un usuario nuevo con `SEED_RECORDS` registros y devuelve sus cabeceras.
+    """
+    email = f"bench-{uuid4().hex[:8]}@finscope.ai"
+    await client.post("/auth/register", json={"email": email, "password": "bench-pass", "full_name": "Bench"})
+    token = (await client.post("/auth/login", json={"email": email, "password": "bench-pass"})).json()["access_token"]
+    rows = "\n".join(
+        json.dumps({"user_email": email, "income": 1000 + i, "expenses": 600, "savings": 200 + i % 50,
+                    "date": f"{2000 + i // 365}-{1 + (i // 28) % 12:02d}-{1 + i % 28:02d}"})
+        for i in range(SEED_RECORDS)
+    )
+    await client.post("/financial/upload/batch?format=ndjson", content=rows)
+    return {"email": email, "headers": {"Authorization": f"Bearer {token}"}}
+
+
+async def run_level(client: httpx.AsyncClient, user: dict, concurrency: int, requests: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            if i % 2:
+                r = await client.get("/ai/risk-summary", headers=user["headers"])
+            else:
+                r = await client.post("/financial/history?limit=50", json={"user_email": user["email"]})
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += r.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+
+async def bench(url: str, levels, requests: int) -> list:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        user = await seed(client)
+        await run_level(client, user, 8, 100)  # calentamiento
+        return [await run_level(client, user, c, requests) for c in levels]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Servidor ya levantado (por defecto se inicia uno local)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones por nivel")
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(bench(args.url, args.concurrency, args.requests))
+    else:
+        with local_server() as url:
+            results = asyncio.run(bench(url, args.concurrency, args.requests))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_streaming.py
+"""
+Compara el tiempo hasta la respuesta completa de /ai/assistant con el tiempo
+hasta el primer fragmento (TTFT) de /ai/assistant/stream para las mismas
+preguntas.
+
+Cada pregunta lleva un sufijo único para no acertar en la caché de prompts.
+Requiere Gemini configurado (o un servidor con un backend de modelos falso).
+
+Uso (desde backend/, con Mongo disponible):
+    python -m benchmarks.bench_streaming --rounds 10
+    python -m benchmarks.bench_streaming --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from uuid import uuid4
+import httpx
+from benchmarks.bench_concurrency import local_server, seed
+
+QUESTION = "¿Cómo puedo mejorar mi tasa de ahorro el próximo trimestre?"
+
+
+async def full_response(client: httpx.AsyncClient, headers: dict) -> float:
+    start = time.perf_counter()
+    r = await client.post("/ai/assistant", json={"message": f"{QUESTION} [{uuid4().hex[:6]}]"}, headers=headers)
+    r.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+async def streamed_response(client: httpx.AsyncClient, headers: dict) -> tuple:
+    """
+    Devuelve (ttft_ms, total_ms) medidos en el cliente.
+    """
+    start = time.perf_counter()
+    ttft = None
+    body = {"message": f"{QUESTION} [{uuid4().hex[:6]}]"}
+    async with client.stream("POST", "/ai/assistant/stream", json=body, headers=headers) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if ttft is None and line == "event: delta":
+                ttft = (time.perf_counter() - start) * 1000
+    total = (time.perf_counter() - start) * 1000
+    return (ttft if ttft is not None else total), total
+
+
+def _summary(values) -> dict:
+    values = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(values), 1),
+        "p95_ms": round(values[max(int(len(values) * 0.95) - 1, 0)], 1),
+    }
+
+
+async def bench(url: str, rounds: int) -> dict:
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        user = await seed(client)
+        full, ttft, streamed_total = [], [], []
+        for _ in range(rounds):
+            full.append(await full_response(client, user["headers"]))
+            first, total = await streamed_response(client, user["headers"])
+            ttft.append(first)
+            streamed_total.append(total)
+    return {
+        "rounds": rounds,
+        "full_response": _summary(full),
+        "stream_ttft": _summary(ttft),
+        "stream_total": _summary(streamed_total),
+        "ttft_vs_full_ratio": round(statistics.median(ttft) / statistics.median(full), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Servidor ya levantado (por defecto se inicia uno local)")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(bench(args.url, args.rounds))
+    else:
+        with local_server() as url:
+            results = asyncio.run(bench(url, args.rounds))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# benchmarks/bench_suite.py
+"""
+Suite reproducible de las rutas calientes contra historiales sintéticos de
+distinto tamaño. Reporta por ruta y tamaño las latencias p50/p95/p99, el
+throughput y el RSS máximo del proceso, en JSON.
+
+- Datos: un usuario `bench-suite-<n>@finscope.ai` por tamaño, con registros
+  generados con semilla fija y cargados por el mismo camino que la carga
+  masiva (`insert_batch`: registros, agregados y rollups).
+- Mongo: `--backend mongo` usa `MONGO_URI` (los usuarios ya sembrados se
+  reutilizan; `--reseed` los regenera). `--backend mongomock` trabaja en
+  memoria sin servidor (requiere `mongomock-motor`). Mongomock no tiene
+  índices y copia cada documento (~0.1 ms por documento leído), así que por
+  defecto solo mide 10 y 1k registros: sirve para comparar corridas entre
+  sí en CI, no como número absoluto.
+- Gemini: se reemplaza por `LocalProvider` (respuestas deterministas,
+  `--llm-latency` segundos por llamada con `--llm-jitter` log-normal y
+  `--llm-error-rate` de fallos) o, con `--replay`, por las respuestas y
+  latencias grabadas con `LLM_PROVIDER=record`. La caché de prompts se
+  desactiva para que cada llamada cueste.
+- Las peticiones van en proceso (httpx + ASGITransport), sin red. Los logs
+  de la app van a stderr; stdout lleva solo el JSON.
+
+Con `--compare base.json` compara contra una corrida anterior y termina con
+código 1 si alguna ruta empeoró su `--metric` más de `--threshold`
+(fracción). Con `--current` compara dos archivos sin volver a medir.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_suite --backend mongomock --output base.json
+    python -m benchmarks.bench_suite --sizes 10 1000 100000 1000000 --requests 30
+    python -m benchmarks.bench_suite --backend mongomock --compare base.json --threshold 0.2
+    python -m benchmarks.bench_suite --current new.json --compare base.json
+    python -m benchmarks.bench_suite --replay recordings/llm.jsonl --endpoints ai_assistant
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+import httpx
+import numpy as np
+
+DEFAULT_SIZES = [10, 1_000, 100_000, 1_000_000]
+MOCK_SIZES = [10, 1_000]
+SEED_BATCH = 10_000
+HISTORY_END = datetime(2025, 1, 1)
+HISTORY_SPAN = timedelta(days=20 * 365)
+CATEGORIES = ("rent", "food", "transport", "leisure", "investment", "health")
+
+ENDPOINTS = {
+    "financial_history": ("POST", "/financial/history", "email"),
+    "financial_history_rollup": ("POST", "/financial/history?granularity=auto", "email"),
+    "ai_scenario": ("POST", "/ai/scenario", {"delta_income": 5, "delta_expenses": -3}),
+    "ai_risk_summary": ("GET", "/ai/risk-summary", None),
+    "ai_forecast_history": ("GET", "/ai/forecast/history", None),
+    "ai_assistant": ("POST", "/ai/assistant", {"message": "¿Cómo va mi ahorro este año?"}),
+}
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+class _MockCollection:
+    # mongomock-motor devuelve el cursor de aggregate sin await; PyMongo async lo pide.
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def aggregate(self, pipeline, *args, **kwargs):
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+
+class _MockDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return _MockCollection(self._database[name])
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+class MockClient:
+    """
+    Cliente mongomock con la interfaz de AsyncMongoClient que usa la app.
+    """
+
+    def __init__(self):
+        from mongomock_motor import AsyncMongoMockClient
+
+        self._client = AsyncMongoMockClient()
+
+    def __getitem__(self, name):
+        return _MockDatabase(self._client[name])
+
+    async def aconnect(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def setup_environment(args) -> None:
+    """
+    Ajusta la app para medir: Mongo elegido, Gemini falso y sin trabajos en
+    segundo plano. Debe llamarse antes de importar `app.main`.
+    """
+    from app.config import settings
+    from app.services import llm_client
+    from app.services.llm_providers import LocalProvider, ReplayProvider
+    from app.services.model_registry import MODEL_CATALOG, ModelRegistry
+    from app.utils import db
+
+    settings.prompt_cache_enabled = False
+    settings.ai_jobs_enabled = False
+    if args.backend == "mongomock":
+        client = MockClient()
+        db.create_client = lambda: client
+
+    provider = LocalProvider(latency_ms=args.llm_latency * 1000, jitter=args.llm_jitter,
+                             error_rate=args.llm_error_rate, seed=42)
+    if args.replay:
+        # Los prompts no grabados (otros datos sintéticos) caen en el local.
+        provider = ReplayProvider(args.replay, fallback=provider)
+    llm_client.model_registry = ModelRegistry(MODEL_CATALOG, factory=provider.create_model)
+
+
+def make_records(user_email: str, n: int, seed: int = 42) -> List[dict]:
+    """
+    `n` registros con fechas únicas que terminan en HISTORY_END: diarios si
+    caben en 20 años, más densos si no.
+    """
+    rng = np.random.default_rng(seed)
+    income = np.round(rng.normal(3000, 500, n), 2)
+    expenses = np.round(rng.normal(2000, 400, n), 2)
+    categories = rng.integers(0, len(CATEGORIES), n)
+    step = min(timedelta(days=1), HISTORY_SPAN / n)
+    start = HISTORY_END - step * n
+    return [
+        {
+            "user_email": user_email,
+            "income": float(income[i]),
+            "expenses": float(expenses[i]),
+            "savings": float(round(income[i] - expenses[i], 2)),
+            "record_date": start + step * i,
+            "category": CATEGORIES[categories[i]],
+            "description": f"registro {i}",
+        }
+        for i in range(n)
+    ]
+
+
+async def seed_user(n: int, reseed: bool) -> str:
+    from app.services.ingestion_service import IngestionReport, insert_batch
+    from app.utils.db import financial_collection, financial_rollups_collection, user_aggregates_collection, user_collection
+
+    user_email = f"bench-suite-{n}@finscope.ai"
+    existing = await financial_collection.count_documents({"user_email": user_email})
+    if existing == n and not reseed:
+        return user_email
+
+    for collection in (financial_collection, financial_rollups_collection, user_aggregates_collection):
+        await collection.delete_many({"user_email": user_email})
+    await user_collection.update_one(
+        {"email": user_email},
+        {"$setOnInsert": {"email": user_email, "full_name": "Bench", "role": "user", "password": "-"}},
+        upsert=True,
+    )
+    report = IngestionReport(max_reported=10)
+    records = make_records(user_email, n)
+    for i in range(0, n, SEED_BATCH):
+        await insert_batch(list(enumerate(records[i:i + SEED_BATCH], start=i)), report)
+    print(f"[BENCH] {user_email}: {report.inserted} registros sembrados", file=sys.stderr)
+    return user_email
+
+
+class PeakRSS:
+    """
+    Muestrea el RSS actual del proceso mientras dura el bloque (Linux:
+    /proc/self/statm). En otros sistemas usa el máximo histórico de getrusage.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _current(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+async def measure(client: httpx.AsyncClient, name: str, user_email: str, headers: dict, args) -> Dict[str, Any]:
+    method, path, body = ENDPOINTS[name]
+    payload = {"user_email": user_email} if body == "email" else body
+
+    async def one() -> tuple:
+        start = time.perf_counter()
+        response = await client.request(method, path, json=payload, headers=headers)
+        await response.aread()
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    await one()  # calentamiento: cachés, conexiones, JIT de numpy
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + args.max_seconds
+
+    async def worker():
+        nonlocal errors
+        while len(latencies) < args.requests and (time.perf_counter() < deadline or len(latencies) < args.min_requests):
+            async with semaphore:
+                elapsed, status = await one()
+            latencies.append(elapsed)
+            errors += status >= 400
+
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+async def run_suite(args) -> Dict[str, Any]:
+    from app.main import app
+    from app.utils.db import close_mongo, connect_mongo
+    from app.utils.indexes import ensure_indexes
+    from app.utils.jwt_handler import create_access_token
+
+    await connect_mongo()
+    if args.backend == "mongo":
+        await ensure_indexes()
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for n in args.sizes:
+                user_email = await seed_user(n, args.reseed)
+                headers = {"Authorization": f"Bearer {create_access_token({'sub': user_email, 'role': 'user'})}"}
+                for name in args.endpoints:
+                    result = {"records": n, **await measure(client, name, user_email, headers, args)}
+                    print(f"[BENCH] {name} n={n}: p50={result['p50_ms']} ms p95={result['p95_ms']} ms",
+                          file=sys.stderr)
+                    results.append(result)
+    finally:
+        await close_mongo()
+
+    return {
+        "meta": {
+            "backend": args.backend,
+            "llm": {"replay": args.replay, "latency_s": args.llm_latency,
+                    "jitter": args.llm_jitter, "error_rate": args.llm_error_rate},
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], metric: str, threshold: float) -> Dict[str, Any]:
+    """
+    Cruza los resultados por (ruta, registros). Una ruta regresiona si su
+    `metric` creció más que `threshold` (0.2 = +20 %) respecto a la base.
+    """
+    base = {(r["endpoint"], r["records"]): r for r in baseline["results"]}
+    rows, regressions = [], []
+    for result in current["results"]:
+        key = (result["endpoint"], result["records"])
+        if key not in base:
+            continue
+        before, after = base[key][metric], result[metric]
+        change = (after - before) / before if before else 0.0
+        row = {"endpoint": key[0], "records": key[1], "baseline": before, "current": after,
+               "change": round(change, 4)}
+        rows.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return {"metric": metric, "threshold": threshold, "compared": rows, "regressions": regressions}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongo", "mongomock"), default="mongo")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help=f"Registros por usuario (por defecto {DEFAULT_SIZES}; {MOCK_SIZES} con mongomock)")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=50, help="Peticiones medidas por ruta y tamaño")
+    parser.add_argument("--min-requests", type=int, default=5, help="Mínimo aunque se agote --max-seconds")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="Presupuesto de tiempo por ruta y tamaño")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Segundos por llamada al modelo local")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Desviación log-normal de la latencia")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fracción de llamadas que fallan (503)")
+    parser.add_argument("--replay", help="Grabación JSONL de LLM_PROVIDER=record a reproducir")
+    parser.add_argument("--reseed", action="store_true", help="Regenerar los usuarios sintéticos")
+    parser.add_argument("--output", help="Guardar el resultado JSON en este archivo")
+    parser.add_argument("--compare", help="JSON base contra el que detectar regresiones")
+    parser.add_argument("--current", help="JSON ya medido a comparar (no vuelve a medir)")
+    parser.add_argument("--metric", choices=COMPARED_METRICS, default="p95_ms")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Empeoramiento máximo tolerado (fracción)")
+    args = parser.parse_args()
+    args.sizes = args.sizes or (MOCK_SIZES if args.backend == "mongomock" else DEFAULT_SIZES)
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            setup_environment(args)
+            report = asyncio.run(run_suite(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if not args.compare:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    with open(args.compare) as f:
+        comparison = compare(report, json.load(f), args.metric, args.threshold)
+    print(json.dumps(comparison, indent=2))
+    return 1 if comparison["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
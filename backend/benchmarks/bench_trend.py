@@ -0,0 +1,90 @@
+# benchmarks/bench_trend.py
+"""
+Micro-benchmark del motor de tendencia.
+
+Compara el tiempo de importación y la latencia de ajuste de la implementación
+anterior (scikit-learn LinearRegression) contra la forma cerrada de
+`app.services.trend_engine`, y mide el modo por lotes usuarios × periodos.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_trend --periods 36 --users 10000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+
+def import_time(statement: str, repeat: int = 3) -> float:
+    """
+    Mejor tiempo (s) de un intérprete nuevo ejecutando `statement`.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def per_call_latency(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--periods", type=int, default=36)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    from sklearn.linear_model import LinearRegression
+    from app.services.trend_engine import fit_trend, fit_trends_batch
+
+    rng = np.random.default_rng(42)
+    series = rng.normal(400, 120, size=args.periods).tolist()
+    matrix = rng.normal(400, 120, size=(args.users, args.periods))
+
+    def sklearn_fit(values=series):
+        x = np.arange(len(values)).reshape(-1, 1)
+        model = LinearRegression().fit(x, np.array(values))
+        return float(model.predict([[len(values) + 1]])[0])
+
+    batch_start = time.perf_counter()
+    fit_trends_batch(matrix)
+    batch_seconds = time.perf_counter() - batch_start
+
+    loop_users = min(args.users, 1000)
+    loop_start = time.perf_counter()
+    for row in matrix[:loop_users]:
+        sklearn_fit(row.tolist())
+    sklearn_loop_per_user = (time.perf_counter() - loop_start) / loop_users
+
+    report = {
+        "import_seconds": {
+            "numpy": import_time("import numpy"),
+            "sklearn_linear_model": import_time("import sklearn.linear_model"),
+            "trend_engine": import_time("import app.services.trend_engine"),
+        },
+        "single_fit_us": {
+            "sklearn": per_call_latency(sklearn_fit, args.repeat) * 1e6,
+            "closed_form": per_call_latency(lambda: fit_trend(series), args.repeat) * 1e6,
+        },
+        "batch": {
+            "users": args.users,
+            "periods": args.periods,
+            "closed_form_total_ms": batch_seconds * 1e3,
+            "closed_form_per_user_us": batch_seconds / args.users * 1e6,
+            "sklearn_loop_per_user_us": sklearn_loop_per_user * 1e6,
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# scripts/check_indexes.py
+"""
+Busca claves duplicadas que impedirían crear los índices únicos, crea los
+índices y confirma con `explain()` que las consultas calientes usan IXSCAN.
+
+Uso (desde backend/):
+    python -m scripts.check_indexes
+"""
+import asyncio
+import sys
+from app.utils.indexes import OPTIONAL_UNIQUE, ensure_indexes, hot_query_plans, unique_index_collisions
+
+
+async def run() -> int:
+    collisions = await unique_index_collisions()
+    for name, examples in collisions.items():
+        for example in examples:
+            print(f"[DUPLICADO] {name}: {example['key']} x{example['count']}")
+    if any(name.split(".")[0] not in OPTIONAL_UNIQUE for name in collisions):
+        # ensure_indexes fallaría y el servicio no llegaría a /ready.
+        return 1
+    await ensure_indexes()
+    failures = 0
+    for name, stages in (await hot_query_plans()).items():
+        indexed = "IXSCAN" in stages or "IDHACK" in stages
+        failures += not indexed
+        print(f"[{'OK' if indexed else 'COLLSCAN'}] {name}: {' <- '.join(stages)}")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
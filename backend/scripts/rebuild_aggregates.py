@@ -0,0 +1,66 @@
+# scripts/rebuild_aggregates.py
+"""
+Recalcula los agregados por usuario (`user_aggregates`) desde los registros
+crudos de `financial_data` e informa las diferencias encontradas. Con
+`--verify` también compara las estadísticas de /ai/scenario, /ai/risk-summary
+y el resumen con las calculadas por los pipelines de agregación. Con
+`--rollups` hace lo mismo con los buckets de `financial_rollups`.
+
+Uso (desde backend/):
+    python -m scripts.rebuild_aggregates --verify            # solo reporta drift
+    python -m scripts.rebuild_aggregates                     # reconstruye todo
+    python -m scripts.rebuild_aggregates --user a@demo.com   # un usuario
+    python -m scripts.rebuild_aggregates --rollups           # también las rollups
+"""
+import argparse
+import asyncio
+import sys
+from app.utils.db import financial_collection
+from app.services.aggregates_service import verify_user_aggregates, verify_user_statistics, rebuild_user_aggregates
+from app.services.rollups_service import rebuild_user_rollups, verify_user_rollups
+
+
+async def run(args) -> int:
+    users = args.user or sorted(await financial_collection.distinct("user_email"))
+    drifted = 0
+
+    for user_email in users:
+        drift = await verify_user_aggregates(user_email)
+        if drift:
+            drifted += 1
+            print(f"[DRIFT] {user_email}")
+            for field, (stored, expected) in sorted(drift.items()):
+                print(f"    {field}: guardado={stored} esperado={expected}")
+        if not args.verify and drift:
+            await rebuild_user_aggregates(user_email)
+        stats_drift = await verify_user_statistics(user_email) if args.verify and not drift else {}
+        if stats_drift:
+            drifted += 1
+            print(f"[STATS] {user_email}")
+            for field, (derived, expected) in sorted(stats_drift.items()):
+                print(f"    {field}: derivado={derived} pipeline={expected}")
+        rollups_drift = await verify_user_rollups(user_email) if args.rollups else {}
+        if rollups_drift:
+            drifted += 1
+            print(f"[ROLLUPS] {user_email}: {len(rollups_drift)} buckets con drift")
+            for bucket, fields in sorted(rollups_drift.items())[:10]:
+                print(f"    {bucket}: {fields}")
+            if not args.verify:
+                await rebuild_user_rollups(user_email)
+
+    action = "verificados" if args.verify else "reconstruidos"
+    print(f"[AGGREGATES] {len(users)} usuarios {action}, {drifted} con drift.")
+    return 1 if args.verify and drifted else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", help="Email del usuario (repetible)")
+    parser.add_argument("--rollups", action="store_true", help="Verificar/reconstruir también las rollups")
+    parser.add_argument("--verify", action="store_true", help="No escribe; termina con código 1 si hay drift")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from app.services.llm_providers import ChunkedStream, TextResponse
+
+
+class FakeModelBackend:
+    """
+    Doble de pruebas que imita `genai.GenerativeModel` sin red, para probar el
+    registro de modelos (cortocircuitos, ruteo) con latencias y fallos
+    inyectados.
+
+        backend = FakeModelBackend()
+        backend.set_latency("gemini-2.5-pro", 2.0)
+        backend.fail("gemini-2.5-pro", times=3)
+        registry = ModelRegistry(MODEL_CATALOG, factory=backend.factory)
+
+    Las latencias y fallos se pueden cambiar en caliente; los objetos de
+    modelo ya creados leen la configuración en cada llamada. Con
+    `stream=True` la latencia es la del primer fragmento y luego se emite un
+    fragmento de `chunk_size` caracteres cada `chunk_delay` segundos.
+    """
+
+    def __init__(
+        self,
+        default_latency: float = 0.0,
+        response: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 16,
+        chunk_delay: float = 0.0,
+    ):
+        self.default_latency = default_latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.response = response or {"insight": "respuesta simulada", "highlights": [], "actions": []}
+        self.latencies: Dict[str, float] = {}
+        self.pending_failures: Dict[str, int] = {}
+        self.created: List[str] = []
+        self.calls: List[str] = []
+
+    def set_latency(self, model: str, seconds: float):
+        self.latencies[model] = seconds
+
+    def fail(self, model: str, times: int = 1):
+        """
+        Las próximas `times` llamadas a `model` lanzan error (-1 = siempre).
+        """
+        self.pending_failures[model] = times
+
+    def recover(self, model: str):
+        self.pending_failures.pop(model, None)
+
+    def factory(self, model_name: str) -> "FakeGenerativeModel":
+        self.created.append(model_name)
+        return FakeGenerativeModel(model_name, self)
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str, backend: FakeModelBackend):
+        self.model_name = model_name
+        self.backend = backend
+
+    async def generate_content_async(self, prompt, generation_config=None, stream: bool = False):
+        backend = self.backend
+        backend.calls.append(self.model_name)
+        await asyncio.sleep(backend.latencies.get(self.model_name, backend.default_latency))
+
+        remaining = backend.pending_failures.get(self.model_name, 0)
+        if remaining:
+            if remaining > 0:
+                backend.pending_failures[self.model_name] = remaining - 1
+            raise RuntimeError(f"503 {self.model_name} no disponible (simulado)")
+        text = json.dumps(backend.response, ensure_ascii=False)
+        if stream:
+            return ChunkedStream(text, backend.chunk_size, backend.chunk_delay)
+        return TextResponse(text)
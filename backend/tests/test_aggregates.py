@@ -0,0 +1,110 @@
+import asyncio
+import math
+from datetime import datetime
+import numpy as np
+import pytest
+from app.services.aggregates_service import (
+    add_record_to_aggregates,
+    apply_increments,
+    compute_aggregates,
+    find_drift,
+    get_user_aggregates,
+    merge_increments,
+    remove_record_from_aggregates,
+    risk_statistics,
+)
+from app.utils.db import financial_collection, user_aggregates_collection
+
+USER = "aggregates-bookkeeping@demo.com"
+
+RECORDS = [
+    {"income": 2500.0, "expenses": 1000.0, "savings": 500.0, "record_date": datetime(2024, 1, 1)},
+    {"income": 3100.5, "expenses": 1800.25, "savings": 700.0, "record_date": datetime(2024, 2, 1)},
+    {"income": 0, "expenses": 300, "savings": -50, "record_date": datetime(2024, 3, 1)},
+    {"income": 1900, "savings": 120.75, "record_date": datetime(2023, 12, 1)},
+]
+NEW = {"income": 4000.0, "expenses": 1500.0, "savings": 900.0, "record_date": datetime(2024, 6, 1)}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def reset():
+    await financial_collection.delete_many({"user_email": USER})
+    await user_aggregates_collection.delete_many({"user_email": USER})
+
+
+@pytest.fixture(autouse=True)
+def clean_user():
+    run(reset())
+    yield
+    run(reset())
+
+
+async def seed_legacy():
+    # Usuario con registros pero sin documento de agregados.
+    await financial_collection.insert_many([{**r, "user_email": USER} for r in RECORDS])
+
+
+async def insert(record):
+    doc = {**record, "user_email": USER}
+    await financial_collection.insert_one(doc)
+    return doc
+
+
+def drift(expected_records):
+    return find_drift(run(get_user_aggregates(USER)), compute_aggregates(expected_records))
+
+
+def test_insert_then_read_matches_rebuild():
+    run(seed_legacy())
+    run(get_user_aggregates(USER))
+    run(add_record_to_aggregates(run(insert(NEW))))
+    assert drift(RECORDS + [NEW]) == {}
+
+
+def test_delete_then_read_matches_rebuild():
+    run(seed_legacy())
+    run(get_user_aggregates(USER))
+    doc = run(financial_collection.find_one({"user_email": USER, "record_date": RECORDS[0]["record_date"]}))
+    run(financial_collection.delete_one({"_id": doc["_id"]}))
+    run(remove_record_from_aggregates(doc))
+    aggregates = run(get_user_aggregates(USER))
+    assert aggregates["first_date"] == datetime(2023, 12, 1)
+    assert drift(RECORDS[1:]) == {}
+
+
+def test_legacy_user_first_write_backfills_history():
+    run(seed_legacy())
+    run(add_record_to_aggregates(run(insert(NEW))))
+    aggregates = run(get_user_aggregates(USER))
+    assert aggregates["count"] == len(RECORDS) + 1
+    assert drift(RECORDS + [NEW]) == {}
+
+
+def test_legacy_user_first_batch_backfills_history():
+    run(seed_legacy())
+    docs = [run(insert(NEW))]
+    run(apply_increments(USER, merge_increments(docs), [d["record_date"] for d in docs]))
+    assert drift(RECORDS + [NEW]) == {}
+
+
+def test_volatility_merges_and_unmerges_m2_with_large_balances():
+    # Saldos grandes con poca dispersión: el M2 fusionado en Mongo (alta de
+    # un lote y baja de un registro) debe coincidir con np.std de lo que queda.
+    savings = [1e9 + d for d in (3.0, -1.5, 4.25, 0.5, -2.0, 7.0)]
+    records = [{"income": 2e9, "savings": s, "record_date": datetime(2024, 1, i + 1)} for i, s in enumerate(savings)]
+    run(insert(records[0]))
+    run(get_user_aggregates(USER))
+
+    docs = [run(insert(r)) for r in records[1:]]
+    run(apply_increments(USER, merge_increments(docs), [d["record_date"] for d in docs]))
+    stats = risk_statistics(run(get_user_aggregates(USER)))
+    assert math.isclose(stats["volatility"], float(np.std(savings)), rel_tol=1e-6)
+
+    run(financial_collection.delete_one({"_id": docs[1]["_id"]}))
+    run(remove_record_from_aggregates(docs[1]))
+    stats = risk_statistics(run(get_user_aggregates(USER)))
+    assert math.isclose(stats["volatility"], float(np.std(savings[:2] + savings[3:])), rel_tol=1e-6)
+    assert drift(records[:2] + records[3:]) == {}
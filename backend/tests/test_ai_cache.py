@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime
+from app.services.ai_cache import TwoTierAICache, window_filter
+
+
+def make_cache(maxsize=100):
+    cache = TwoTierAICache(maxsize=maxsize, ttl_seconds=60)
+    store = {}
+    version = {"value": 0}
+
+    async def mongo_get(key):
+        return store.get(key)
+
+    async def mongo_set(key, response, updated_at, stamp):
+        store[key] = {"response": response, "updated_at": updated_at, "stale": False, **stamp}
+
+    async def mongo_mark_stale(key):
+        store[key]["stale"] = True
+
+    async def data_version(user_email):
+        return version["value"]
+
+    cache._mongo_get = mongo_get
+    cache._mongo_set = mongo_set
+    cache._mongo_mark_stale = mongo_mark_stale
+    cache.data_version = data_version
+    return cache, store, version
+
+
+def test_concurrent_misses_generate_once():
+    cache, _, _ = make_cache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"summary": "ok"}
+
+    async def run():
+        return await asyncio.gather(*[
+            cache.get_or_compute("test@demo.com", "summary", compute) for _ in range(8)
+        ])
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(r == ({"summary": "ok"}, "computed") for r in results)
+    assert cache.stats()["singleflight_waits"] == 7
+
+
+def test_memory_tier_serves_after_first_compute_and_invalidation_clears_it():
+    cache, store, _ = make_cache()
+
+    async def compute():
+        return {"summary": "ok"}
+
+    async def run():
+        await cache.get_or_compute("test@demo.com", "summary", compute)
+        hit = await cache.get("test@demo.com", "summary")
+        cache.invalidate_memory("test@demo.com")
+        store.clear()
+        miss = await cache.get("test@demo.com", "summary")
+        return hit, miss
+
+    hit, miss = asyncio.run(run())
+
+    assert hit == {"summary": "ok"}
+    assert miss is None
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_lru_evictions_are_counted():
+    cache, _, _ = make_cache(maxsize=2)
+
+    async def run():
+        for cache_type in ("summary", "forecast", "risk_summary"):
+            await cache.set("test@demo.com", cache_type, {"v": cache_type})
+
+    asyncio.run(run())
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stale_entry_is_served_while_a_single_refresh_runs():
+    cache, store, _ = make_cache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"summary": f"v{len(calls)}"}
+
+    async def run():
+        await cache.set("test@demo.com", "summary", {"summary": "v0"})
+        cache.invalidate_memory("test@demo.com")
+        store[("test@demo.com", "summary")]["stale"] = True
+
+        served = await asyncio.gather(*[
+            cache.get_or_compute("test@demo.com", "summary", compute) for _ in range(5)
+        ])
+        await asyncio.sleep(0.1)
+        return served, await cache.get_or_compute("test@demo.com", "summary", compute)
+
+    served, after = asyncio.run(run())
+
+    assert all(r == ({"summary": "v0"}, "stale") for r in served)
+    assert len(calls) == 1
+    assert after == ({"summary": "v1"}, "cache")
+    stats = cache.stats()
+    assert stats["stale_served"] == 5 and stats["background_refreshes"] == 1
+
+
+def test_write_during_compute_leaves_the_entry_stale():
+    cache, store, version = make_cache()
+
+    async def compute():
+        version["value"] += 1  # una escritura llega mientras se genera
+        return {"summary": "viejo"}
+
+    async def run():
+        await cache.get_or_compute("test@demo.com", "summary", compute)
+        return await cache.lookup("test@demo.com", "summary")
+
+    assert asyncio.run(run()) == ({"summary": "viejo"}, "stale")
+    assert store[("test@demo.com", "summary")]["data_version"] == 0
+    assert cache.stats()["version_races"] == 1
+
+
+def test_window_filter_matches_overlapping_ranges_only():
+    assert window_filter([]) == {}
+    d1, d2 = datetime(2024, 1, 1), datetime(2024, 3, 1)
+    clauses = window_filter([d2, d1])["$and"]
+    assert clauses[0]["$or"][1] == {"window.start": {"$lte": d2}}
+    assert clauses[1]["$or"][1] == {"window.end": {"$gte": d1}}
+
+
+def test_montecarlo_caches_only_the_default_seed_and_paths(monkeypatch):
+    from app.config import settings
+    from app.routes import ai_assistant
+
+    cache, store, _ = make_cache()
+
+    async def projection(user_email, horizon, paths, seed):
+        return {"horizon": horizon, "paths": paths, "seed": seed}
+
+    monkeypatch.setattr(ai_assistant, "ai_cache", cache)
+    monkeypatch.setattr(ai_assistant, "savings_projection", projection)
+
+    async def run():
+        await ai_assistant._forecast_montecarlo("test@demo.com", 12, settings.montecarlo_paths, settings.montecarlo_seed)
+        for seed in range(20):
+            await ai_assistant._forecast_montecarlo("test@demo.com", 12, settings.montecarlo_paths, seed)
+        await ai_assistant._forecast_montecarlo("test@demo.com", 12, settings.montecarlo_paths + 1, settings.montecarlo_seed)
+        return await ai_assistant._forecast_montecarlo("test@demo.com", 12, settings.montecarlo_paths, settings.montecarlo_seed)
+
+    result = asyncio.run(run())
+    assert result["source"] == "cache"
+    assert len(store) == 1
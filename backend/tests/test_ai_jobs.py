@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services import ai_jobs
+
+
+@pytest.fixture
+def closed(monkeypatch):
+    """
+    Reemplaza el cierre de jobs en Mongo y registra cómo terminó cada uno.
+    """
+    outcomes = {}
+
+    async def complete_job(job):
+        outcomes[job["_id"]] = ("done", None)
+
+    async def fail_job(job, errors):
+        outcomes[job["_id"]] = ("retry", errors)
+        return ai_jobs.PENDING
+
+    monkeypatch.setattr(ai_jobs, "complete_job", complete_job)
+    monkeypatch.setattr(ai_jobs, "fail_job", fail_job)
+    return outcomes
+
+
+def make_job(artifacts=ai_jobs.AI_ARTIFACTS):
+    return {"_id": "job-1", "user_email": "test@demo.com", "artifacts": list(artifacts), "attempts": 1}
+
+
+def test_job_completes_when_every_artifact_refreshes(closed):
+    refreshed = []
+
+    async def handler(user_email, artifact):
+        refreshed.append(artifact)
+
+    worker = ai_jobs.AIJobWorker(handler, concurrency=1, poll_interval=0.01)
+    assert asyncio.run(worker.process(make_job())) == ai_jobs.DONE
+    assert refreshed == list(ai_jobs.AI_ARTIFACTS)
+    assert closed["job-1"] == ("done", None)
+
+
+def test_only_failed_artifacts_are_retried_and_client_errors_are_skipped(closed):
+    async def handler(user_email, artifact):
+        if artifact == "summary":
+            raise RuntimeError("Gemini no disponible")
+        if artifact == "forecast":
+            raise HTTPException(status_code=404, detail="Sin registros")
+
+    worker = ai_jobs.AIJobWorker(handler, concurrency=1, poll_interval=0.01)
+    assert asyncio.run(worker.process(make_job())) == ai_jobs.PENDING
+    assert closed["job-1"] == ("retry", {"summary": "Gemini no disponible"})
+    assert worker.stats()[ai_jobs.PENDING] == 1
+
+
+def test_backoff_grows_exponentially_with_jitter():
+    for attempt in range(1, 6):
+        delay = ai_jobs.job_backoff_delay(attempt, base=2.0)
+        nominal = 2.0 * 2 ** (attempt - 1)
+        assert 0.5 * nominal <= delay <= 1.5 * nominal
+
+
+@pytest.mark.parametrize("artifact", ["forecast", "risk_summary"])
+def test_gemini_failure_is_not_cached_and_the_job_retries(monkeypatch, closed, artifact):
+    from app.services import ai_service
+
+    stored = []
+
+    async def lookup(user_email, cache_type, max_age_hours):
+        return None, None, None
+
+    async def data_version(user_email):
+        return 1
+
+    async def store(user_email, cache_type, response, data_version, window=None):
+        stored.append(cache_type)
+
+    async def gemini_down(prompt, **kwargs):
+        return {"ok": False, "error": "Fallo final: 503"}
+
+    async def trend(user_email):
+        return {"trend": "up", "next_savings_estimate": 100.0, "slope": 1.0}
+
+    async def context(user_email, *args):
+        return "contexto"
+
+    monkeypatch.setattr(ai_service.ai_cache, "_lookup", lookup)
+    monkeypatch.setattr(ai_service.ai_cache, "data_version", data_version)
+    monkeypatch.setattr(ai_service.ai_cache, "set", store)
+    monkeypatch.setattr(ai_service, "call_gemini_structured", gemini_down)
+    monkeypatch.setattr(ai_service, "savings_trend", trend)
+    monkeypatch.setattr(ai_service, "_aggregates_context", context)
+    monkeypatch.setattr(ai_service, "_resolve_context", context)
+
+    worker = ai_jobs.AIJobWorker(ai_service.refresh_ai_artifact, concurrency=1, poll_interval=0.01)
+    assert asyncio.run(worker.process(make_job([artifact]))) == ai_jobs.PENDING
+    assert stored == []
+    assert list(closed["job-1"][1]) == [artifact]
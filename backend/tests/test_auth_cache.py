@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.utils import dependencies
+from app.utils.jwt_handler import create_access_token
+
+
+class CountingUsers:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    async def find_one(self, query, projection=None):
+        self.calls += 1
+        return self.docs.get(query["email"])
+
+
+def get_user(token):
+    return asyncio.run(dependencies.get_current_user(token))
+
+
+@pytest.fixture
+def users(monkeypatch):
+    fake = CountingUsers({"ana@finscope.ai": {"email": "ana@finscope.ai", "full_name": "Ana", "role": "user"}})
+    monkeypatch.setattr(dependencies, "user_collection", fake)
+    monkeypatch.setattr(dependencies.settings, "auth_cache_enabled", True)
+    dependencies.clear_auth_caches()
+    yield fake
+    dependencies.clear_auth_caches()
+
+
+def test_repeated_requests_hit_mongo_once(users):
+    token = create_access_token({"sub": "ana@finscope.ai", "role": "user"})
+    for _ in range(5):
+        user = get_user(token)
+    assert user == {"email": "ana@finscope.ai", "full_name": "Ana", "role": "user"}
+    assert users.calls == 1
+
+
+def test_invalidation_forces_a_new_lookup(users):
+    token = create_access_token({"sub": "ana@finscope.ai", "role": "user"})
+    get_user(token)
+    dependencies.invalidate_user_cache("ana@finscope.ai")
+    get_user(token)
+    assert users.calls == 2
+
+
+def test_invalid_token_and_unknown_user_are_rejected(users):
+    with pytest.raises(HTTPException) as exc:
+        get_user("no-es-un-token")
+    assert exc.value.status_code == 401
+
+    token = create_access_token({"sub": "nadie@finscope.ai", "role": "user"})
+    with pytest.raises(HTTPException):
+        get_user(token)
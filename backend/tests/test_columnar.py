@@ -0,0 +1,85 @@
+import math
+from datetime import datetime
+import numpy as np
+from app.services.aggregates_service import compute_aggregates, record_increments, risk_statistics
+from app.services.columnar import ColumnBuilder, FinancialColumns, column_totals
+
+RECORDS = [
+    {"income": 1000, "expenses": 600.5, "savings": 200, "record_date": datetime(2024, 1, 1), "category": "rent"},
+    {"income": 0, "expenses": 50, "savings": 10, "record_date": datetime(2024, 1, 2), "category": "food"},
+    {"income": "1200", "expenses": None, "savings": 300, "record_date": None},
+    {"income": True, "savings": -20.25, "record_date": datetime(2023, 12, 31), "category": "food"},
+    {"expenses": 80, "record_date": "2024-02-01"},
+]
+
+
+def row_by_row(records):
+    merged = {}
+    for record in records:
+        for key, value in record_increments(record).items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def flatten(aggregates):
+    flat = {}
+    for key, value in aggregates.items():
+        if isinstance(value, dict):
+            flat.update({f"{key}.{k}": v for k, v in value.items()})
+        elif key not in ("first_date", "last_date"):
+            flat[key] = value
+    return flat
+
+
+def test_missing_and_invalid_values_become_nan():
+    columns = FinancialColumns.from_records(RECORDS)
+    assert columns.present("income").tolist() == [True, True, True, False, False]
+    assert columns.present("expenses").tolist() == [True, True, False, False, True]
+    assert columns.income[2] == 1200.0
+    assert np.isnat(columns.dates[2]) and np.isnat(columns.dates[4])
+    assert columns.categories == ["food", "rent"]
+    assert columns.category_codes.tolist() == [1, 0, -1, 0, -1]
+
+
+def test_vectorized_aggregates_match_row_by_row_increments():
+    expected = row_by_row(RECORDS)
+    aggregates = compute_aggregates(RECORDS)
+    flat = flatten(aggregates)
+    # M2 no es aditivo: se comprueba aparte contra NumPy.
+    m2 = flat.pop("risk.savings_m2")
+
+    assert set(flat) == set(expected)
+    assert math.isclose(m2, np.var([200, 300]) * 2)
+    for key, value in expected.items():
+        assert math.isclose(flat[key], value, rel_tol=1e-9, abs_tol=1e-9), key
+    assert aggregates["first_date"] == datetime(2023, 12, 31)
+    assert aggregates["last_date"] == datetime(2024, 1, 2)
+
+
+def test_volatility_is_stable_with_large_balances():
+    # Saldos ~1e9 con poca dispersión: Σx²/n − media² pierde todos los dígitos.
+    rng = np.random.default_rng(0)
+    savings = 1e9 + rng.normal(0, 5, 1_000)
+    records = [{"income": 2e9, "savings": float(s)} for s in savings]
+    stats = risk_statistics(compute_aggregates(records))
+    assert math.isclose(stats["volatility"], float(np.std(savings)), rel_tol=1e-6)
+
+
+def test_empty_input():
+    assert compute_aggregates([]) == {"count": 0, "first_date": None, "last_date": None}
+    assert column_totals(FinancialColumns.from_records([])) == {"income": 0.0, "expenses": 0.0, "savings": 0.0}
+
+
+def test_batched_builder_matches_single_pass():
+    whole = FinancialColumns.from_records(RECORDS)
+    builder = ColumnBuilder()
+    for start in range(0, len(RECORDS), 2):
+        builder.add(RECORDS[start:start + 2])
+    batched = builder.build()
+
+    assert len(batched) == len(whole)
+    assert batched.categories == whole.categories == ["food", "rent"]
+    assert batched.category_codes.tolist() == whole.category_codes.tolist()
+    assert batched.dates.view(np.int64).tolist() == whole.dates.view(np.int64).tolist()
+    for field in ("income", "expenses", "savings"):
+        assert np.array_equal(batched.amount(field), whole.amount(field), equal_nan=True)
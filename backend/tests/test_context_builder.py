@@ -0,0 +1,42 @@
+from app.services.context_builder import estimate_tokens, fit_to_budget, serialize_context
+
+
+def sections(n=50):
+    return {
+        "totals": {"income": 120000.0, "expenses": 80000.0, "savings": 40000.0, "records": n},
+        "periods": [{"period": f"2024-{m:02d}", "income": 10000.0, "expenses": 6000.0} for m in range(12, 0, -1)],
+        "categories": [{"category": f"cat-{i}", "expenses": 1000.0 - i} for i in range(10)],
+        "recent": [{"date": f"2024-12-{d:02d}", "income": 300.0, "expenses": 200.0} for d in range(n, 0, -1) if d <= 28],
+        "client": {f"widget_{i}": "x" * 200 for i in range(30)},
+    }
+
+
+def test_estimate_tokens_grows_with_text():
+    assert estimate_tokens("") == 0
+    assert 1 <= estimate_tokens("hola") <= 2
+    assert estimate_tokens("a " * 100) > estimate_tokens("a " * 10)
+
+
+def test_context_within_budget_is_untouched():
+    full = sections()
+    context, report = fit_to_budget(full, budget=100_000)
+    assert context == full and report["truncated"] == {}
+
+
+def test_lowest_value_sections_are_cut_first():
+    full = sections()
+    budget = estimate_tokens(serialize_context({k: full[k] for k in ("totals", "periods", "categories")})) + 60
+    context, report = fit_to_budget(full, budget)
+
+    assert report["tokens"] <= budget
+    assert "client" not in context and report["truncated"]["client"] == 30
+    assert context["periods"] == full["periods"] and context["categories"] == full["categories"]
+    # De `recent` se conserva el prefijo más reciente que cabe.
+    assert 0 < len(context["recent"]) < len(full["recent"])
+    assert context["recent"] == full["recent"][:len(context["recent"])]
+
+
+def test_totals_survive_tiny_budget():
+    context, report = fit_to_budget(sections(), budget=10)
+    assert list(context) == ["totals"]
+    assert set(report["truncated"]) == {"periods", "categories", "recent", "client"}
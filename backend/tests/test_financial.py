@@ -1,3 +1,4 @@
+import asyncio
 from fastapi.testclient import TestClient
 from datetime import date, timedelta
 from uuid import uuid4
@@ -7,7 +8,7 @@ from app.utils.db import financial_collection
 client = TestClient(app)
 
 def setup_module(module):
-    financial_collection.delete_many({"user_email": "test@demo.com"})
+    asyncio.run(financial_collection.delete_many({"user_email": "test@demo.com"}))
 
 BASE_PAYLOAD = {
     "user_email": "test@demo.com",
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from pymongo.errors import OperationFailure
+from app.utils import indexes
+from app.utils.db import financial_collection
+from app.utils.indexes import ensure_indexes, queries_without_index, unique_index_collisions, winning_plan_stages
+
+
+def test_winning_plan_stages_walks_nested_plans():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "user_email_record_date_unique"},
+    }}}
+    assert winning_plan_stages(explain) == ["FETCH", "IXSCAN"]
+
+
+def test_hot_queries_use_indexes():
+    async def run():
+        await ensure_indexes()
+        return await queries_without_index()
+    assert asyncio.run(run()) == {}
+
+
+class FailingDB:
+    def __init__(self, failing):
+        self.failing = failing
+        self.attempted = []
+
+    def __getitem__(self, name):
+        db = self
+
+        class Collection:
+            async def create_indexes(self, models):
+                db.attempted.append(name)
+                if name in db.failing:
+                    raise OperationFailure("E11000 duplicate key error")
+                return [m.document["name"] for m in models]
+
+        return Collection()
+
+
+def test_unique_index_failure_is_fatal(monkeypatch):
+    db = FailingDB({"financial_data", "ai_cache"})
+    monkeypatch.setattr(indexes, "get_db", lambda: db)
+    with pytest.raises(RuntimeError, match="financial_data"):
+        asyncio.run(ensure_indexes())
+    # Se intentan todas las colecciones antes de fallar.
+    assert db.attempted == list(indexes.index_specs())
+
+
+def test_non_unique_index_failure_is_only_logged(monkeypatch):
+    monkeypatch.setattr(indexes, "get_db", lambda: FailingDB({"ai_cache"}))
+    created = asyncio.run(ensure_indexes())
+    assert "ai_cache" not in created and "user_email_record_date_unique" in created["financial_data"]
+
+
+def test_users_unique_index_failure_does_not_block_startup(monkeypatch):
+    monkeypatch.setattr(indexes, "get_db", lambda: FailingDB({"users"}))
+    created = asyncio.run(ensure_indexes())
+    assert "users" not in created
+
+
+def test_legacy_records_without_record_date_do_not_collide():
+    user = "legacy-dates@demo.com"
+    legacy = [{"user_email": user, "date": "2023-01-01", "income": 1}, {"user_email": user, "date": "2023-02-01", "income": 2}]
+
+    async def run():
+        await financial_collection.delete_many({"user_email": user})
+        await financial_collection.insert_many(legacy)
+        try:
+            collisions = await unique_index_collisions()
+            await ensure_indexes()
+            return collisions
+        finally:
+            await financial_collection.delete_many({"user_email": user})
+
+    assert "financial_data.user_email_record_date_unique" not in asyncio.run(run())
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from app.services.ingestion_service import iter_json_array_rows, iter_ndjson_rows, iter_csv_rows
+
+
+def chunked(payload: str, size: int = 7):
+    async def gen():
+        data = payload.encode()
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+    return gen()
+
+
+def collect(parser, payload: str):
+    async def run():
+        return [row async for row in parser(chunked(payload))]
+    return asyncio.run(run())
+
+
+ROWS = [
+    {"user_email": "test@demo.com", "income": 1500, "expenses": 500, "savings": 300, "description": "ñandú, café"},
+    {"user_email": "test@demo.com", "income": 900, "expenses": 400, "savings": 100},
+]
+
+
+def test_json_array_is_parsed_across_chunk_boundaries():
+    rows = collect(iter_json_array_rows, json.dumps(ROWS, ensure_ascii=False))
+    assert [(n, obj) for n, obj, _ in rows] == [(1, ROWS[0]), (2, ROWS[1])]
+
+
+def test_truncated_json_array_reports_error_row():
+    rows = collect(iter_json_array_rows, json.dumps(ROWS)[:-1])
+    assert rows[-1][1] is None and "incompleto" in rows[-1][2]
+
+
+def test_ndjson_reports_invalid_lines_and_keeps_going():
+    payload = json.dumps(ROWS[0]) + "\n{oops\n" + json.dumps(ROWS[1]) + "\n"
+    rows = collect(iter_ndjson_rows, payload)
+    assert [n for n, _, _ in rows] == [1, 2, 3]
+    assert rows[1][2].startswith("JSON inválido")
+    assert rows[2][1] == ROWS[1]
+
+
+def test_csv_uses_header_and_drops_empty_cells():
+    payload = 'user_email,income,expenses,savings,description\r\ntest@demo.com,1500,500,300,"a, b"\r\ntest@demo.com,900,400,100,\r\n'
+    rows = collect(iter_csv_rows, payload)
+    assert rows[0][1]["description"] == "a, b"
+    assert "description" not in rows[1][1]
+
+
+def test_csv_quoted_field_may_contain_newlines():
+    payload = ('user_email,income,description\r\n'
+               'test@demo.com,1500,"renta\r\nenero, ""fija"""\r\n'
+               '\r\n'
+               'test@demo.com,900,"una\n\nlínea en blanco"\r\n')
+    rows = collect(iter_csv_rows, payload)
+    assert [(n, obj["description"]) for n, obj, _ in rows] == [
+        (1, 'renta\nenero, "fija"'),
+        (2, "una\n\nlínea en blanco"),
+    ]
+
+
+def test_csv_unterminated_quote_reports_error_row():
+    rows = collect(iter_csv_rows, 'user_email,description\ntest@demo.com,ok\ntest@demo.com,"sin cerrar\n')
+    assert rows[0][1] == {"user_email": "test@demo.com", "description": "ok"}
+    assert rows[1][0] == 2 and rows[1][1] is None and rows[1][2].startswith("CSV inválido")
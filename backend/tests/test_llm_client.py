@@ -0,0 +1,171 @@
+import asyncio
+import json
+import pytest
+from app.services import llm_client
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def make_fake_model(behaviour):
+    """
+    behaviour: {modelo: (latencia_s, texto | Exception)}
+    """
+    class FakeModel:
+        def __init__(self, name):
+            self.name = name
+
+        async def generate_content_async(self, prompt, generation_config=None):
+            delay, result = behaviour[self.name]
+            await asyncio.sleep(delay)
+            if isinstance(result, Exception):
+                raise result
+            return FakeResponse(result)
+
+    return FakeModel
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def no_prompt_cache(monkeypatch):
+    monkeypatch.setattr(llm_client.settings, "prompt_cache_enabled", False)
+    llm_client.model_registry.reset()
+
+
+def test_hedged_request_takes_fastest_valid_json(monkeypatch):
+    monkeypatch.setattr(llm_client.model_registry, "factory", make_fake_model({
+        "slow-pro": (1.0, json.dumps({"insight": "pro"})),
+        "fast-flash": (0.01, json.dumps({"insight": "flash"})),
+    }))
+
+    res = run(llm_client.generate_structured(
+        "prompt", ["slow-pro", "fast-flash"], hedge_after_ms=50, deadline_seconds=2
+    ))
+
+    assert res["ok"]
+    assert res["model"] == "fast-flash"
+    assert res["data"] == {"insight": "flash"}
+
+
+def test_failure_falls_back_without_waiting_for_hedge(monkeypatch):
+    monkeypatch.setattr(llm_client.model_registry, "factory", make_fake_model({
+        "broken": (0.0, RuntimeError("boom")),
+        "ok": (0.0, json.dumps({"insight": "ok"})),
+    }))
+
+    res = run(llm_client.generate_structured(
+        "prompt", ["broken", "ok"], hedge_after_ms=10_000, deadline_seconds=1
+    ))
+
+    assert res["ok"]
+    assert res["model"] == "ok"
+
+
+def test_deadline_is_respected(monkeypatch):
+    monkeypatch.setattr(llm_client.model_registry, "factory", make_fake_model({
+        "stuck": (5.0, json.dumps({"insight": "tarde"})),
+    }))
+
+    res = run(llm_client.generate_structured(
+        "prompt", ["stuck"], hedge_after_ms=10, deadline_seconds=0.1
+    ))
+
+    assert not res["ok"]
+    assert "Tiempo límite" in res["error"]
+
+
+def test_plain_text_is_used_when_no_model_returns_json(monkeypatch):
+    monkeypatch.setattr(llm_client.model_registry, "factory", make_fake_model({
+        "texto": (0.0, "respuesta libre"),
+    }))
+
+    res = run(llm_client.generate_structured(
+        "prompt", ["texto"], deadline_seconds=1
+    ))
+
+    assert res["ok"]
+    assert res["data"] is None
+    assert res["text"] == "respuesta libre"
+
+
+def test_prompt_cache_hit_skips_the_model(monkeypatch):
+    class FakePromptCache:
+        async def lookup(self, keys):
+            return {"model": "cached", "data": {"insight": "guardado"}, "text": None}
+
+    def fail_if_called(name):
+        raise AssertionError("No debería llamarse al modelo")
+
+    monkeypatch.setattr(llm_client.settings, "prompt_cache_enabled", True)
+    monkeypatch.setattr(llm_client, "prompt_cache", FakePromptCache())
+    monkeypatch.setattr(llm_client.model_registry, "factory", fail_if_called)
+
+    res = run(llm_client.generate_structured("prompt", ["a", "b"], deadline_seconds=1))
+
+    assert res["ok"] and res["model"] == "cached"
+    assert res["data"] == {"insight": "guardado"}
+
+
+def test_prompt_key_depends_on_every_input():
+    base = llm_client.prompt_key("m", "sys", "p", {"a": 1})
+    assert base == llm_client.prompt_key("m", "sys", "p", {"a": 1})
+    assert base != llm_client.prompt_key("m2", "sys", "p", {"a": 1})
+    assert base != llm_client.prompt_key("m", "otro", "p", {"a": 1})
+    assert base != llm_client.prompt_key("m", "sys", "p2", {"a": 1})
+    assert base != llm_client.prompt_key("m", "sys", "p", {"a": 2})
+
+
+async def collect(stream):
+    return [event async for event in stream]
+
+
+def fake_registry(monkeypatch, backend):
+    from app.services.model_registry import MODEL_CATALOG, ModelRegistry
+    monkeypatch.setattr(llm_client, "model_registry", ModelRegistry(MODEL_CATALOG, factory=backend.factory))
+
+
+def test_stream_forwards_chunks_and_parses_final_json(monkeypatch):
+    from tests.fakes import FakeModelBackend
+    backend = FakeModelBackend(default_latency=0.02, chunk_size=8, chunk_delay=0.02,
+                               response={"answer": "ahorra más", "highlights": ["h"], "actions": ["a"]})
+    fake_registry(monkeypatch, backend)
+
+    events = run(collect(llm_client.stream_structured("prompt", tier="pro", deadline_seconds=2)))
+    deltas, done = events[:-1], events[-1]
+
+    assert len(deltas) > 1 and all(e["event"] == "delta" for e in deltas)
+    assert done["event"] == "done" and done["ok"]
+    assert done["data"]["answer"] == "ahorra más"
+    assert json.loads("".join(e["text"] for e in deltas)) == done["data"]
+    assert done["ttft_ms"] < done["total_ms"]
+
+
+def test_stream_fails_over_before_first_chunk(monkeypatch):
+    from tests.fakes import FakeModelBackend
+    backend = FakeModelBackend()
+    fake_registry(monkeypatch, backend)
+    backend.fail("gemini-2.5-pro", times=-1)
+
+    done = run(collect(llm_client.stream_structured("prompt", tier="pro", deadline_seconds=2)))[-1]
+
+    assert done["ok"] and done["model"] == "gemini-2.5-flash"
+    assert backend.calls == ["gemini-2.5-pro", "gemini-2.5-flash"]
+
+
+def test_no_launch_reports_open_circuits_instead_of_none(monkeypatch):
+    # Todos parecen sanos al rutear, pero otra petición se llevó cada prueba semiabierta.
+    monkeypatch.setattr(llm_client.model_registry, "factory", make_fake_model({"a": (0.0, "{}"), "b": (0.0, "{}")}))
+    monkeypatch.setattr(llm_client.model_registry, "try_acquire", lambda name: False)
+
+    async def stream():
+        return [event async for event in llm_client.stream_structured("prompt", ["a", "b"])]
+
+    res = run(llm_client.generate_structured("prompt", ["a", "b"], deadline_seconds=1))
+    done = run(stream())[-1]
+    assert res["error"] == done["error"] == f"Fallo final: {llm_client.NO_MODELS_AVAILABLE}"
+    assert not res["ok"] and not done["ok"]
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import pytest
+from app.services import llm_client
+from app.services.llm_providers import GeminiProvider, LLMProvider, LocalProvider, RecordingProvider, ReplayProvider
+from app.services.model_registry import MODEL_CATALOG, ModelRegistry
+
+PRO = "gemini-2.5-pro"
+
+
+def call(model, prompt="prompt", stream=False):
+    async def run():
+        response = await model.generate_content_async(prompt, generation_config={"response_mime_type": "application/json"}, stream=stream)
+        if not stream:
+            return response.text
+        return "".join([chunk.text async for chunk in response])
+    return asyncio.run(run())
+
+
+def test_local_provider_is_deterministic():
+    a = LocalProvider(latency_ms=0, seed=7).create_model(PRO)
+    b = LocalProvider(latency_ms=0, seed=7).create_model(PRO)
+    assert call(a) == call(b)
+    assert call(a, "otro prompt") != call(a)
+    assert json.loads(call(a, stream=True)) == json.loads(call(a))
+    assert {"answer", "insight", "highlights", "actions", "risk_level"} <= set(json.loads(call(a)))
+
+
+def test_local_provider_injects_seeded_errors():
+    def outcomes(seed):
+        model = LocalProvider(latency_ms=0, error_rate=0.3, quota_error_rate=0.2, seed=seed).create_model(PRO)
+        results = []
+        for _ in range(200):
+            try:
+                call(model)
+                results.append("ok")
+            except RuntimeError as e:
+                results.append(str(e)[:3])
+        return results
+
+    first = outcomes(3)
+    assert first == outcomes(3)
+    assert 40 < first.count("503") < 80 and 20 < first.count("429") < 60
+
+
+def test_record_then_replay_roundtrip(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    recorder = RecordingProvider(LocalProvider(latency_ms=5, jitter=0), path)
+    recorded = call(recorder.create_model(PRO), "hola")
+    call(recorder.create_model(PRO), "streaming", stream=True)
+
+    replay = ReplayProvider(path, speed=0)
+    assert call(replay.create_model(PRO), "hola") == recorded
+    assert call(replay.create_model(PRO), "streaming", stream=True) == call(LocalProvider(latency_ms=0).create_model(PRO), "streaming")
+    with pytest.raises(RuntimeError):
+        call(replay.create_model(PRO), "sin grabar")
+    assert (replay.hits, replay.misses) == (2, 1)
+
+
+def test_concurrent_recordings_do_not_interleave(tmp_path):
+    path = tmp_path / "llm.jsonl"
+    recorder = RecordingProvider(LocalProvider(latency_ms=1, jitter=0), str(path))
+
+    async def run():
+        models = [recorder.create_model(PRO) for _ in range(4)]
+        await asyncio.gather(*(
+            models[i % 4].generate_content_async("x" * 5000 + str(i), generation_config=None)
+            for i in range(40)
+        ))
+
+    asyncio.run(run())
+    entries = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(entries) == len({e["key"] for e in entries}) == 40
+
+
+def test_provider_base_is_abstract():
+    with pytest.raises(TypeError):
+        LLMProvider()
+
+
+def test_gemini_without_key_fails_as_model_error(monkeypatch):
+    provider = GeminiProvider("")
+    registry = ModelRegistry(MODEL_CATALOG, factory=provider.create_model)
+    monkeypatch.setattr(llm_client, "model_registry", registry)
+    monkeypatch.setattr(llm_client.settings, "prompt_cache_enabled", False)
+    result = asyncio.run(llm_client.generate_structured("prompt", deadline_seconds=2, max_attempts_per_model=1))
+    assert not result["ok"] and "GEMINI_API_KEY" in result["error"]
+
+
+def test_pipeline_runs_on_local_provider(monkeypatch):
+    registry = ModelRegistry(MODEL_CATALOG, factory=LocalProvider(latency_ms=1, seed=1).create_model)
+    monkeypatch.setattr(llm_client, "model_registry", registry)
+    monkeypatch.setattr(llm_client.settings, "prompt_cache_enabled", False)
+    result = asyncio.run(llm_client.generate_structured("prompt", tier="flash", deadline_seconds=2))
+    assert result["ok"] and result["data"]["risk_level"] in ("low", "medium", "high")
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.metrics import Histogram, MetricsMiddleware, MetricsRegistry, MongoCommandMetrics, HTTP_REQUESTS, MONGO_COMMANDS
+
+
+def test_histogram_exports_cumulative_buckets():
+    registry = MetricsRegistry()
+    h = registry.histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        h.observe(value, "/x")
+    text = registry.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{route="/x",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/x",le="1"} 3' in text
+    assert 'demo_seconds_bucket{route="/x",le="+Inf"} 4' in text
+    assert 'demo_seconds_sum{route="/x"} 4.05' in text
+    assert 'demo_seconds_count{route="/x"} 4' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("demo_total", "Demo.", ("path",)).inc('a"b\\c')
+    assert 'demo_total{path="a\\"b\\\\c"} 1' in registry.render()
+
+
+def test_middleware_labels_route_template_not_url():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    before = HTTP_REQUESTS.value("GET", "/items/{item_id}", "200")
+    with TestClient(app) as client:
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/missing")
+    assert HTTP_REQUESTS.value("GET", "/items/{item_id}", "200") == before + 2
+    assert HTTP_REQUESTS.value("GET", "unmatched", "404") >= 1
+
+
+def test_middleware_overhead_is_below_50_microseconds():
+    async def inner(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(message):
+        pass
+
+    wrapped = MetricsMiddleware(inner)
+    scope = {"type": "http", "method": "GET", "path": "/bench"}
+    n = 20000
+
+    async def run(app):
+        start = time.perf_counter()
+        for _ in range(n):
+            await app(dict(scope), None, noop)
+        return (time.perf_counter() - start) / n
+
+    bare = min(asyncio.run(run(inner)) for _ in range(3))
+    instrumented = min(asyncio.run(run(wrapped)) for _ in range(3))
+    assert (instrumented - bare) * 1e6 < 50
+
+
+def test_mongo_listener_counts_per_collection():
+    listener = MongoCommandMetrics()
+    common = {"connection_id": ("localhost", 27017), "request_id": 7, "command_name": "find"}
+    before = MONGO_COMMANDS.value("financial_data", "find", "ok")
+    listener.started(SimpleNamespace(**common, command={"find": "financial_data"}, database_name="finscope"))
+    listener.succeeded(SimpleNamespace(**common, duration_micros=1500))
+    assert MONGO_COMMANDS.value("financial_data", "find", "ok") == before + 1
+    assert not listener._collections
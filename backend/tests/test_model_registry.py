@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from app.services import llm_client
+from tests.fakes import FakeModelBackend
+from app.services.model_registry import MODEL_CATALOG, ModelRegistry, CLOSED, OPEN, HALF_OPEN
+
+PRO, FLASH = "gemini-2.5-pro", "gemini-2.5-flash"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = FakeModelBackend()
+    clock = FakeClock()
+    registry = ModelRegistry(MODEL_CATALOG, factory=backend.factory, failure_threshold=3,
+                             cooldown_seconds=30, clock=clock)
+    monkeypatch.setattr(llm_client, "model_registry", registry)
+    monkeypatch.setattr(llm_client.settings, "prompt_cache_enabled", False)
+    backend.registry, backend.clock = registry, clock
+    return backend
+
+
+def generate(tier, **kwargs):
+    return asyncio.run(llm_client.generate_structured(
+        "prompt", tier=tier, max_attempts_per_model=1, deadline_seconds=2, **kwargs))
+
+
+def test_breaker_opens_after_failures_and_recovers_through_half_open(backend):
+    breaker = backend.registry.breaker_for(PRO)
+    for _ in range(3):
+        backend.registry.record_failure(PRO)
+    assert breaker.state == OPEN and not breaker.try_acquire()
+
+    backend.clock.now += 31
+    assert breaker.try_acquire() and breaker.state == HALF_OPEN
+    assert not breaker.try_acquire()  # solo una prueba a la vez
+
+    backend.registry.record_failure(PRO)
+    assert breaker.state == OPEN
+
+    backend.clock.now += 31
+    assert breaker.try_acquire()
+    backend.registry.record_success(PRO, 100)
+    assert breaker.state == CLOSED
+
+
+def test_degraded_model_is_skipped_until_cooldown(backend):
+    backend.fail(PRO, times=-1)
+    for _ in range(3):
+        res = generate("pro", hedge_after_ms=10_000)
+        assert res["ok"] and res["model"] == FLASH
+
+    calls_before = backend.calls.count(PRO)
+    assert generate("pro")["model"] == FLASH
+    assert backend.calls.count(PRO) == calls_before  # ya no se intenta
+
+    backend.recover(PRO)
+    backend.clock.now += 31
+    assert generate("pro")["model"] == PRO
+    assert backend.registry.breaker_for(PRO).state == CLOSED
+
+
+def test_routing_and_stats_do_not_consume_the_half_open_probe(backend):
+    breaker = backend.registry.breaker_for(PRO)
+    for _ in range(3):
+        backend.registry.record_failure(PRO)
+    backend.clock.now += 31
+
+    for _ in range(5):
+        assert backend.registry.route("flash") == [FLASH, PRO]
+        backend.registry.stats()
+    assert breaker.state == OPEN and breaker.probe_started_at is None
+
+    # Flash responde primero: la prueba de pro sigue disponible para quien la use.
+    assert generate("flash", hedge_after_ms=10_000)["model"] == FLASH
+    assert breaker.state == OPEN and PRO not in backend.calls
+
+    assert generate("pro")["model"] == PRO
+    assert breaker.state == CLOSED
+
+
+def test_routing_prefers_fastest_healthy_model_meeting_tier(backend):
+    assert backend.registry.route("flash") == [FLASH, PRO]  # latencias esperadas del catálogo
+    assert backend.registry.route("pro") == [PRO, FLASH]
+
+    backend.set_latency(FLASH, 0.05)
+    backend.set_latency(PRO, 0.01)
+    generate("flash", models=[FLASH])
+    generate("flash", models=[PRO])
+    assert backend.registry.route("flash") == [PRO, FLASH]
+
+
+def test_model_objects_are_pooled(backend):
+    for _ in range(3):
+        generate("flash")
+    assert sorted(backend.created) == [FLASH]
+    assert backend.registry.stats()[FLASH]["calls"] == 3
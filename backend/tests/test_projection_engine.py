@@ -0,0 +1,41 @@
+import numpy as np
+from app.services.projection_engine import monte_carlo_projection
+
+
+def history(n=36, seed=0):
+    rng = np.random.default_rng(seed)
+    income = 3000 + 10 * np.arange(n) + rng.normal(0, 200, n)
+    expenses = 2000 + 5 * np.arange(n) + rng.normal(0, 150, n)
+    return income, expenses
+
+
+def test_same_seed_same_bands():
+    income, expenses = history()
+    a = monte_carlo_projection(income, expenses, horizon=12, paths=2000, seed=7)
+    b = monte_carlo_projection(income, expenses, horizon=12, paths=2000, seed=7)
+    c = monte_carlo_projection(income, expenses, horizon=12, paths=2000, seed=8)
+    assert a == b
+    assert a["savings_bands"] != c["savings_bands"]
+
+
+def test_bands_are_ordered_and_sized():
+    income, expenses = history()
+    result = monte_carlo_projection(income, expenses, horizon=24, paths=5000, seed=1)
+    bands = result["cumulative_bands"]
+    assert list(bands) == ["p5", "p25", "p50", "p75", "p95"]
+    assert all(len(values) == 24 for values in bands.values())
+    stacked = np.array(list(bands.values()))
+    assert (np.diff(stacked, axis=0) >= 0).all()
+    assert 0 <= result["probability_negative_total"] <= 1
+
+
+def test_noiseless_history_collapses_to_trend():
+    x = np.arange(10, dtype=float)
+    result = monte_carlo_projection(1000 + 20 * x, 600 + 10 * x, horizon=3, paths=500, seed=0)
+    # Ahorro = 400 + 10x, continuando en x = 10, 11, 12.
+    assert result["expected_savings"] == [500.0, 510.0, 520.0]
+    assert result["savings_bands"]["p5"] == result["savings_bands"]["p95"]
+
+
+def test_insufficient_history():
+    assert "message" in monte_carlo_projection([100.0], [50.0], horizon=12, paths=100, seed=0)
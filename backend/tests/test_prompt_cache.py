@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+from app.services.prompt_cache import PromptCache
+
+
+class FakeCollection:
+    """
+    Colección en memoria que registra qué operaciones se ejecutan.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.ops = []
+
+    async def find_one(self, query, projection=None):
+        self.ops.append("find_one")
+        return next((dict(self.docs[k]) for k in query["_id"]["$in"] if k in self.docs), None)
+
+    async def update_one(self, query, update, upsert=False):
+        self.ops.append("update_one")
+        doc = self.docs.get(query["_id"])
+        upserted_id = None
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(upserted_id=None)
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+            upserted_id = query["_id"]
+        doc.update(update.get("$set", {}))
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        return SimpleNamespace(upserted_id=upserted_id)
+
+    async def aggregate(self, pipeline):
+        self.ops.append("aggregate")
+        total = sum(d.get("size", 0) for d in self.docs.values())
+        rows = [{"_id": None, "bytes": total}] if self.docs else []
+
+        class Cursor:
+            async def to_list(self, length):
+                return rows
+        return Cursor()
+
+    def find(self, query, projection=None):
+        docs = list(self.docs.values())
+
+        class Cursor:
+            def sort(self, field, direction):
+                docs.sort(key=lambda d: d[field], reverse=direction < 0)
+                return self
+
+            async def __aiter__(self):
+                for doc in docs:
+                    yield doc
+
+            async def close(self):
+                pass
+        return Cursor()
+
+    async def delete_many(self, query):
+        ids = [k for k in query["_id"]["$in"] if k in self.docs]
+        for k in ids:
+            del self.docs[k]
+        return SimpleNamespace(deleted_count=len(ids))
+
+
+def test_miss_is_read_only_and_hit_bumps_usage_in_background():
+    collection = FakeCollection()
+    cache = PromptCache(collection, max_bytes=10_000)
+
+    async def run():
+        assert await cache.lookup(["a", "b"]) is None
+        assert collection.ops == ["find_one"]
+
+        await cache.store("b", "flash", {"x": 1}, None, 120.0)
+        collection.ops.clear()
+        hit = await cache.lookup(["a", "b"])
+        await asyncio.gather(*cache._background_tasks)
+        return hit
+
+    hit = asyncio.run(run())
+    assert hit["data"] == {"x": 1}
+    assert collection.ops == ["find_one", "update_one"]
+    assert collection.docs["b"]["hits"] == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_size_budget_uses_running_total_and_evicts_least_recently_used():
+    collection = FakeCollection()
+    cache = PromptCache(collection, max_bytes=2_000, resync_every=1_000)
+    text = "x" * 180  # ~200 bytes por entrada
+
+    async def run():
+        for i in range(9):
+            await cache.store(f"k{i}", "flash", None, text, 10.0)
+        # Por debajo del presupuesto solo se sumó una vez la colección (al primer store).
+        assert collection.ops.count("aggregate") == 1
+        await cache.lookup(["k0"])
+        await asyncio.gather(*cache._background_tasks)
+        for i in range(9, 12):
+            await cache.store(f"k{i}", "flash", None, text, 10.0)
+
+    asyncio.run(run())
+    # Al superar el presupuesto se confirma con la suma real y se desaloja por last_hit_at.
+    assert cache.counters["evicted"] > 0
+    assert "k0" in collection.docs and "k1" not in collection.docs
+    assert sum(d["size"] for d in collection.docs.values()) <= 2_000 * 0.9
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import date, datetime
+from app.services.rollups_service import (
+    add_record_to_rollups,
+    bucket_count,
+    bucket_start,
+    bucket_update,
+    build_buckets,
+    category_key,
+    choose_granularity,
+    get_rollup_history,
+    merge_buckets,
+    next_bucket_start,
+    rebuild_user_rollups,
+    verify_user_rollups,
+)
+from app.utils.db import financial_collection, financial_rollups_collection
+
+RECORDS = [
+    {"income": 1000, "expenses": 600, "savings": 200, "record_date": datetime(2024, 1, 30), "category": "rent"},
+    {"income": 500, "expenses": 100, "savings": 50, "record_date": datetime(2024, 1, 31, 15, 30), "category": "food"},
+    {"income": "800", "expenses": None, "savings": 300, "record_date": datetime(2024, 2, 1)},
+    {"income": 900, "expenses": 10, "savings": 5, "record_date": None},
+]
+
+
+def test_bucket_boundaries():
+    assert bucket_start(date(2024, 2, 29), "day") == datetime(2024, 2, 29)
+    assert bucket_start(datetime(2024, 2, 29, 18), "week") == datetime(2024, 2, 26)
+    assert bucket_start(date(2024, 2, 29), "month") == datetime(2024, 2, 1)
+    assert next_bucket_start(datetime(2024, 12, 1), "month") == datetime(2025, 1, 1)
+    assert next_bucket_start(datetime(2024, 2, 26), "week") == datetime(2024, 3, 4)
+
+
+def test_auto_granularity_keeps_point_count_bounded():
+    five_years = (date(2020, 1, 1), date(2024, 12, 31))
+    assert bucket_count(*five_years, "day") == 1827
+    assert bucket_count(*five_years, "month") == 60
+    assert choose_granularity(*five_years, max_points=120) == "month"
+    assert choose_granularity(date(2024, 1, 1), date(2024, 12, 31), max_points=120) == "week"
+    assert choose_granularity(date(2024, 1, 1), date(2024, 3, 31), max_points=120) == "day"
+
+
+def test_build_buckets_sums_counts_extremes_and_categories():
+    buckets = build_buckets(RECORDS)
+    january = buckets[("month", datetime(2024, 1, 1))]
+    assert january["count"] == 2
+    assert january["sums"] == {"income": 1500.0, "expenses": 700.0, "savings": 250.0}
+    assert january["min"]["income"] == 500 and january["max"]["income"] == 1000
+    assert january["categories"]["food"] == {"count": 1, "income": 500.0, "expenses": 100.0, "savings": 50.0}
+
+    february = buckets[("month", datetime(2024, 2, 1))]
+    # Un gasto faltante suma 0 pero no participa en mínimo/máximo.
+    assert february["sums"]["expenses"] == 0.0 and "expenses" not in february["min"]
+    assert february["categories"]["general"]["count"] == 1
+
+    # El registro sin fecha queda fuera; los tres caen en la misma semana ISO.
+    assert buckets[("week", datetime(2024, 1, 29))]["count"] == 3
+    assert sum(1 for g, _ in buckets if g == "day") == 3
+
+
+def test_merged_days_match_month_bucket():
+    buckets = build_buckets(RECORDS)
+    days = [b for (g, start), b in buckets.items() if g == "day" and start.month == 1]
+    assert merge_buckets(days) == buckets[("month", datetime(2024, 1, 1))]
+
+
+def test_bucket_update_increments_and_only_widens_extremes_on_add():
+    bucket = build_buckets(RECORDS[:1])[("day", datetime(2024, 1, 30))]
+    added, removed = bucket_update(bucket), bucket_update(bucket, -1)
+    assert added["$inc"]["sums.income"] == 1000 and added["$inc"]["categories.rent.count"] == 1
+    assert added["$min"]["min.savings"] == 200 and added["$max"]["max.expenses"] == 600
+    assert removed["$inc"]["count"] == -1 and removed["$inc"]["sums.expenses"] == -600
+    assert "$min" not in removed and "$max" not in removed
+
+
+def test_category_keys_are_safe_for_dot_notation():
+    assert category_key("ocio.viajes") == "ocio_viajes"
+    assert category_key("$set") == "set"
+    assert category_key(None) == category_key("  ") == "general"
+
+
+def test_first_write_of_legacy_user_keeps_earlier_history():
+    user = "rollups-legacy@demo.com"
+    legacy = [{**r, "user_email": user} for r in RECORDS if r["record_date"]]
+    new = {"income": 700, "expenses": 200, "savings": 100, "record_date": datetime(2024, 6, 3), "user_email": user}
+
+    async def scenario():
+        await financial_collection.delete_many({"user_email": user})
+        await financial_rollups_collection.delete_many({"user_email": user})
+        try:
+            # Registros anteriores a las rollups; la primera acción es una escritura.
+            await financial_collection.insert_many([dict(r) for r in legacy])
+            await financial_collection.insert_one(dict(new))
+            await add_record_to_rollups(new)
+            return await get_rollup_history(user, granularity="month"), await verify_user_rollups(user)
+        finally:
+            await financial_collection.delete_many({"user_email": user})
+            await financial_rollups_collection.delete_many({"user_email": user})
+
+    history, drift = asyncio.run(scenario())
+    assert [p["period_start"] for p in history] == [date(2024, 1, 1), date(2024, 2, 1), date(2024, 6, 1)]
+    assert sum(p["count"] for p in history) == len(legacy) + 1
+    assert drift == {}
+
+
+def test_rebuild_replaces_buckets_in_place_and_drops_stale_ones():
+    user = "rollups-rebuild@demo.com"
+    records = [{**r, "user_email": user} for r in RECORDS if r["record_date"]]
+    gone = {"income": 50, "savings": 5, "record_date": datetime(2023, 7, 4), "user_email": user}
+
+    async def scenario():
+        await financial_collection.delete_many({"user_email": user})
+        await financial_rollups_collection.delete_many({"user_email": user})
+        try:
+            await financial_collection.insert_many([dict(r) for r in records] + [dict(gone)])
+            await rebuild_user_rollups(user)
+            before = {d["_id"] async for d in financial_rollups_collection.find({"user_email": user, "bucket_start": {"$gte": datetime(2024, 1, 1)}})}
+            # Un registro borrado sin pasar por las rollups deja sus buckets obsoletos.
+            await financial_collection.delete_many({"user_email": user, "record_date": gone["record_date"]})
+            await rebuild_user_rollups(user)
+            after = {d["_id"] async for d in financial_rollups_collection.find({"user_email": user})}
+            return before, after, await verify_user_rollups(user)
+        finally:
+            await financial_collection.delete_many({"user_email": user})
+            await financial_rollups_collection.delete_many({"user_email": user})
+
+    before, after, drift = asyncio.run(scenario())
+    # Los buckets vigentes se reemplazan en su sitio (mismo _id); los de julio de 2023 desaparecen.
+    assert before <= after and len(after) == len(before)
+    assert drift == {}
@@ -0,0 +1,55 @@
+import numpy as np
+from app.services.scenario_engine import TABLE_COLUMNS, scenario_grid, scenario_table, simulate_scenarios
+
+BASELINE = {"avg_income": 3000.0, "avg_expenses": 2000.0, "avg_savings": 500.0}
+
+
+def scalar_scenario(baseline, delta_income, delta_expenses, delta_savings):
+    """
+    La evaluación de un escenario como la hacía /ai/scenario, escalar.
+    """
+    avg_income, avg_expenses, avg_savings = baseline["avg_income"], baseline["avg_expenses"], baseline["avg_savings"]
+    income = max(avg_income + delta_income, 0)
+    expenses = max(avg_expenses + delta_expenses, 0)
+    savings = max(income - expenses + delta_savings, 0)
+    slope = (savings - avg_savings) / max(avg_savings, 1)
+    return {
+        "income": income,
+        "expenses": expenses,
+        "savings": savings,
+        "change_income": (income - avg_income) / avg_income * 100 if avg_income else 0,
+        "change_expenses": (expenses - avg_expenses) / avg_expenses * 100 if avg_expenses else 0,
+        "change_savings": (savings - avg_savings) / avg_savings * 100 if avg_savings else 0,
+        "trend": "positiva" if slope >= 0 else "negativa",
+        "impact_level": "alto" if abs(slope) > 0.3 else "moderado" if abs(slope) > 0.1 else "bajo",
+    }
+
+
+def test_grid_matches_scalar_evaluation():
+    grid = scenario_grid([-500, 0, 250], [-300, 0, 1500], [0, 100])
+    assert len(grid[0]) == 18
+
+    results = simulate_scenarios(BASELINE, *grid)
+    for i in range(18):
+        expected = scalar_scenario(BASELINE, grid[0][i], grid[1][i], grid[2][i])
+        for name, value in expected.items():
+            actual = results[name][i]
+            assert actual == value if isinstance(value, str) else np.isclose(actual, value), (i, name)
+
+
+def test_zero_averages_do_not_divide():
+    results = simulate_scenarios({"avg_income": 0.0, "avg_expenses": 0.0, "avg_savings": 0.0}, [100.0], [50.0], [0.0])
+    assert results["change_income"][0] == 0 and results["change_savings"][0] == 0
+    assert results["trend"][0] == "positiva"
+
+
+def test_table_is_compact():
+    table = scenario_table(simulate_scenarios(BASELINE, [0.0, 1000.0], 0.0, 0.0))
+    assert table["columns"] == list(TABLE_COLUMNS)
+    assert table["rows"][1][:6] == [1000.0, 0.0, 0.0, 4000.0, 2000.0, 2000.0]
+    assert table["rows"][1][-2:] == ["positiva", "alto"]
+
+
+def test_empty_grid_axis_means_no_change():
+    income, expenses, savings = scenario_grid([100, 200], None, [])
+    assert income.tolist() == [100, 200] and expenses.tolist() == [0, 0] and savings.tolist() == [0, 0]
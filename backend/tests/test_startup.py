@@ -0,0 +1,88 @@
+import asyncio
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from fastapi.testclient import TestClient
+import app.main as main
+from app.services.warmup_service import WarmupState, run_warmup
+
+# Dependencias que solo deben cargarse bajo demanda (calentamiento o primer uso).
+LAZY_MODULES = ("google.generativeai", "sklearn")
+
+
+def import_profile(module: str):
+    """
+    Importa `module` en un proceso limpio con `-X importtime` y devuelve el
+    tiempo propio (µs) de cada módulo importado, junto con la salida del código.
+    """
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    code = f"import {module}, app.utils.db as db; print(db._client is None)"
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, check=True, env=env)
+    self_us = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        self_us[name.strip()] = int(own)
+    return self_us, out.stdout.strip()
+
+
+def test_import_time_profile():
+    self_us, client_built = import_profile("app.main")
+
+    by_package = defaultdict(int)
+    for name, us in self_us.items():
+        by_package[name.split(".")[0] if not name.startswith("app.") else name] += us
+    total = sum(self_us.values())
+    print(f"\n[IMPORT] app.main: {total / 1000:.1f} ms en {len(self_us)} módulos")
+    for name, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:15]:
+        print(f"  {us / 1000:8.1f} ms  {us / total:6.1%}  {name}")
+
+    assert not [m for m in self_us if any(m == lazy or m.startswith(lazy + ".") for lazy in LAZY_MODULES)]
+    # Sin GEMINI_API_KEY la app importa igual y el cliente Mongo no se crea al importar.
+    assert client_built == "True"
+
+
+def test_warmup_retries_required_steps_and_tolerates_optional_ones():
+    calls = defaultdict(int)
+
+    async def flaky():
+        calls["flaky"] += 1
+        if calls["flaky"] == 1:
+            raise RuntimeError("mongo no disponible")
+
+    async def broken():
+        calls["broken"] += 1
+        raise RuntimeError("sin clave")
+
+    async def done():
+        calls["done"] += 1
+
+    state = WarmupState()
+    steps = [("done", done, True), ("flaky", flaky, True), ("broken", broken, False)]
+    asyncio.run(run_warmup(state, retry_seconds=0, steps=steps))
+
+    assert state.ready and state.attempts == 2
+    # Los pasos completados no se repiten; el opcional fallido no retiene la disponibilidad.
+    assert calls == {"done": 1, "flaky": 2, "broken": 1}
+    assert state.steps["broken"] == {"ok": False, "required": False, "error": "sin clave"}
+    assert state.report()["status"] == "ready"
+
+
+def test_ready_is_503_until_warmup_finishes(monkeypatch):
+    async def never_finishes(state, retry_seconds):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(main, "run_warmup", never_finishes)
+    monkeypatch.setattr(main.settings, "ai_jobs_enabled", False)
+
+    with TestClient(main.app) as client:
+        assert client.get("/health").status_code == 200
+        res = client.get("/ready")
+        assert res.status_code == 503 and res.json()["status"] == "warming_up"
+
+        main.app.state.warmup.mark_ready()
+        res = client.get("/ready")
+        assert res.status_code == 200 and res.json()["status"] == "ready"
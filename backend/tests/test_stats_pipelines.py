@@ -0,0 +1,90 @@
+import asyncio
+import math
+from datetime import datetime
+import numpy as np
+import pytest
+from app.services.aggregates_service import compute_aggregates, find_drift, risk_statistics, scenario_baseline
+from app.services.columnar import FinancialColumns, column_totals
+from app.services.stats_pipelines import pipeline_aggregates, risk_stats, scenario_stats, summary_totals
+from app.utils.db import financial_collection
+
+USER = "pipelines-parity@demo.com"
+
+RECORDS = [
+    {"income": 2500.0, "expenses": 1000.0, "savings": 500.0, "record_date": datetime(2024, 1, 1)},
+    {"income": 3100.5, "expenses": 1800.25, "savings": 700.0, "record_date": datetime(2024, 2, 1)},
+    {"income": 0, "expenses": 300, "savings": -50, "record_date": datetime(2024, 3, 1)},
+    {"income": 1900, "savings": 120.75, "record_date": datetime(2023, 12, 1)},
+    {"income": "2000", "expenses": 900, "savings": 350, "record_date": datetime(2024, 4, 1)},
+    {"income": True, "expenses": None, "savings": 10},
+    {"expenses": 45.5, "record_date": datetime(2024, 5, 1)},
+]
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    async def seed():
+        await financial_collection.delete_many({"user_email": USER})
+        await financial_collection.insert_many([{**r, "user_email": USER} for r in RECORDS])
+
+    asyncio.run(seed())
+    yield
+    asyncio.run(financial_collection.delete_many({"user_email": USER}))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# Filas con el ingreso "2000" ya convertido, para las versiones con comprensiones.
+NUMERIC_ROWS = [{**r, "income": float(r["income"])} if isinstance(r.get("income"), str) else r for r in RECORDS]
+
+
+def _valid(row, *fields):
+    return all(isinstance(row.get(f), (int, float)) and not isinstance(row.get(f), bool) for f in fields)
+
+
+def legacy_scenario(rows):
+    valid_rows = [r for r in rows if _valid(r, "income", "expenses", "savings")]
+    return {f"avg_{f}": sum(r[f] for r in valid_rows) / len(valid_rows) for f in ("income", "expenses", "savings")}
+
+
+def legacy_risk(rows):
+    valid_rows = [r for r in rows if _valid(r, "income", "savings") and r["income"] > 0]
+    return {
+        "avg_save_ratio": float(np.mean([r["savings"] / r["income"] for r in valid_rows])),
+        "volatility": float(np.std([r["savings"] for r in valid_rows])),
+    }
+
+
+def assert_close(actual, expected):
+    for key, value in expected.items():
+        assert math.isclose(actual[key], value, rel_tol=1e-9, abs_tol=1e-9), key
+
+
+def test_aggregates_pipeline_matches_python(seeded):
+    assert find_drift(run(pipeline_aggregates(USER)), compute_aggregates(RECORDS)) == {}
+
+
+def test_scenario_pipeline_matches_python(seeded):
+    stats = run(scenario_stats(USER))
+    assert_close(stats, scenario_baseline(compute_aggregates(RECORDS)))
+    assert_close(stats, legacy_scenario(NUMERIC_ROWS))
+    assert stats["valid_records"] == 4 and stats["total_records"] == len(RECORDS)
+
+
+def test_risk_pipeline_matches_python(seeded):
+    stats = run(risk_stats(USER))
+    assert_close(stats, risk_statistics(compute_aggregates(RECORDS)))
+    assert_close(stats, legacy_risk(NUMERIC_ROWS))
+    assert stats["valid_records"] == 4
+
+
+def test_summary_totals_match_columns(seeded):
+    assert_close(run(summary_totals(USER)), column_totals(FinancialColumns.from_records(RECORDS)))
+
+
+def test_unknown_user_gets_empty_stats():
+    assert run(scenario_stats("nobody@demo.com"))["total_records"] == 0
+    assert run(risk_stats("nobody@demo.com"))["volatility"] == 0
+    assert run(pipeline_aggregates("nobody@demo.com")) == {"count": 0, "first_date": None, "last_date": None}
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from app.services.trend_engine import prefix_savings_trends, fit_trend, score_users
+
+
+def reference_trend(values):
+    x = np.arange(len(values)).reshape(-1, 1)
+    model = LinearRegression().fit(x, np.array(values))
+    next_value = float(model.predict([[len(values) + 1]])[0])
+    return {
+        "next_savings_estimate": round(next_value, 2),
+        "trend": "positiva" if model.coef_[0] > 0 else "negativa",
+        "slope": round(model.coef_[0], 2),
+    }
+
+
+def test_prefix_trends_match_per_prefix_regression():
+    rng = np.random.default_rng(7)
+    savings = rng.normal(400, 150, size=120).round(2).tolist()
+
+    preds = prefix_savings_trends(savings)
+
+    assert len(preds) == len(savings) - 1
+    for i, pred in enumerate(preds, start=2):
+        expected = reference_trend(savings[:i])
+        assert pred["trend"] == expected["trend"]
+        assert abs(pred["slope"] - expected["slope"]) <= 0.01
+        assert abs(pred["next_savings_estimate"] - expected["next_savings_estimate"]) <= 0.01
+
+
+def test_constant_series_is_not_positive():
+    preds = prefix_savings_trends([300.0] * 50)
+    assert all(p["trend"] == "negativa" and p["slope"] == 0 for p in preds)
+
+
+def test_short_series_returns_empty_history():
+    assert prefix_savings_trends([]) == []
+    assert prefix_savings_trends([100.0]) == []
+
+
+def test_fit_trend_matches_sklearn():
+    rng = np.random.default_rng(11)
+    savings = rng.normal(250, 90, size=48).tolist()
+    result, expected = fit_trend(savings), reference_trend(savings)
+    assert result["trend"] == expected["trend"]
+    assert abs(result["slope"] - expected["slope"]) <= 0.01
+    assert abs(result["next_savings_estimate"] - expected["next_savings_estimate"]) <= 0.01
+
+
+def test_batch_fit_handles_ragged_series():
+    series = {
+        "a@demo.com": [100.0, 120.0, 140.0, 160.0],
+        "b@demo.com": [500.0, 450.0],
+        "c@demo.com": [80.0],
+    }
+    scores = score_users(series)
+
+    assert scores["a@demo.com"] == fit_trend(series["a@demo.com"])
+    assert scores["b@demo.com"] == fit_trend(series["b@demo.com"])
+    assert "message" in scores["c@demo.com"]
+
+
+def test_trend_engine_does_not_import_sklearn():
+    code = "import sys, app.services.trend_engine; print('sklearn' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"